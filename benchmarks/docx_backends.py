@@ -0,0 +1,81 @@
+"""
+Benchmark of the NaiveDecisionParser .docx conversion backends (LibreOffice vs pure Python reader)
+
+Usage: python -m benchmarks.docx_backends [--input document.docx] [--sizes 1000 10000] [--repeat 3]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import sys
+
+# Run as a script (python benchmarks/docx_backends.py), the repo root is not on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import NaiveDecisionParser, iter_document_texts
+from benchmarks.synthetic import generate_decision_items, write_decision_docx
+
+
+def time_backend(input_path: str, backend: str, repeat: int) -> tuple[float, list[tuple[str, str]]]:
+	"""Times the parsing of a .docx with a given backend
+
+	:param input_path: Path of the .docx file (relative to the working directory)
+	:param backend: NaiveDecisionParser backend
+	:param repeat: Number of repetitions
+	:return: Best wall time (seconds) and the parsed (numbering, text) sequence
+	"""
+	best = float("inf")
+	texts: list[tuple[str, str]] = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		parser = NaiveDecisionParser(input_path=input_path, backend=backend)
+		best = min(best, time.perf_counter() - start)
+		texts = [(text.numbering, text.text.strip()) for text in iter_document_texts(doc_content=parser.doc_content)]
+	return best, texts
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument("--input", type=str, default=None, help="Real .docx document (default: synthetic ones)")
+	arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000], help="Synthetic document lines")
+	arg_parser.add_argument("--repeat", type=int, default=3)
+	args = arg_parser.parse_args()
+
+	has_libreoffice = shutil.which("libreoffice") is not None
+	if not has_libreoffice:
+		print("libreoffice not found, only the docx backend will be timed")
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		inputs: list[tuple[str, str]] = []
+		if args.input is not None:
+			shutil.copy(args.input, os.path.join(tmp_dir, "input.docx"))
+			inputs.append((os.path.basename(args.input), "input.docx"))
+		else:
+			for size in args.sizes:
+				write_decision_docx(path=os.path.join(tmp_dir, f"synthetic_{size}.docx"), items=generate_decision_items(n_lines=size))
+				inputs.append((f"synthetic {size} lines", f"synthetic_{size}.docx"))
+
+		# LibreOffice writes its .txt export into the working directory
+		cwd = os.getcwd()
+		os.chdir(tmp_dir)
+		try:
+			print(f"{'document':<32}{'docx (s)':>12}{'libreoffice (s)':>18}{'speedup':>10}{'same tree':>11}")
+			for name, input_path in inputs:
+				docx_time, docx_texts = time_backend(input_path=input_path, backend="docx", repeat=args.repeat)
+				if has_libreoffice:
+					libreoffice_time, libreoffice_texts = time_backend(
+						input_path=input_path, backend="libreoffice", repeat=args.repeat
+					)
+					print(
+						f"{name:<32}{docx_time:>12.3f}{libreoffice_time:>18.3f}"
+						f"{libreoffice_time / docx_time:>9.1f}x{str(docx_texts == libreoffice_texts):>11}"
+					)
+				else:
+					print(f"{name:<32}{docx_time:>12.3f}{'-':>18}{'-':>10}{'-':>11}")
+		finally:
+			os.chdir(cwd)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,123 @@
+"""
+Import time budget of the CLI commands that do not need the LLM (parse-doc, parse-transcript, report),
+ measured with python -X importtime on synthetic inputs: cumulative import time of the command process
+ and the heaviest top-level imports. A command fails its budget if it imports more than --budget milliseconds
+ or any LLM dependency (langchain, openai, sqlalchemy, dotenv).
+
+Usage: python -m benchmarks.import_time [--budget 400] [--repeats 5] [--commands parse-doc parse-transcript report]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Run as a script (python benchmarks/import_time.py), the repo root is not on the path
+REPO_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from parser import NaiveDecisionParser
+from benchmarks.synthetic import generate_decision_items, generate_transcript, render_decision_lines, write_decision_docx
+
+
+CLI_PATH: str = os.path.join(REPO_ROOT, "cli.py")
+
+# Top-level packages that only the match command may import
+FORBIDDEN_IMPORTS: tuple[str, ...] = (
+	"langchain", "langchain_core", "langchain_openai", "langchain_community", "openai", "sqlalchemy", "dotenv"
+)
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+	"""Parses the python -X importtime report
+
+	:param stderr: Standard error of the process
+	:return: (module, depth, cumulative microseconds) of every import, depth 0 for top-level imports
+	"""
+	imports: list[tuple[str, int, int]] = []
+	for line in stderr.splitlines():
+		if not line.startswith("import time:") or "cumulative" in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|")
+		depth = (len(name) - len(name.lstrip()) - 1) // 2
+		imports.append((name.strip(), depth, int(cumulative)))
+	return imports
+
+
+def write_inputs(tmp_dir: str) -> dict[str, list[str]]:
+	"""Writes the synthetic inputs of the commands
+
+	:param tmp_dir: Folder of the inputs
+	:return: Arguments of each command
+	"""
+	items = generate_decision_items(n_lines=500)
+	docx_path = os.path.join(tmp_dir, "decision.docx")
+	write_decision_docx(path=docx_path, items=items)
+	doc_content = NaiveDecisionParser.from_raw_doc_content(raw_doc_content=render_decision_lines(items=items)).doc_content
+	transcript_path = os.path.join(tmp_dir, "transcript.txt")
+	with open(transcript_path, "w", encoding="utf-8") as f:
+		for paragraph in generate_transcript(doc_content=doc_content, n_interventions=100):
+			f.write(f"{paragraph['participant']}  {paragraph['hour']}\n{paragraph['paragraph']}")
+		f.write("Transcribed by https://otter.ai\n")
+
+	# Minimal results export, so that the report does not need a matching run
+	export_dir = os.path.join(tmp_dir, "export")
+	subprocess.run(
+		[sys.executable, CLI_PATH, "parse-doc", docx_path, "--backend", "docx", "--cache-dir", tmp_dir,
+		 "--output", os.path.join(tmp_dir, "nodes.jsonl")],
+		check=True, capture_output=True
+	)
+	os.makedirs(export_dir, exist_ok=True)
+	os.replace(os.path.join(tmp_dir, "nodes.jsonl"), os.path.join(export_dir, "nodes.jsonl"))
+	with open(os.path.join(export_dir, "interventions.jsonl"), "w", encoding="utf-8") as f:
+		f.write('{"oid": 0, "hour": "00:00", "participant": "Chair", "paragraph": "Thank you.\\n", "cost": 0.0, "mentions": []}\n')
+	return {
+		"parse-doc": ["parse-doc", docx_path, "--backend", "docx", "--cache-dir", tmp_dir],
+		"parse-transcript": ["parse-transcript", transcript_path],
+		"report": ["report", export_dir, "--output", os.path.join(tmp_dir, "report.txt")],
+		"report --query": ["report", export_dir, "--query", "paragraph 1"]
+	}
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument("--budget", type=float, default=400, help="Import time budget of each command (ms)")
+	arg_parser.add_argument("--repeats", type=int, default=5, help="Runs of each command (the fastest is kept)")
+	arg_parser.add_argument(
+		"--commands", type=str, nargs="+", default=["parse-doc", "parse-transcript", "report", "report --query"]
+	)
+	arg_parser.add_argument("--top", type=int, default=5, help="Heaviest top-level imports shown")
+	args = arg_parser.parse_args()
+
+	failed = False
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		command_args = write_inputs(tmp_dir=tmp_dir)
+		print(f"{'command':>18}{'imports (ms)':>14}{'budget':>8}  heaviest top-level imports (ms)")
+		for command in args.commands:
+			runs = []
+			for _ in range(args.repeats):
+				process = subprocess.run(
+					[sys.executable, "-X", "importtime", CLI_PATH, *command_args[command]],
+					check=True, capture_output=True, text=True
+				)
+				runs.append(parse_importtime(stderr=process.stderr))
+			imports = min(runs, key=lambda run: sum(cumulative for _, depth, cumulative in run if depth == 0))
+			total = sum(cumulative for _, depth, cumulative in imports if depth == 0) / 1000
+			forbidden = sorted({
+				name.split(".")[0] for name, _, _ in imports if name.split(".")[0] in FORBIDDEN_IMPORTS
+			})
+			heaviest = sorted(
+				((name, cumulative) for name, depth, cumulative in imports if depth == 0), key=lambda x: -x[1]
+			)[:args.top]
+			ok = total <= args.budget and len(forbidden) == 0
+			failed |= not ok
+			print(
+				f"{command:>18}{total:>14.1f}{'ok' if ok else 'FAIL':>8}  "
+				+ ", ".join(f"{name} {cumulative / 1000:.1f}" for name, cumulative in heaviest)
+				+ (f" (forbidden: {', '.join(forbidden)})" if forbidden else "")
+			)
+	sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+	main()
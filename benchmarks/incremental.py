@@ -0,0 +1,149 @@
+"""
+Benchmark of the incremental re-matching of a transcript when a new revision of the decision document arrives,
+ with the offline FakeMentionTreeSearchEvaluator (no API calls nor credentials needed).
+The new revision modifies, inserts (renumbering the following paragraphs) and deletes some paragraphs.
+A full re-run and the incremental re-matching are compared, with and without a warm evaluations cache:
+ evaluator calls, evaluations saved, and the agreement of their mentions.
+
+Usage: python -m benchmarks.incremental [--size 2000] [--interventions 100] [--modified 5] [--inserted 1]
+ [--deleted 1] [--strategy exhaustive]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import sys
+
+# Run as a script (python benchmarks/incremental.py), the repo root is not on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import NaiveDecisionParser
+from pipeline import NegotiationDocumentToTranscriptMatching, Intervention
+from utils.document_diff import DocumentDiff
+from utils.evaluator_backends import FakeMentionTreeSearchEvaluator
+from utils.evaluator_cache import MentionTreeSearchEvaluatorCache
+from benchmarks.synthetic import WORDS, generate_decision_items, generate_transcript, render_decision_lines
+
+
+def revise_decision_items(
+		items: list[tuple[int, str]], n_modified: int, n_inserted: int, n_deleted: int, seed: int = 42
+	) -> list[tuple[int, str]]:
+	"""Generates a new revision of the items of a synthetic decision document
+
+	:param items: (list level, text) items of the document
+	:param n_modified: Number of paragraphs whose text is edited
+	:param n_inserted: Number of new paragraphs
+	:param n_deleted: Number of deleted paragraphs (without subparagraphs)
+	:param seed: Random seed
+	:return: (list level, text) items of the new revision
+	"""
+	rng = random.Random(seed)
+	items = list(items)
+	for _ in range(n_modified):
+		i = rng.choice([i for i, (level, _) in enumerate(items) if level == 5])
+		items[i] = (5, items[i][1].rstrip(";") + " " + " ".join(rng.choices(WORDS, k=3)) + ";")
+	for _ in range(n_inserted):
+		i = rng.choice([i for i, (level, _) in enumerate(items) if level == 5])
+		items.insert(i, (5, " ".join(rng.choices(WORDS, k=rng.randint(15, 60))).capitalize() + ";"))
+	for _ in range(n_deleted):
+		deletable = [
+			i for i, (level, _) in enumerate(items)
+			if level == 5 and (i + 1 == len(items) or items[i + 1][0] <= 5)
+		]
+		del items[rng.choice(deletable)]
+	return items
+
+
+def run_matching(
+		doc_content, transcript: list[dict], cache: MentionTreeSearchEvaluatorCache | None, **kwargs
+	) -> tuple[float, FakeMentionTreeSearchEvaluator, NegotiationDocumentToTranscriptMatching]:
+	"""Times the matching of a transcript
+
+	:param doc_content: Structured document content
+	:param transcript: Transcript paragraphs
+	:param cache: Evaluations cache
+	:param kwargs: Other NegotiationDocumentToTranscriptMatching parameters
+	:return: Wall time (seconds), the evaluator and the matching
+	"""
+	evaluator = FakeMentionTreeSearchEvaluator(seed=42)
+	matching = NegotiationDocumentToTranscriptMatching(
+		doc_content=doc_content, transcript=[Intervention(**paragraph) for paragraph in transcript],
+		evaluator=evaluator, cache=cache, **kwargs
+	)
+	start = time.perf_counter()
+	with contextlib.redirect_stdout(io.StringIO()):
+		matching()
+	return time.perf_counter() - start, evaluator, matching
+
+
+def get_mention_keys(matching: NegotiationDocumentToTranscriptMatching) -> set[tuple[int, int, str]]:
+	return {
+		(intervention.oid, mention.content.node_id, mention.mention_type)
+		for intervention in matching.transcript for mention in intervention.mentions
+	}
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument("--size", type=int, default=2_000, help="Document lines")
+	arg_parser.add_argument("--interventions", type=int, default=100)
+	arg_parser.add_argument("--modified", type=int, default=5, help="Paragraphs edited in the new revision")
+	arg_parser.add_argument("--inserted", type=int, default=1, help="Paragraphs inserted in the new revision")
+	arg_parser.add_argument("--deleted", type=int, default=1, help="Paragraphs deleted in the new revision")
+	arg_parser.add_argument(
+		"--strategy", type=str, default="exhaustive", choices=["exhaustive", "best_first", "beam"]
+	)
+	arg_parser.add_argument("--seed", type=int, default=42)
+	args = arg_parser.parse_args()
+
+	items = generate_decision_items(n_lines=args.size, seed=args.seed)
+	old_doc = NaiveDecisionParser.from_raw_doc_content(raw_doc_content=render_decision_lines(items=items)).doc_content
+	new_items = revise_decision_items(
+		items=items, n_modified=args.modified, n_inserted=args.inserted, n_deleted=args.deleted, seed=args.seed
+	)
+	new_doc = NaiveDecisionParser.from_raw_doc_content(raw_doc_content=render_decision_lines(items=new_items)).doc_content
+	transcript = generate_transcript(doc_content=old_doc, n_interventions=args.interventions, seed=args.seed)
+
+	start = time.perf_counter()
+	diff = DocumentDiff(old_doc_content=old_doc, new_doc_content=new_doc)
+	print(f"{diff.report()} ({1000 * (time.perf_counter() - start):.1f} ms)")
+
+	print(f"{'cache':>6}{'run':>13}{'wall (s)':>10}{'calls':>8}{'saved':>8}{'mentions':>10}{'agreement':>11}")
+	for cached in (False, True):
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			runs = {}
+			for run in ("full", "incremental"):
+				# Each run has its own cache, warmed by the matching against the previous revision
+				cache = MentionTreeSearchEvaluatorCache(
+					db_path=os.path.join(tmp_dir, f"{run}.sqlite")
+				) if cached else None
+				_, _, previous = run_matching(
+					doc_content=old_doc, transcript=transcript, cache=cache, search_strategy=args.strategy
+				)
+				incremental_kwargs = dict(
+					document_diff=diff,
+					previous_results={intervention.oid: intervention.to_record() for intervention in previous.transcript}
+				) if run == "incremental" else {}
+				runs[run] = run_matching(
+					doc_content=new_doc, transcript=transcript, cache=cache, search_strategy=args.strategy,
+					**incremental_kwargs
+				)
+				if cache is not None:
+					cache.engine.dispose()
+
+			full_mentions = get_mention_keys(matching=runs["full"][2])
+			full_calls = runs["full"][1].calls
+			for run, (wall_time, evaluator, matching) in runs.items():
+				mentions = get_mention_keys(matching=matching)
+				agreement = len(full_mentions & mentions) / max(1, len(full_mentions | mentions))
+				print(
+					f"{'warm' if cached else 'off':>6}{run:>13}{wall_time:>10.3f}{evaluator.calls:>8}"
+					f"{full_calls - evaluator.calls:>8}{len(mentions):>10}{agreement:>11.3f}"
+				)
+			print(f"{'':>6}{runs['incremental'][2].rematch_report()}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,143 @@
+"""
+Benchmark of the NaiveDecisionParser parsing of the raw document lines on synthetic decision documents,
+ against the previous implementation (two passes, per line pattern formatting and recursive parent resolution)
+
+Usage: python -m benchmarks.parser_structure [--sizes 10000 50000 100000] [--repeat 3]
+"""
+import argparse
+import re
+import sys
+import time
+import os
+
+# Run as a script (python benchmarks/parser_structure.py), the repo root is not on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import (
+	NaiveDecisionParser, NaiveDecisionParserDocument, NaiveDecisionParserText, NaiveDecisionParserTextLevel,
+	document_to_node_table
+)
+from benchmarks.synthetic import generate_decision_items, render_decision_lines
+
+
+class LegacyNaiveDecisionParser(NaiveDecisionParser):
+	"""Previous parsing implementation, kept as the benchmark baseline
+	"""
+
+	def _legacy_clean_raw_doc_content(self) -> list[str]:
+		clean_doc_content: list[str] = [
+			line for line in self.raw_doc_content if line.strip() != ""
+		]
+		pattern: str = (
+			rf"^("
+			rf"{self.heading_numbering_pattern}|"
+			rf"{self.subheading_numbering_pattern}|"
+			rf"{self.subsubheading_numbering_pattern}|"
+			rf"{self.subsubsubheading_numbering_pattern}|"
+			rf"{self.paragraph_numbering_pattern}|"
+			rf"{self.subparagraph_numbering_pattern}|"
+			rf"{self.subsubparagraph_numbering_pattern}|"
+			rf"{self.subsubsubparagraph_numbering_pattern}"
+			rf")\s"
+		)
+		return [line for line in clean_doc_content if re.match(pattern, line.lstrip())]
+
+	def _legacy_get_parent_text(self, prev_text, text_level):
+		if prev_text is not None:
+			if prev_text.level.value < text_level.value:
+				return prev_text
+			elif prev_text.level.value == text_level.value:
+				return prev_text.parent
+			elif prev_text.level.value > text_level.value:
+				return self._legacy_get_parent_text(prev_text=prev_text.parent, text_level=text_level)
+		return None
+
+	def _legacy_structure_clean_doc_content(self) -> NaiveDecisionParserDocument:
+		structured_doc_content: NaiveDecisionParserDocument = []
+		prev_text: NaiveDecisionParserText | None = None
+		for line in self.clean_doc_content:
+			text_level = NaiveDecisionParserTextLevel(self.get_text_level(line=line))
+			match = re.match(
+				rf"^(?:{self.get_numbering_pattern_from_text_level(level=text_level)})(.*)$",
+				line.strip()
+			)
+			if match is None:
+				raise RuntimeError(f"Failed to match line: {line}")
+			current_text = NaiveDecisionParserText(
+				level=text_level,
+				parent=self._legacy_get_parent_text(prev_text=prev_text, text_level=text_level),
+				numbering=match.group(1),
+				text=match.group(2)
+			)
+			if current_text.parent is None:
+				structured_doc_content.append(current_text)
+			else:
+				current_text.parent.children.append(current_text)
+			prev_text = current_text
+		return structured_doc_content
+
+	def _parse(self) -> None:
+		self.clean_doc_content = self._legacy_clean_raw_doc_content()
+		self.doc_content = self._legacy_structure_clean_doc_content()
+
+
+def time_call(function) -> float:
+	"""Wall time (seconds) of a call
+	"""
+	start = time.perf_counter()
+	function()
+	return time.perf_counter() - start
+
+
+def time_parser(parser_class: type[NaiveDecisionParser], lines: list[str], repeat: int) -> tuple[float, NaiveDecisionParser]:
+	"""Times the parsing of the raw document lines
+
+	:param parser_class: Parser class
+	:param lines: Raw document lines
+	:param repeat: Number of repetitions
+	:return: Best wall time (seconds) and the last parser
+	"""
+	best = float("inf")
+	parser = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		parser = parser_class.from_raw_doc_content(raw_doc_content=lines)
+		best = min(best, time.perf_counter() - start)
+	return best, parser
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 100_000], help="Document lines")
+	arg_parser.add_argument("--repeat", type=int, default=3)
+	args = arg_parser.parse_args()
+
+	# The legacy parent resolution is recursive
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 10_000))
+
+	# "legacy" cleans and structures the lines into the pydantic tree,
+	# "parse" is the current single pass cleaning and structuring of the lines into the node table rows,
+	# "total" is the current full parse, also building the node table, its rendered contexts and the document objects
+	print(
+		f"{'lines':>10}{'legacy (s)':>12}{'parse (s)':>11}{'speedup':>9}"
+		f"{'total (s)':>11}{'speedup':>9}{'same tree':>11}"
+	)
+	for size in args.sizes:
+		lines = render_decision_lines(items=generate_decision_items(n_lines=size))
+		legacy_time, legacy_parser = time_parser(parser_class=LegacyNaiveDecisionParser, lines=lines, repeat=args.repeat)
+		current_time, current_parser = time_parser(parser_class=NaiveDecisionParser, lines=lines, repeat=args.repeat)
+		parse_time = min(
+			time_call(lambda: current_parser._parse_raw_doc_content(raw_doc_content=lines)) for _ in range(args.repeat)
+		)
+		same_tree = (
+			legacy_parser.clean_doc_content == current_parser.clean_doc_content
+			and document_to_node_table(legacy_parser.doc_content) == document_to_node_table(current_parser.doc_content)
+		)
+		print(
+			f"{size:>10}{legacy_time:>12.3f}{parse_time:>11.3f}{legacy_time / parse_time:>8.1f}x"
+			f"{current_time:>11.3f}{legacy_time / current_time:>8.1f}x{str(same_tree):>11}"
+		)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,216 @@
+"""Synthetic decision documents used by the benchmarks"""
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+from parser import NaiveDecisionParserDocument, NaiveDecisionParserTextLevel, iter_document_texts
+from utils.docx_reader import DocxNumberingLevel
+
+
+# (numFmt, lvlText, lvlRestart) of each list level, following the NaiveDecisionParser levels
+DECISION_LIST_LEVELS: list[tuple[str, str, int | None]] = [
+	("upperRoman", "%1.", None),  # Heading
+	("upperLetter", "%2.", None),  # Subheading
+	("decimal", "%3.", None),  # Subsubheading
+	("lowerLetter", "(%4)", None),  # Subsubsubheading
+	("none", "", None),  # Subsubsubsubheading
+	("decimal", "%6.", 0),  # Paragraph (continuous numbering)
+	("lowerLetter", "(%7)", None),  # Subparagraph
+	("lowerRoman", "(%8)", None),  # Subsubparagraph
+	("lowerLetter", "%9.", None),  # Subsubsubparagraph
+]
+
+WORDS: list[str] = (
+	"cooperative approaches internationally transferred mitigation outcomes corresponding adjustments "
+	"authorization registry reporting annual information tables technical expert review capacity building "
+	"first transfer emissions balance inconsistencies secretariat parties decision guidance article paragraph "
+	"request invites notes recalls urges encourages agreed electronic format confidential information"
+).split()
+
+
+def generate_decision_items(n_lines: int, seed: int = 42) -> list[tuple[int, str]]:
+	"""Generates the (list level, text) items of a synthetic decision document
+
+	:param n_lines: Approximate number of numbered lines
+	:param seed: Random seed
+	:return: (ilvl, text) of each numbered line
+	"""
+	rng = random.Random(seed)
+	items: list[tuple[int, str]] = []
+	while len(items) < n_lines:
+		items.append((0, " ".join(rng.choices(WORDS, k=rng.randint(2, 5))).capitalize()))
+		for _ in range(rng.randint(1, 3)):
+			items.append((1, " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).capitalize()))
+			for _ in range(rng.randint(3, 12)):
+				items.append((5, " ".join(rng.choices(WORDS, k=rng.randint(15, 60))).capitalize() + ";"))
+				if rng.random() < 0.4:
+					for _ in range(rng.randint(2, 5)):
+						items.append((6, " ".join(rng.choices(WORDS, k=rng.randint(8, 30))) + ";"))
+						if rng.random() < 0.2:
+							for _ in range(rng.randint(2, 3)):
+								items.append((7, " ".join(rng.choices(WORDS, k=rng.randint(5, 20))) + ";"))
+	return items[:n_lines]
+
+
+PARTICIPANTS: list[str] = ["Chair", "European Union", "AOSIS", "LMDC", "AGN", "Brazil", "Japan", "Switzerland"]
+
+PROCEDURAL_INTERVENTIONS: list[str] = [
+	"Thank you chair, we can go along with the proposal and look forward to the next session.",
+	"I give the floor to the next speaker on my list.",
+	"We would like to reserve our right to come back to this later.",
+	"Can we take a short break and reconvene in ten minutes?",
+]
+
+# Sentences of the long group statements, without any document word
+STATEMENT_SENTENCES: list[str] = [
+	"Our group attaches great importance to a balanced and ambitious outcome at this session.",
+	"We thank the co-facilitators for their hard work and their tireless efforts.",
+	"Let me recall that trust among us is the foundation of this process.",
+	"Many of our members face severe constraints and we must not leave anyone behind.",
+	"We stand ready to engage constructively with all colleagues in the coming days.",
+	"It is essential that the text reflects the views expressed in the room.",
+	"We remain flexible, however some elements remain crucial for our delegation.",
+	"Time is short and we need to make progress before the end of the week.",
+]
+
+
+def generate_transcript(
+		doc_content: NaiveDecisionParserDocument, n_interventions: int, seed: int = 42,
+		reference_rate: float = 0.2, paraphrase_rate: float = 0.5, duplicate_rate: float = 0.0,
+		long_rate: float = 0.0
+	) -> list[dict]:
+	"""Generates the paragraphs of a synthetic transcript of the negotiation of a document,
+	 as returned by TranscriptParser
+
+	:param doc_content: Structured document content
+	:param n_interventions: Number of interventions
+	:param seed: Random seed
+	:param reference_rate: Fraction of interventions explicitly referencing a paragraph number
+	:param paraphrase_rate: Fraction of interventions paraphrasing a paragraph (without its number),
+	 the rest are procedural
+	:param duplicate_rate: Fraction of interventions repeating an earlier one (with a different opening)
+	:param long_rate: Fraction of interventions that are long group statements (hundreds to thousands of words)
+	 touching on a few paragraphs
+	:return: Transcript paragraphs (oid, participant, hour, paragraph)
+	"""
+	rng = random.Random(seed)
+	paragraphs = [
+		text for text in iter_document_texts(doc_content=doc_content)
+		if text.level == NaiveDecisionParserTextLevel.Paragraph
+	]
+	transcript: list[dict] = []
+	for oid in range(n_interventions):
+		if duplicate_rate > 0 and len(transcript) != 0 and rng.random() < duplicate_rate:
+			text = "As we said before, " + rng.choice(transcript)["paragraph"].strip()
+			transcript.append({
+				"oid": oid, "participant": rng.choice(PARTICIPANTS),
+				"hour": f"{oid // 60:02d}:{oid % 60:02d}", "paragraph": text + "\n"
+			})
+			continue
+		if long_rate > 0 and len(paragraphs) != 0 and rng.random() < long_rate:
+			sentences = [rng.choice(STATEMENT_SENTENCES) for _ in range(rng.randint(30, 120))]
+			for _ in range(rng.randint(1, 3)):
+				words = rng.choice(paragraphs).text.split()
+				quote = " ".join(rng.sample(words, k=min(len(words), rng.randint(4, 10)))).rstrip(";")
+				sentences.insert(rng.randrange(len(sentences) + 1), f"We have concerns about {quote} and ask for more clarity.")
+			transcript.append({
+				"oid": oid, "participant": rng.choice(PARTICIPANTS),
+				"hour": f"{oid // 60:02d}:{oid % 60:02d}", "paragraph": " ".join(sentences) + "\n"
+			})
+			continue
+		draw = rng.random()
+		if len(paragraphs) != 0 and draw < reference_rate + paraphrase_rate:
+			paragraph = rng.choice(paragraphs)
+			words = paragraph.text.split()
+			quote = " ".join(rng.sample(words, k=min(len(words), rng.randint(4, 10)))).rstrip(";")
+			if draw < reference_rate:
+				text = f"On paragraph {paragraph.numbering.rstrip('.')}, we propose to delete {quote}."
+			else:
+				text = f"We have concerns about {quote} and ask for more clarity."
+		else:
+			text = rng.choice(PROCEDURAL_INTERVENTIONS)
+		transcript.append({
+			"oid": oid, "participant": rng.choice(PARTICIPANTS),
+			"hour": f"{oid // 60:02d}:{oid % 60:02d}", "paragraph": text + "\n"
+		})
+	return transcript
+
+
+def render_decision_lines(items: list[tuple[int, str]]) -> list[str]:
+	"""Renders synthetic decision items as the LibreOffice .txt export does
+
+	:param items: (ilvl, text) of each numbered line
+	:return: Raw string list representation of the document
+	"""
+	levels = [
+		DocxNumberingLevel(num_fmt=num_fmt, lvl_text=lvl_text, lvl_restart=lvl_restart)
+		for num_fmt, lvl_text, lvl_restart in DECISION_LIST_LEVELS
+	]
+	counters: dict[int, int] = {}
+	lines: list[str] = ["Draft decision -/CMA.6\n", "\n"]
+	for ilvl, text in items:
+		counters[ilvl] = counters.get(ilvl, 0) + 1
+		for deeper_ilvl in [_ilvl for _ilvl in counters if _ilvl > ilvl]:
+			if levels[deeper_ilvl].restarts_after(ilvl=ilvl):
+				del counters[deeper_ilvl]
+		label = levels[ilvl].lvl_text.replace(f"%{ilvl + 1}", levels[ilvl].format(counters[ilvl]))
+		lines.append(f"{'    ' * (ilvl + 1)}{label}\t{text}\n")
+	return lines
+
+
+def write_decision_docx(path: str, items: list[tuple[int, str]]) -> None:
+	"""Writes synthetic decision items as a minimal .docx with a multilevel list
+
+	:param path: Output .docx path
+	:param items: (ilvl, text) of each numbered line
+	"""
+	w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+	levels_xml = "".join(
+		f'<w:lvl w:ilvl="{ilvl}"><w:start w:val="1"/><w:numFmt w:val="{num_fmt}"/>'
+		+ (f'<w:lvlRestart w:val="{lvl_restart}"/>' if lvl_restart is not None else "")
+		+ f'<w:lvlText w:val="{lvl_text}"/></w:lvl>'
+		for ilvl, (num_fmt, lvl_text, lvl_restart) in enumerate(DECISION_LIST_LEVELS)
+	)
+	numbering_xml = (
+		f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:numbering {w}>'
+		f'<w:abstractNum w:abstractNumId="0">{levels_xml}</w:abstractNum>'
+		'<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>'
+	)
+	paragraphs_xml = '<w:p><w:r><w:t>Draft decision -/CMA.6</w:t></w:r></w:p><w:p/>' + "".join(
+		f'<w:p><w:pPr><w:numPr><w:ilvl w:val="{ilvl}"/><w:numId w:val="1"/></w:numPr></w:pPr>'
+		f'<w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+		for ilvl, text in items
+	)
+	document_xml = (
+		f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {w}>'
+		f'<w:body>{paragraphs_xml}</w:body></w:document>'
+	)
+	content_types_xml = (
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+		'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+		'<Default Extension="xml" ContentType="application/xml"/>'
+		'<Override PartName="/word/document.xml" '
+		'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+		'<Override PartName="/word/numbering.xml" '
+		'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+		'</Types>'
+	)
+	rels_xml = (
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+		'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+		'Target="word/document.xml"/></Relationships>'
+	)
+	document_rels_xml = (
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+		'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" '
+		'Target="numbering.xml"/></Relationships>'
+	)
+	with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as docx:
+		docx.writestr("[Content_Types].xml", content_types_xml)
+		docx.writestr("_rels/.rels", rels_xml)
+		docx.writestr("word/_rels/document.xml.rels", document_rels_xml)
+		docx.writestr("word/document.xml", document_xml)
+		docx.writestr("word/numbering.xml", numbering_xml)
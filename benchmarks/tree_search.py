@@ -0,0 +1,188 @@
+"""
+Benchmark of the mention tree search on synthetic decision documents and transcripts,
+ with the offline FakeMentionTreeSearchEvaluator (no API calls nor credentials needed).
+Wall time, evaluator calls and (estimated) tokens per intervention are reported,
+ and optionally appended to a JSONL file tagged with the git revision to track them across versions.
+
+Usage: python -m benchmarks.tree_search [--sizes 500 2000] [--interventions 100] [--modes sync async]
+ [--strategies exhaustive best_first beam] [--beam-width 8] [--max-calls N] [--max-tokens N]
+ [--packing off on] [--pack-max-tokens 6000] [--prefilter off on] [--duplicate-rate 0.0]
+ [--windowing off on] [--window-tokens 256] [--long-rate 0.0] [--semantic off on] [--semantic-top-k 10]
+ [--latency 0.0] [--jitter 0.0] [--rate-limit-rate 0.0] [--rpm N] [--tpm N]
+ [--output benchmarks/tree_search_results.jsonl]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import subprocess
+import tempfile
+import time
+import os
+import sys
+
+# Run as a script (python benchmarks/tree_search.py), the repo root is not on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import NaiveDecisionParser
+from pipeline import NegotiationDocumentToTranscriptMatching, Intervention
+from utils.evaluator_backends import FakeMentionTreeSearchEvaluator
+from utils.rate_limiter import AdaptiveRateLimiter
+from utils.intervention_filter import InterventionFilter
+from utils.intervention_windows import InterventionWindower
+from utils.vector_store import DocumentVectorStore, HashingEmbedder
+from benchmarks.synthetic import generate_decision_items, generate_transcript, render_decision_lines
+
+
+def get_revision() -> str:
+	"""Git revision of the benchmarked code
+
+	:return: Short commit hash (with a "-dirty" suffix if there are uncommitted changes), "unknown" outside git
+	"""
+	try:
+		revision = subprocess.run(
+			["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		revision = "unknown"
+	return revision
+
+
+def run_matching(
+		doc_content, transcript: list[dict], mode: str, evaluator: FakeMentionTreeSearchEvaluator, **kwargs
+	) -> tuple[float, NegotiationDocumentToTranscriptMatching]:
+	"""Times the matching of a transcript
+
+	:param doc_content: Structured document content
+	:param transcript: Transcript paragraphs
+	:param mode: "sync" or "async"
+	:param evaluator: Fake evaluator
+	:param kwargs: Other NegotiationDocumentToTranscriptMatching parameters (search strategy, budgets...)
+	:return: Wall time (seconds) and the matching
+	"""
+	matching = NegotiationDocumentToTranscriptMatching(
+		doc_content=doc_content, transcript=[Intervention(**paragraph) for paragraph in transcript],
+		asynchronous=mode == "async", evaluator=evaluator, **kwargs
+	)
+	start = time.perf_counter()
+	with contextlib.redirect_stdout(io.StringIO()):
+		matching()
+	return time.perf_counter() - start, matching
+
+
+def main():
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2_000], help="Document lines")
+	arg_parser.add_argument("--interventions", type=int, default=100)
+	arg_parser.add_argument("--modes", type=str, nargs="+", default=["sync", "async"], choices=["sync", "async"])
+	arg_parser.add_argument(
+		"--strategies", type=str, nargs="+", default=["exhaustive"], choices=["exhaustive", "best_first", "beam"]
+	)
+	arg_parser.add_argument("--beam-width", type=int, default=8)
+	arg_parser.add_argument("--max-calls", type=int, default=None, help="Evaluations budget of each intervention")
+	arg_parser.add_argument("--max-tokens", type=int, default=None, help="Prompt tokens budget of each intervention")
+	arg_parser.add_argument(
+		"--packing", type=str, nargs="+", default=["off"], choices=["off", "on"],
+		help="Whether the document texts of each level are evaluated in packs"
+	)
+	arg_parser.add_argument("--pack-max-tokens", type=int, default=6_000)
+	arg_parser.add_argument(
+		"--prefilter", type=str, nargs="+", default=["off"], choices=["off", "on"],
+		help="Whether procedural and near-duplicate interventions are filtered before matching"
+	)
+	arg_parser.add_argument(
+		"--duplicate-rate", type=float, default=0.0, help="Fraction of synthetic interventions repeating an earlier one"
+	)
+	arg_parser.add_argument(
+		"--windowing", type=str, nargs="+", default=["off"], choices=["off", "on"],
+		help="Whether long interventions are split into sentence windows (only the relevant ones sent per prompt)"
+	)
+	arg_parser.add_argument("--window-tokens", type=int, default=256, help="Maximum tokens of a window")
+	arg_parser.add_argument(
+		"--long-rate", type=float, default=0.0, help="Fraction of synthetic interventions that are long group statements"
+	)
+	arg_parser.add_argument(
+		"--semantic", type=str, nargs="+", default=["off"], choices=["off", "on"],
+		help="Whether the tree search starts from the texts most similar to the intervention (hashing embeddings)"
+	)
+	arg_parser.add_argument("--semantic-top-k", type=int, default=10, help="Most similar texts seeding the search")
+	arg_parser.add_argument("--latency", type=float, default=0.0, help="Simulated evaluator latency (seconds)")
+	arg_parser.add_argument("--jitter", type=float, default=0.0, help="Simulated evaluator latency jitter (seconds)")
+	arg_parser.add_argument(
+		"--rate-limit-rate", type=float, default=0.0, help="Simulated evaluator rate limit errors (HTTP 429) probability"
+	)
+	arg_parser.add_argument("--rpm", type=float, default=None, help="Rate limiter requests per minute")
+	arg_parser.add_argument("--tpm", type=float, default=None, help="Rate limiter tokens per minute")
+	arg_parser.add_argument("--seed", type=int, default=42)
+	arg_parser.add_argument("--output", type=str, default=None, help="JSONL file where the results are appended")
+	args = arg_parser.parse_args()
+
+	revision = get_revision()
+	print(
+		f"{'lines':>8}{'interv.':>9}{'strategy':>12}{'packed':>8}{'filter':>8}{'window':>8}{'semantic':>10}{'mode':>7}{'wall (s)':>10}{'ms/interv.':>12}"
+		f"{'calls/interv.':>15}{'tokens/interv.':>16}{'mentions':>10}"
+	)
+	for size in args.sizes:
+		lines = render_decision_lines(items=generate_decision_items(n_lines=size, seed=args.seed))
+		doc_content = NaiveDecisionParser.from_raw_doc_content(raw_doc_content=lines).doc_content
+		transcript = generate_transcript(
+			doc_content=doc_content, n_interventions=args.interventions, seed=args.seed,
+			duplicate_rate=args.duplicate_rate, long_rate=args.long_rate
+		)
+		vector_store_dir = tempfile.TemporaryDirectory()
+		for strategy, packing, prefilter, windowing, semantic, mode in itertools.product(
+				args.strategies, args.packing, args.prefilter, args.windowing, args.semantic, args.modes
+			):
+			evaluator = FakeMentionTreeSearchEvaluator(
+				seed=args.seed, latency=args.latency, jitter=args.jitter, rate_limit_rate=args.rate_limit_rate
+			)
+			# Rate limit errors can only be recovered from with the rate limiter retries
+			rate_limiter = AdaptiveRateLimiter(
+				requests_per_minute=args.rpm, tokens_per_minute=args.tpm, seed=args.seed
+			) if args.rpm is not None or args.tpm is not None or args.rate_limit_rate > 0 else None
+			intervention_filter = InterventionFilter() if prefilter == "on" else None
+			intervention_windower = InterventionWindower(max_tokens=args.window_tokens) if windowing == "on" else None
+			vector_store = DocumentVectorStore.load_or_build(
+				node_table=doc_content[0].node_table, embed=HashingEmbedder(), cache_dir=vector_store_dir.name
+			) if semantic == "on" else None
+			wall_time, matching = run_matching(
+				doc_content=doc_content, transcript=transcript, mode=mode, evaluator=evaluator,
+				search_strategy=strategy, beam_width=args.beam_width,
+				max_calls=args.max_calls, max_tokens=args.max_tokens, rate_limiter=rate_limiter,
+				packed=packing == "on", pack_max_tokens=args.pack_max_tokens, intervention_filter=intervention_filter,
+				intervention_windower=intervention_windower, vector_store=vector_store, semantic_top_k=args.semantic_top_k
+			)
+			n_mentions = sum(len(intervention.mentions) for intervention in matching.transcript)
+			result = {
+				"revision": revision, "timestamp": time.time(),
+				"lines": size, "interventions": args.interventions, "mode": mode,
+				"strategy": strategy, "beam_width": args.beam_width,
+				"packed": packing == "on", "pack_max_tokens": args.pack_max_tokens,
+				"prefilter": prefilter == "on", "duplicate_rate": args.duplicate_rate,
+				"filtered": (
+					intervention_filter.counts["procedural"] + intervention_filter.counts["duplicate"]
+					if intervention_filter is not None else 0
+				),
+				"windowing": windowing == "on", "window_tokens": args.window_tokens, "long_rate": args.long_rate,
+				"windowed": intervention_windower.n_windowed if intervention_windower is not None else 0,
+				"semantic": semantic == "on", "semantic_top_k": args.semantic_top_k,
+				"max_calls": args.max_calls, "max_tokens": args.max_tokens,
+				"latency": args.latency, "jitter": args.jitter, "seed": args.seed,
+				"rate_limit_rate": args.rate_limit_rate, "rpm": args.rpm, "tpm": args.tpm,
+				"wall_time": wall_time, "calls": evaluator.calls, "rate_limited": evaluator.rate_limited,
+				"prompt_tokens": evaluator.prompt_tokens, "completion_tokens": evaluator.completion_tokens,
+				"mentions": n_mentions
+			}
+			print(
+				f"{size:>8}{args.interventions:>9}{strategy:>12}{packing:>8}{prefilter:>8}{windowing:>8}{semantic:>10}{mode:>7}{wall_time:>10.3f}"
+				f"{1000 * wall_time / args.interventions:>12.2f}{evaluator.calls / args.interventions:>15.1f}"
+				f"{(evaluator.prompt_tokens + evaluator.completion_tokens) / args.interventions:>16.0f}{n_mentions:>10}"
+			)
+			if args.output is not None:
+				with open(args.output, "a", encoding="utf-8") as f:
+					f.write(json.dumps(result) + "\n")
+		vector_store_dir.cleanup()
+
+if __name__ == "__main__":
+	main()
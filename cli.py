@@ -0,0 +1,314 @@
+"""
+Command line interface of the negotiation document to transcript matching:
+ - parse-doc: parses a decision document (through the parsed documents cache) into its node table
+ - parse-transcript: parses a transcript into its interventions
+ - match: matches a transcript against a document (LLM tree search), writing the results export
+   (synchronous, without evaluations cache, journal nor rate limiter unless --async, --cache, --journal, --rate-limit)
+ - report: writes the human readable report of a results export, or queries the mentions of a document text
+Each command only imports what it needs: parse-doc, parse-transcript and report never load the LLM
+ dependencies (langchain, openai) nor the credentials (see benchmarks/import_time.py for their import budget).
+
+Usage: python cli.py {parse-doc,parse-transcript,match,report} [-h] ...
+"""
+import os
+import sys
+import json
+import argparse
+
+
+def parse_doc(args: argparse.Namespace) -> None:
+	from parser import NaiveDecisionParserTextLevel, document_to_node_table
+	from utils.document_cache import ParsedDocumentCache
+
+	cache = ParsedDocumentCache(cache_dir=args.cache_dir) if args.cache_dir is not None else ParsedDocumentCache()
+	doc_content = cache.load_or_parse(input_path=args.input, backend=args.backend)
+	rows = document_to_node_table(doc_content=doc_content)
+	if args.output is not None:
+		with open(args.output, "w", encoding="utf-8") as f:
+			for node_id, (level, parent, numbering, text) in enumerate(rows):
+				f.write(json.dumps(
+					{"node_id": node_id, "level": level, "parent": parent, "numbering": numbering, "text": text},
+					ensure_ascii=False
+				) + "\n")
+
+	level_names = {level.value: level.name for level in NaiveDecisionParserTextLevel}
+	counts: dict[str, int] = {}
+	for level, _, _, _ in rows:
+		counts[level_names[level]] = counts.get(level_names[level], 0) + 1
+	print(f"{args.input}: {len(rows)} texts ({', '.join(f'{count} {name}' for name, count in counts.items())})")
+
+
+def parse_transcript(args: argparse.Namespace) -> None:
+	from utils.transcript_parser import TranscriptParser
+
+	parser = TranscriptParser(
+		input_file=os.path.basename(args.input), folder_name=os.path.dirname(args.input), input_folder="",
+		streaming=True
+	)
+	n_interventions, participants = 0, set()
+	with open(args.output, "w", encoding="utf-8") if args.output is not None else open(os.devnull, "w") as f:
+		for paragraph in parser.iter_paragraphs():
+			f.write(json.dumps(paragraph, ensure_ascii=False) + "\n")
+			n_interventions += 1
+			participants.add(paragraph["participant"])
+	print(f"{args.input}: {n_interventions} interventions by {len(participants)} participants")
+
+
+def match(args: argparse.Namespace) -> None:
+	from pipeline import NegotiationDocumentToTranscriptMatching, Intervention
+	from utils.transcript_parser import TranscriptParser
+	from utils.document_cache import ParsedDocumentCache
+	from utils.evaluator_cache import MentionTreeSearchEvaluatorCache
+	from utils.lexical_index import LexicalRelevanceIndex
+	from utils.results_journal import MatchingJournal
+	from utils.rate_limiter import AdaptiveRateLimiter
+	from utils.intervention_filter import InterventionFilter
+	from utils.intervention_windows import InterventionWindower
+	from utils.vector_store import DocumentVectorStore, HashingEmbedder
+	from utils.results_export import MatchingResultsWriter, MatchingResultsReader
+	from utils.document_diff import DocumentDiff
+	from utils.metrics import METRICS
+
+	if args.metrics is not None:
+		METRICS.enable()
+	shard_index, shard_count = map(int, args.shard.split("/")) if args.shard is not None else (0, 1)
+	export_dir, report_path = args.export, args.report
+	if args.shard is not None:
+		# Concurrent shards must not overwrite each other's export and report
+		report_root, report_extension = os.path.splitext(args.report)
+		export_dir = f"{args.export}-shard{shard_index}of{shard_count}"
+		report_path = f"{report_root}-shard{shard_index}of{shard_count}{report_extension}"
+
+	document_cache = ParsedDocumentCache(cache_dir=args.cache_dir) if args.cache_dir is not None else ParsedDocumentCache()
+	negotiation_document = document_cache.load_or_parse(input_path=args.document, backend=args.backend)
+	if len(negotiation_document) == 0:
+		raise ValueError("Document to be processed is empty")
+
+	document_diff, previous_results = None, None
+	if args.previous_export is not None:
+		previous_export = MatchingResultsReader(export_dir=args.previous_export)
+		document_diff = DocumentDiff(
+			old_doc_content=previous_export.load_node_table().doc_content, new_doc_content=negotiation_document
+		)
+		previous_results = {record["oid"]: record for record in previous_export.iter_interventions()}
+		print(document_diff.report())
+
+	parser = TranscriptParser(
+		input_file=os.path.basename(args.transcript), folder_name=os.path.dirname(args.transcript), input_folder="",
+		streaming=True
+	)
+	interventions = (
+		Intervention(**intervention_dict)
+		for intervention_dict in parser.iter_paragraphs(follow=args.follow, idle_timeout=args.idle_timeout)
+		if intervention_dict["oid"] % shard_count == shard_index
+	)
+
+	x = NegotiationDocumentToTranscriptMatching(
+		doc_content=negotiation_document, transcript=interventions,
+		asynchronous=args.asynchronous, max_concurrency=args.max_concurrency,
+		cache=MentionTreeSearchEvaluatorCache(db_path=args.cache) if args.cache is not None else None,
+		reference_fast_path=args.reference_fast_path, search_strategy=args.strategy,
+		lexical_index=LexicalRelevanceIndex(
+			doc_content=negotiation_document, top_k=args.lexical_top_k, recall_safety=0.9
+		) if args.lexical_top_k is not None else None,
+		journal=MatchingJournal(path=args.journal) if args.journal is not None else None, resume=args.resume,
+		rate_limiter=AdaptiveRateLimiter(
+			requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_concurrency=args.max_concurrency
+		) if args.rate_limit else None,
+		packed=args.packed,
+		intervention_filter=InterventionFilter(audit_log_path=args.prefilter_audit) if args.prefilter else None,
+		document_diff=document_diff, previous_results=previous_results,
+		intervention_windower=InterventionWindower(max_tokens=args.window_tokens) if args.window_tokens else None,
+		vector_store=DocumentVectorStore.load_or_build(
+			node_table=negotiation_document[0].node_table, embed=HashingEmbedder(), cache_dir=document_cache.cache_dir
+		) if args.semantic_top_k is not None else None,
+		**({"semantic_top_k": args.semantic_top_k} if args.semantic_top_k is not None else {}),
+		semantic_min_score=args.semantic_min_score
+	)
+	with MatchingResultsWriter(output_dir=export_dir, node_table=x.node_table, columnar=args.columnar) as writer:
+		x.results_writer = writer
+		x()
+	MatchingResultsReader(export_dir=export_dir).write_text_report(path=report_path)
+
+	print("#"*42)
+	print(x.total_cost)
+	if x.cache is not None:
+		print(f"Cache hits: {x.cache.hits}, misses: {x.cache.misses}")
+	if x.lexical_index is not None:
+		print(x.lexical_index.report())
+	if x.rate_limiter is not None:
+		print(x.rate_limiter.report())
+	if x.intervention_filter is not None:
+		print(x.intervention_filter.report())
+	if x.document_diff is not None:
+		print(x.rematch_report())
+	if x.intervention_windower is not None:
+		print(x.intervention_windower.report())
+	if args.metrics is not None:
+		METRICS.write(path_prefix=args.metrics)
+
+
+def report(args: argparse.Namespace) -> None:
+	if args.query is None:
+		from utils.results_export import MatchingResultsReader
+
+		MatchingResultsReader(export_dir=args.export[0]).write_text_report(path=args.output)
+		print(f"Report written to {args.output}")
+		return
+
+	from utils.results_index import MatchingResultsIndex
+
+	index = MatchingResultsIndex.from_exports(export_dirs=args.export)
+	mentions = index.query(
+		target=args.query, participants=args.participants, start=args.start, end=args.end,
+		mention_types=args.mention_types
+	)
+	for mention in mentions:
+		print(
+			f"[{mention.session} {mention.hour}] {mention.participant} ~[{mention.mention_type}]~> "
+			f"{' '.join(mention.numbering_path)}: {mention.textual_reference}"
+		)
+	summary = index.summary(target=args.query, participants=args.participants, start=args.start, end=args.end)
+	print(f"{len(mentions)} mentions of {args.query}: {json.dumps(summary)}")
+
+
+def get_arg_parser() -> argparse.ArgumentParser:
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+	parse_doc_parser = subparsers.add_parser("parse-doc", help="Parse a decision document into its node table")
+	parse_doc_parser.add_argument("input", type=str, help="Decision document .docx")
+	parse_doc_parser.add_argument("--backend", type=str, default="libreoffice", choices=["libreoffice", "docx"])
+	parse_doc_parser.add_argument("--cache-dir", type=str, default=None, help="Folder of the parsed documents cache")
+	parse_doc_parser.add_argument("--output", type=str, default=None, help="JSONL node table (as nodes.jsonl)")
+	parse_doc_parser.set_defaults(handler=parse_doc)
+
+	parse_transcript_parser = subparsers.add_parser("parse-transcript", help="Parse a transcript into its interventions")
+	parse_transcript_parser.add_argument("input", type=str, help="otter.ai transcript .txt")
+	parse_transcript_parser.add_argument("--output", type=str, default=None, help="JSONL interventions")
+	parse_transcript_parser.set_defaults(handler=parse_transcript)
+
+	match_parser = subparsers.add_parser("match", help="Match a transcript against a document")
+	match_parser.add_argument(
+		"--document", type=str, default="Art_6.2_CMA_15a_DD_Party Inputs.docx", help="Decision document .docx"
+	)
+	match_parser.add_argument("--backend", type=str, default="libreoffice", choices=["libreoffice", "docx"])
+	match_parser.add_argument(
+		"--transcript", type=str, default=os.path.join(".", "data", "input", "A62 IC 3.txt"), help="otter.ai transcript .txt"
+	)
+	match_parser.add_argument("--cache-dir", type=str, default=None, help="Folder of the parsed documents cache")
+	match_parser.add_argument(
+		"--follow", action="store_true",
+		help="Keep reading the transcript as it grows (live sessions), until --idle-timeout seconds without new lines"
+	)
+	match_parser.add_argument(
+		"--idle-timeout", type=float, default=None, help="With --follow, stop after N seconds without new lines"
+	)
+	match_parser.add_argument("--journal", type=str, default=None, help="JSONL results journal (off by default)")
+	match_parser.add_argument(
+		"--resume", action="store_true",
+		help="Skip the interventions already in the --journal, carrying over their cost"
+	)
+	match_parser.add_argument(
+		"--shard", type=str, default=None,
+		help="INDEX/COUNT, only match the interventions with oid %% COUNT == INDEX (to split a session across processes),"
+		" the export and report paths are suffixed with -shardINDEXofCOUNT"
+	)
+	match_parser.add_argument(
+		"--packed", action="store_true", help="Evaluate the document texts of each level in packs (fewer, larger LLM calls)"
+	)
+	match_parser.add_argument(
+		"--async", dest="asynchronous", action="store_true",
+		help="Run the tree searches of several interventions concurrently (see --max-concurrency)"
+	)
+	match_parser.add_argument("--max-concurrency", type=int, default=8, help="In-flight evaluator calls (with --async)")
+	match_parser.add_argument(
+		"--rate-limit", action="store_true",
+		help="Adapt the evaluator calls to the --rpm and --tpm limits, backing off on rate limit errors"
+	)
+	match_parser.add_argument("--rpm", type=float, default=500, help="Evaluator requests per minute limit")
+	match_parser.add_argument("--tpm", type=float, default=200_000, help="Evaluator tokens per minute limit")
+	match_parser.add_argument(
+		"--cache", type=str, default=None, help="SQLite evaluations cache, e.g. mention_tree_search_cache.sqlite (off by default)"
+	)
+	match_parser.add_argument(
+		"--strategy", type=str, default="exhaustive", choices=["exhaustive", "best_first", "beam"]
+	)
+	match_parser.add_argument(
+		"--reference-fast-path", type=str, default="off", choices=["off", "prune", "exclusive"],
+		help="Resolve explicit numbering references (e.g. \"paragraph 29\") into DIRECT mentions without LLM calls"
+	)
+	match_parser.add_argument(
+		"--prefilter", action="store_true",
+		help="Skip procedural interventions and reuse the mentions of near-duplicate ones (see --prefilter-audit)"
+	)
+	match_parser.add_argument(
+		"--prefilter-audit", type=str, default="prefilter_audit.jsonl", help="JSONL audit log of the pre-filter decisions"
+	)
+	match_parser.add_argument(
+		"--export", type=str, default="matching_results",
+		help="Folder of the results export (document node table and interventions JSONL)"
+	)
+	match_parser.add_argument(
+		"--columnar", type=str, default="off", choices=["off", "npz", "parquet"],
+		help="Columnar files also written to the results export"
+	)
+	match_parser.add_argument("--report", type=str, default="test.txt", help="Human readable report, built from the export")
+	match_parser.add_argument(
+		"--previous-export", type=str, default=None,
+		help="Results export of a previous revision of the document, only its changed subtrees are matched again"
+	)
+	match_parser.add_argument(
+		"--lexical-top-k", type=int, default=None,
+		help="Only evaluate the N most lexically relevant (BM25) candidates of each tree search level, plus the ones "
+		"needed to keep 90%% of the relevance mass (lossy, off by default)"
+	)
+	match_parser.add_argument(
+		"--window-tokens", type=int, default=None,
+		help="Split long interventions into sentence windows of up to N tokens, sending each document text only its "
+		"most relevant windows (off by default)"
+	)
+	match_parser.add_argument(
+		"--semantic-top-k", type=int, default=None,
+		help="Seed each tree search with its N most similar document texts (hashing embeddings stored next to the "
+		"parsed documents cache, off by default)"
+	)
+	match_parser.add_argument(
+		"--semantic-min-score", type=float, default=0.2,
+		help="With --semantic-top-k, interventions whose most similar document text scores below this cosine "
+		"similarity get the full search instead"
+	)
+	match_parser.add_argument(
+		"--metrics", type=str, default=None,
+		help="Output path (without extension) of the pipeline metrics, written as PATH.json and PATH.prom"
+	)
+	match_parser.set_defaults(handler=match)
+
+	report_parser = subparsers.add_parser("report", help="Report or query saved matching results")
+	report_parser.add_argument(
+		"export", type=str, nargs="+", help="Results export folder(s), one per session (several only with --query)"
+	)
+	report_parser.add_argument("--output", type=str, default="test.txt", help="Human readable report")
+	report_parser.add_argument(
+		"--query", type=str, default=None,
+		help="Instead of the report, list the mentions of a document text, e.g. \"paragraph 29(c)\" or \"section II.B\""
+	)
+	report_parser.add_argument("--participants", type=str, nargs="+", default=None)
+	report_parser.add_argument("--start", type=str, default=None, help="First timestamp, e.g. 00:10:00")
+	report_parser.add_argument("--end", type=str, default=None, help="Last timestamp")
+	report_parser.add_argument("--mention-types", type=str, nargs="+", default=None, choices=["DIRECT", "INDIRECT"])
+	report_parser.set_defaults(handler=report)
+	return arg_parser
+
+
+def main(argv: list[str] | None = None) -> None:
+	args = get_arg_parser().parse_args(argv if argv is not None else sys.argv[1:])
+	if args.command == "report" and args.query is None and len(args.export) != 1:
+		get_arg_parser().error("report: a single export is reported at a time (several only with --query)")
+	if args.command == "match" and args.resume and args.journal is None:
+		get_arg_parser().error("match: --resume needs the --journal of the interrupted run")
+	args.handler(args)
+
+
+if __name__ == "__main__":
+	main()
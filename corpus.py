@@ -0,0 +1,363 @@
+"""
+Corpus mode: matches all the documents and transcripts of a manifest (e.g. a whole COP) in one run.
+ 1. Every distinct document (NaiveDecisionParser, through the parsed documents cache) and transcript
+ (TranscriptParser) is parsed in a process pool. Each worker converts with its own LibreOffice user profile
+ and output folder, since a running LibreOffice locks its profile and concurrent conversions would collide.
+ 2. All the sessions are matched concurrently in one event loop, sharing a single rate limiter
+ (one requests/tokens budget and in-flight limit for the whole corpus) and a single evaluations cache.
+ 3. Each session is written to its own results export, OUTPUT_DIR/NAME/TRANSCRIPT (see MatchingResultsWriter),
+ and the throughput of both stages is reported per core.
+
+The manifest is a JSON list of entries, whose paths are relative to the manifest folder:
+ [{"name": "art_6_2", "document": "Art_6.2.docx", "transcripts": ["A62 IC 3.txt", "A62 IC 4.txt"]}, ...]
+ ("transcript" may be given instead of "transcripts", and "backend" overrides --backend)
+
+Optionally, the workers also embed the texts of each document (--semantic-top-k, see DocumentVectorStore),
+ stored next to the parsed documents cache and memory-mapped read-only by every process that uses them.
+
+Usage: python corpus.py MANIFEST [--output-dir corpus_results] [--workers N] [--backend libreoffice]
+ [--evaluator openai] [--rpm 500] [--tpm 200000] [--max-concurrency 32] [--lexical-top-k N] [--semantic-top-k N]
+"""
+import os
+import json
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal
+from pydantic import BaseModel, model_validator
+
+from parser import (
+	NaiveDecisionParserDocument, NaiveDecisionParserNodeTable, document_to_node_table, document_from_node_table
+)
+from pipeline import NegotiationDocumentToTranscriptMatching, Intervention
+from utils.transcript_parser import TranscriptParser
+from utils.document_cache import ParsedDocumentCache
+from utils.evaluator_cache import MentionTreeSearchEvaluatorCache
+from utils.lexical_index import LexicalRelevanceIndex
+from utils.rate_limiter import AdaptiveRateLimiter
+from utils.results_export import MatchingResultsWriter
+from utils.evaluator_backends import FakeMentionTreeSearchEvaluator
+from utils.vector_store import DocumentVectorStore, EmbeddingFunction, HashingEmbedder
+
+
+class CorpusEntry(BaseModel):
+	name: str
+	document: str
+	transcripts: list[str]
+	backend: Literal["libreoffice", "docx"] | None = None
+
+	@model_validator(mode="before")
+	@classmethod
+	def _single_transcript(cls, data: dict) -> dict:
+		if isinstance(data, dict) and "transcript" in data and "transcripts" not in data:
+			data = {**data, "transcripts": [data["transcript"]]}
+		return data
+
+
+def load_corpus_manifest(path: str) -> list[CorpusEntry]:
+	"""Loads a corpus manifest, resolving its paths relative to the manifest folder
+
+	:param path: Path of the JSON manifest
+	:raises ValueError: If two sessions have the same results export folder (same name and transcript file name)
+	:return: Entries of the manifest
+	"""
+	root = os.path.dirname(os.path.abspath(path))
+	with open(path, "r", encoding="utf-8") as f:
+		entries = [CorpusEntry(**entry) for entry in json.load(f)]
+	sessions: set[tuple[str, str]] = set()
+	for entry in entries:
+		entry.document = os.path.join(root, entry.document)
+		entry.transcripts = [os.path.join(root, transcript) for transcript in entry.transcripts]
+		for transcript in entry.transcripts:
+			session = (entry.name, get_session_name(transcript=transcript))
+			if session in sessions:
+				raise ValueError(f"Several sessions of the manifest would be exported to {os.path.join(*session)}")
+			sessions.add(session)
+	return entries
+
+
+def get_document_key(entry: CorpusEntry, backend: Literal["libreoffice", "docx"]) -> tuple[str, str]:
+	"""Key of the parsed document of an entry, as the same document may be parsed with several backends
+
+	:param entry: Entry of the manifest
+	:param backend: NaiveDecisionParser backend of the entries that do not override it
+	:return: Document path and backend
+	"""
+	return entry.document, entry.backend or backend
+
+
+# Per worker process state, set by _init_parse_worker
+_worker_profile: str | None = None
+_worker_output_dir: str | None = None
+
+
+def _init_parse_worker(workers_dir: str, slots) -> None:
+	"""Initializes a parsing worker with its own LibreOffice profile and output folder
+	 (numbered by slot rather than pid, so that the profiles are reused across runs)
+
+	:param workers_dir: Folder of the worker folders
+	:param slots: Shared counter of the started workers
+	"""
+	global _worker_profile, _worker_output_dir
+	with slots.get_lock():
+		slot = slots.value
+		slots.value += 1
+	_worker_profile = os.path.join(workers_dir, f"worker-{slot}", "profile")
+	_worker_output_dir = os.path.join(workers_dir, f"worker-{slot}", "txt")
+	os.makedirs(_worker_profile, exist_ok=True)
+	os.makedirs(_worker_output_dir, exist_ok=True)
+
+
+def _get_cpu_time() -> float:
+	"""CPU time of the process and its waited for children (e.g. LibreOffice conversions)
+	"""
+	times = os.times()
+	return times.user + times.system + times.children_user + times.children_system
+
+
+def _parse_document(
+		input_path: str, backend: Literal["libreoffice", "docx"], cache_dir: str, embed: EmbeddingFunction | None = None
+	) -> tuple[list[tuple[int, int, str, str]], DocumentVectorStore | None, float, float]:
+	"""Parses (and optionally embeds) a document in a worker
+
+	:param input_path: Path of the .docx file
+	:param backend: NaiveDecisionParser backend
+	:param cache_dir: Folder of the parsed documents cache (and of the vector stores)
+	:param embed: Embedding function of the document texts (None not to embed them)
+	:return: Node table rows (picklable, unlike the structured document), vector store (pickled by path),
+	 wall and CPU time (seconds)
+	"""
+	start, start_cpu = time.perf_counter(), _get_cpu_time()
+	doc_content = ParsedDocumentCache(cache_dir=cache_dir).load_or_parse(
+		input_path=input_path, backend=backend, output_dir=_worker_output_dir, libreoffice_profile=_worker_profile
+	)
+	rows = document_to_node_table(doc_content=doc_content)
+	vector_store = DocumentVectorStore.load_or_build(
+		node_table=NaiveDecisionParserNodeTable(rows=rows), embed=embed, cache_dir=cache_dir
+	) if embed is not None else None
+	return rows, vector_store, time.perf_counter() - start, _get_cpu_time() - start_cpu
+
+
+def _parse_transcript(input_path: str) -> tuple[list[dict], float, float]:
+	"""Parses a transcript in a worker
+
+	:param input_path: Path of the .txt file
+	:return: Transcript paragraphs, wall and CPU time (seconds)
+	"""
+	start, start_cpu = time.perf_counter(), _get_cpu_time()
+	paragraphs = TranscriptParser(
+		input_file=os.path.basename(input_path), folder_name=os.path.dirname(input_path), input_folder=""
+	)()
+	return paragraphs, time.perf_counter() - start, _get_cpu_time() - start_cpu
+
+
+class CorpusParseStats(BaseModel):
+	workers: int
+	n_documents: int = 0
+	n_transcripts: int = 0
+	n_interventions: int = 0
+	wall_time: float = 0.0
+	# Sum of the wall and CPU times of every parsing task
+	task_time: float = 0.0
+	cpu_time: float = 0.0
+
+
+def parse_corpus(
+		entries: list[CorpusEntry], workers: int, backend: Literal["libreoffice", "docx"] = "libreoffice",
+		cache_dir: str = os.path.join(".", "data", "cache", "documents"),
+		workers_dir: str = os.path.join(".", "data", "cache", "corpus_workers"), embed: EmbeddingFunction | None = None
+	) -> tuple[
+		dict[tuple[str, str], NaiveDecisionParserDocument], dict[tuple[str, str], DocumentVectorStore],
+		dict[str, list[dict]], CorpusParseStats
+	]:
+	"""Parses (and optionally embeds) every distinct document and transcript of a corpus in a process pool
+
+	:param entries: Entries of the manifest
+	:param workers: Number of worker processes
+	:param backend: NaiveDecisionParser backend of the entries that do not override it
+	:param cache_dir: Folder of the parsed documents cache
+	:param workers_dir: Folder of the LibreOffice profiles and .txt exports of the workers
+	:param embed: Embedding function of the document texts (None not to embed them)
+	:return: Structured documents and vector stores (if embedded) by document key (see get_document_key),
+	 transcript paragraphs by path, and the parsing stats
+	"""
+	documents = list(dict.fromkeys(get_document_key(entry=entry, backend=backend) for entry in entries))
+	transcripts = list(dict.fromkeys(transcript for entry in entries for transcript in entry.transcripts))
+	stats = CorpusParseStats(workers=workers, n_documents=len(documents), n_transcripts=len(transcripts))
+
+	start = time.perf_counter()
+	slots = multiprocessing.Value("i", 0)
+	with ProcessPoolExecutor(
+			max_workers=workers, initializer=_init_parse_worker, initargs=(workers_dir, slots)
+		) as executor:
+		# Documents first, as their conversions are the longest tasks
+		document_futures = {
+			(path, document_backend): executor.submit(_parse_document, path, document_backend, cache_dir, embed)
+			for path, document_backend in documents
+		}
+		transcript_futures = {path: executor.submit(_parse_transcript, path) for path in transcripts}
+
+		doc_contents: dict[tuple[str, str], NaiveDecisionParserDocument] = {}
+		vector_stores: dict[tuple[str, str], DocumentVectorStore] = {}
+		for key, future in document_futures.items():
+			rows, vector_store, task_time, cpu_time = future.result()
+			doc_contents[key] = document_from_node_table(node_table=rows)
+			if vector_store is not None:
+				vector_stores[key] = vector_store
+			stats.task_time += task_time
+			stats.cpu_time += cpu_time
+		paragraphs: dict[str, list[dict]] = {}
+		for path, future in transcript_futures.items():
+			paragraphs[path], task_time, cpu_time = future.result()
+			stats.n_interventions += len(paragraphs[path])
+			stats.task_time += task_time
+			stats.cpu_time += cpu_time
+	stats.wall_time = time.perf_counter() - start
+	return doc_contents, vector_stores, paragraphs, stats
+
+
+def get_session_name(transcript: str) -> str:
+	"""Session name of a transcript (its file name without extension), also the folder of its export
+	"""
+	return os.path.splitext(os.path.basename(transcript))[0]
+
+
+async def amatch_corpus(
+		entries: list[CorpusEntry], doc_contents: dict[tuple[str, str], NaiveDecisionParserDocument],
+		paragraphs: dict[str, list[dict]], output_dir: str, rate_limiter: AdaptiveRateLimiter,
+		cache: MentionTreeSearchEvaluatorCache | None = None, evaluator=None, lexical_top_k: int | None = None,
+		vector_stores: dict[tuple[str, str], DocumentVectorStore] | None = None,
+		backend: Literal["libreoffice", "docx"] = "libreoffice", **kwargs
+	) -> list[NegotiationDocumentToTranscriptMatching]:
+	"""Matches all the sessions of a corpus concurrently, through one shared rate limiter and evaluations cache
+
+	:param entries: Entries of the manifest
+	:param doc_contents: Structured documents by document key (see get_document_key)
+	:param paragraphs: Transcript paragraphs by path
+	:param output_dir: Folder of the results exports, one per session (OUTPUT_DIR/NAME/SESSION)
+	:param rate_limiter: Rate limiter shared by all the sessions
+	:param cache: Evaluations cache shared by all the sessions
+	:param evaluator: Mention tree search evaluator (None for the OpenAI model)
+	:param lexical_top_k: Top candidates of the lexical relevance index of each document (None for no index)
+	:param vector_stores: Embeddings of the documents by document key, seeding the tree searches
+	 (None for full searches)
+	:param backend: NaiveDecisionParser backend of the entries that do not override it (as in parse_corpus)
+	:param kwargs: Other NegotiationDocumentToTranscriptMatching parameters (search strategy, budgets...)
+	:return: Matching of each session, in manifest order
+	"""
+	lexical_indexes: dict[tuple[str, str], LexicalRelevanceIndex | None] = {
+		key: LexicalRelevanceIndex(doc_content=doc_content, top_k=lexical_top_k, recall_safety=0.9)
+		if lexical_top_k is not None else None
+		for key, doc_content in doc_contents.items()
+	}
+	matchings: list[NegotiationDocumentToTranscriptMatching] = []
+	writers: list[MatchingResultsWriter] = []
+	for entry in entries:
+		document_key = get_document_key(entry=entry, backend=backend)
+		for transcript in entry.transcripts:
+			matching = NegotiationDocumentToTranscriptMatching(
+				doc_content=doc_contents[document_key],
+				transcript=[Intervention(**paragraph) for paragraph in paragraphs[transcript]],
+				asynchronous=True, cache=cache, lexical_index=lexical_indexes[document_key],
+				evaluator=evaluator, rate_limiter=rate_limiter,
+				vector_store=vector_stores.get(document_key) if vector_stores is not None else None,
+				verbose=False, **kwargs
+			)
+			matching.results_writer = MatchingResultsWriter(
+				output_dir=os.path.join(output_dir, entry.name, get_session_name(transcript=transcript)),
+				node_table=matching.node_table
+			)
+			matchings.append(matching)
+			writers.append(matching.results_writer)
+	try:
+		await asyncio.gather(*(matching.acall() for matching in matchings))
+	finally:
+		for writer in writers:
+			writer.close()
+	return matchings
+
+
+def main():
+	import argparse
+
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument("manifest", type=str, help="JSON manifest pairing the documents with their transcripts")
+	arg_parser.add_argument("--output-dir", type=str, default="corpus_results", help="Folder of the results exports")
+	arg_parser.add_argument(
+		"--workers", type=int, default=os.cpu_count() or 1, help="Parsing worker processes (default: one per core)"
+	)
+	arg_parser.add_argument("--backend", type=str, default="libreoffice", choices=["libreoffice", "docx"])
+	arg_parser.add_argument(
+		"--evaluator", type=str, default="openai", choices=["openai", "fake"],
+		help="OpenAI model, or the offline FakeMentionTreeSearchEvaluator (no API calls)"
+	)
+	arg_parser.add_argument("--rpm", type=float, default=500, help="Evaluator requests per minute limit of the corpus")
+	arg_parser.add_argument("--tpm", type=float, default=200_000, help="Evaluator tokens per minute limit of the corpus")
+	arg_parser.add_argument("--max-concurrency", type=int, default=32, help="In-flight evaluator calls of the corpus")
+	arg_parser.add_argument(
+		"--cache", type=str, default="mention_tree_search_cache.sqlite", help="Evaluations cache (\"off\" to disable)"
+	)
+	arg_parser.add_argument(
+		"--strategy", type=str, default="exhaustive", choices=["exhaustive", "best_first", "beam"]
+	)
+	arg_parser.add_argument(
+		"--reference-fast-path", type=str, default="off", choices=["off", "prune", "exclusive"],
+		help="Resolve explicit numbering references (e.g. \"paragraph 29\") into DIRECT mentions without LLM calls"
+	)
+	arg_parser.add_argument(
+		"--lexical-top-k", type=int, default=None,
+		help="Only evaluate the N most lexically relevant (BM25) candidates of each tree search level, plus the ones "
+		"needed to keep 90%% of the relevance mass (lossy, off by default)"
+	)
+	arg_parser.add_argument(
+		"--semantic-top-k", type=int, default=None,
+		help="Seed each tree search with its N most similar document texts (hashing embeddings, off by default)"
+	)
+	args = arg_parser.parse_args()
+
+	entries = load_corpus_manifest(path=args.manifest)
+	doc_contents, vector_stores, paragraphs, parse_stats = parse_corpus(
+		entries=entries, workers=args.workers, backend=args.backend,
+		embed=HashingEmbedder() if args.semantic_top_k is not None else None
+	)
+
+	rate_limiter = AdaptiveRateLimiter(
+		requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_concurrency=args.max_concurrency
+	)
+	cache = MentionTreeSearchEvaluatorCache(db_path=args.cache) if args.cache != "off" else None
+	start, start_cpu = time.perf_counter(), time.process_time()
+	matchings = asyncio.run(amatch_corpus(
+		entries=entries, doc_contents=doc_contents, paragraphs=paragraphs, output_dir=args.output_dir,
+		rate_limiter=rate_limiter, cache=cache, lexical_top_k=args.lexical_top_k,
+		evaluator=FakeMentionTreeSearchEvaluator(seed=42) if args.evaluator == "fake" else None,
+		vector_stores=vector_stores, backend=args.backend, search_strategy=args.strategy,
+		reference_fast_path=args.reference_fast_path,
+		**({"semantic_top_k": args.semantic_top_k} if args.semantic_top_k is not None else {})
+	))
+	match_time, match_cpu_time = time.perf_counter() - start, time.process_time() - start_cpu
+
+	n_interventions = sum(len(matching.transcript) for matching in matchings)
+	n_mentions = sum(len(i.mentions or []) for matching in matchings for i in matching.transcript)
+	print(
+		f"Parsing: {parse_stats.n_documents} documents, {parse_stats.n_transcripts} transcripts "
+		f"({parse_stats.n_interventions} interventions) in {parse_stats.wall_time:.2f} s "
+		f"on {parse_stats.workers} workers: {parse_stats.n_documents / parse_stats.wall_time:.2f} documents/s, "
+		f"{parse_stats.n_interventions / parse_stats.wall_time:.0f} interventions/s, "
+		f"{parse_stats.n_documents / parse_stats.wall_time / parse_stats.workers:.2f} documents/s per core, "
+		f"CPU utilization {parse_stats.cpu_time / (parse_stats.wall_time * parse_stats.workers):.0%}"
+	)
+	print(
+		f"Matching: {len(matchings)} sessions, {n_interventions} interventions, {n_mentions} mentions "
+		f"in {match_time:.2f} s (one core, {match_cpu_time:.2f} s CPU): "
+		f"{n_interventions / match_time:.1f} interventions/s, "
+		f"{n_interventions / max(match_cpu_time, 1e-9):.1f} interventions per CPU second, "
+		f"cost {sum(matching.total_cost for matching in matchings):.4f}"
+	)
+	print(rate_limiter.report())
+	if cache is not None:
+		print(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+
+
+if __name__ == "__main__":
+	main()
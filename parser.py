@@ -1,10 +1,23 @@
 from __future__ import annotations
 
+import os
 import subprocess
 import re
 
+from array import array
 from enum import Enum
-from pydantic import BaseModel
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Literal
+from pydantic import BaseModel, PrivateAttr
+
+from utils.docx_reader import DocxReader
+from utils.exceptions import DocxConversionError
+from utils.metrics import METRICS
+from utils.regex import INDENTATION_REGEX
+
+
+# Version of the parsing logic, to be bumped whenever the parsed structure of a document may change
+NAIVE_DECISION_PARSER_VERSION: str = "1"
 
 
 class NaiveDecisionParserTextLevel(Enum):
@@ -28,19 +41,180 @@ class NaiveDecisionParserText(BaseModel):
 	numbering: str
 	text: str
 
+	# Compact node table this text is a view of (see NaiveDecisionParserNodeTable)
+	_node_table: Any = PrivateAttr(default=None)
+	_node_id: int | None = PrivateAttr(default=None)
+
+	@property
+	def node_id(self) -> int | None:
+		"""Index of the text in its document node table (pre-order), None if not bound to a node table
+		"""
+		return self._node_id
+
+	@property
+	def node_table(self) -> NaiveDecisionParserNodeTable | None:
+		"""Document node table this text is a view of, None if not bound to a node table
+		"""
+		return self._node_table
+
 	def __str__(self):
+		if self._node_table is not None:
+			return self._node_table.contexts[self._node_id]
 		return f"{self.parent.__str__() if self.parent is not None else ''}\n#{self.level.name} {self.numbering}#: {self.text}"
 
 
 NaiveDecisionParserDocument = list[NaiveDecisionParserText]
 
 
+def iter_document_texts(doc_content: NaiveDecisionParserDocument) -> Iterator[NaiveDecisionParserText]:
+	"""Iterates over every text of a structured document in pre-order (document order)
+
+	:param doc_content: Structured document content
+	:return: Iterator over the document texts
+	"""
+	stack: list[NaiveDecisionParserText] = list(reversed(doc_content))
+	while len(stack) != 0:
+		text = stack.pop()
+		yield text
+		stack.extend(reversed(text.children))
+
+
+def document_to_node_table(doc_content: NaiveDecisionParserDocument) -> list[tuple[int, int, str, str]]:
+	"""Flattens a structured document into a node table in pre-order,
+	 where each node references its parent by index instead of by object
+
+	:param doc_content: Structured document content
+	:return: (level value, parent index (-1 for roots), numbering, text) of each text
+	"""
+	node_index: dict[int, int] = {}
+	node_table: list[tuple[int, int, str, str]] = []
+	for i, text in enumerate(iter_document_texts(doc_content=doc_content)):
+		node_index[id(text)] = i
+		node_table.append((
+			text.level.value,
+			node_index[id(text.parent)] if text.parent is not None else -1,
+			text.numbering,
+			text.text
+		))
+	return node_table
+
+
+def document_from_node_table(node_table: list[tuple[int, int, str, str]]) -> NaiveDecisionParserDocument:
+	"""Rebuilds a structured document from its node table (see document_to_node_table)
+
+	:param node_table: (level value, parent index (-1 for roots), numbering, text) of each text, in pre-order
+	:return: Structured document content
+	"""
+	return NaiveDecisionParserNodeTable(rows=node_table).doc_content
+
+
+class NaiveDecisionParserNodeTable:
+	"""
+	Compact array-backed representation of a structured document:
+	 parallel arrays of level, parent index, numbering and text of each text in pre-order,
+	 plus the fully rendered context string (the text and all its ancestors) of each text,
+	 computed once and shared by every prompt and mention that renders the text.
+
+	The NaiveDecisionParserText objects of the document are kept as views bound to the table,
+	 so the document must not be modified after the table is built.
+	"""
+
+	__slots__ = ("levels", "parents", "numberings", "texts", "contexts", "nodes")
+
+	def __init__(
+			self, rows: list[tuple[int, int, str, str]], nodes: list[NaiveDecisionParserText] | None = None
+		) -> None:
+		"""
+		:param rows: (level value, parent index (-1 for roots), numbering, text) of each text, in pre-order
+		:param nodes: Already existing text objects of each row, if None they are built from the rows
+		"""
+		self.levels: array = array("B", [level for level, _, _, _ in rows])
+		self.parents: array = array("l", [parent for _, parent, _, _ in rows])
+		self.numberings: list[str] = [numbering for _, _, numbering, _ in rows]
+		self.texts: list[str] = [text for _, _, _, text in rows]
+
+		# Parents always come before their children in pre-order
+		level_names: dict[int, str] = {level.value: level.name for level in NaiveDecisionParserTextLevel}
+		self.contexts: list[str] = []
+		for level, parent, numbering, text in rows:
+			self.contexts.append(
+				f"{self.contexts[parent] if parent != -1 else ''}\n#{level_names[level]} {numbering}#: {text}"
+			)
+
+		self.nodes: list[NaiveDecisionParserText] = nodes if nodes is not None else self._build_nodes()
+		for node_id, node in enumerate(self.nodes):
+			# Bypass the pydantic attribute assignment machinery, a hot path on large documents
+			node.__pydantic_private__.update(_node_table=self, _node_id=node_id)
+
+	def _build_nodes(self) -> list[NaiveDecisionParserText]:
+		"""Builds the text objects (views) of every row
+
+		:return: Text objects in pre-order
+		"""
+		nodes: list[NaiveDecisionParserText] = []
+		text_levels: dict[int, NaiveDecisionParserTextLevel] = {level.value: level for level in NaiveDecisionParserTextLevel}
+		for level, parent, numbering, text in zip(self.levels, self.parents, self.numberings, self.texts):
+			node = NaiveDecisionParserText(
+				level=text_levels[level],
+				parent=nodes[parent] if parent != -1 else None,
+				children=[],
+				numbering=numbering,
+				text=text
+			)
+			if parent != -1:
+				nodes[parent].children.append(node)
+			nodes.append(node)
+		return nodes
+
+	@classmethod
+	def from_document(cls, doc_content: NaiveDecisionParserDocument) -> NaiveDecisionParserNodeTable:
+		"""Builds the node table of a structured document, binding its texts as views of the table
+
+		:param doc_content: Structured document content
+		:return: Node table
+		"""
+		return cls(
+			rows=document_to_node_table(doc_content=doc_content),
+			nodes=list(iter_document_texts(doc_content=doc_content))
+		)
+
+	@property
+	def doc_content(self) -> NaiveDecisionParserDocument:
+		"""Root texts of the document
+		"""
+		return [node for node, parent in zip(self.nodes, self.parents) if parent == -1]
+
+	def rows(self) -> list[tuple[int, int, str, str]]:
+		"""(level value, parent index (-1 for roots), numbering, text) of each text, in pre-order
+		"""
+		return list(zip(self.levels, self.parents, self.numberings, self.texts))
+
+	def __len__(self) -> int:
+		return len(self.nodes)
+
+
+def get_numbering_path(text: NaiveDecisionParserText) -> tuple[str, ...]:
+	"""Obtains the numbering path of a text, from its root ancestor to itself
+	 e.g. ("II.", "B.", "29.", "(c)")
+
+	:param text: Document text
+	:return: Numbering of every ancestor and the text itself
+	"""
+	numbering_path: list[str] = []
+	current_text: NaiveDecisionParserText | None = text
+	while current_text is not None:
+		numbering_path.append(current_text.numbering)
+		current_text = current_text.parent
+	return tuple(reversed(numbering_path))
+
+
 class NaiveDecisionParser:
 	"""
 	Basic .docx document file parser for decision documents,
 	 naive in the sense that it just parses the text into a string list representation,
 	 and then custom regex templates to capture the structure of the decision document
-	Using libreoffice under the hood to simulate the export .txt option.
+	Using libreoffice under the hood to simulate the export .txt option
+	 (or a pure Python .docx reader emulating it, see the backend parameter).
 
 	It does not parse text that is not numbered or tables.
 	"""
@@ -83,37 +257,104 @@ class NaiveDecisionParser:
 			case _:
 				raise ValueError(f"Cannot find regex numbering pattern for: {level}")
 
-	def __init__(self, input_path: str) -> None:
+	def __init__(
+			self, input_path: str, backend: Literal["libreoffice", "docx"] = "libreoffice", output_dir: str = ".",
+			libreoffice_profile: str | None = None
+		) -> None:
+		"""
+		:param input_path: Path of the input .docx file
+		:param backend: How the .docx is converted into its raw string list representation:
+		 - "libreoffice": headless LibreOffice .txt export
+		 - "docx": pure Python streaming reader of the .docx XML (no subprocess nor .txt file)
+		:param output_dir: Folder where the libreoffice .txt export is written
+		:param libreoffice_profile: Folder of the LibreOffice user profile used for the conversion,
+		 so that concurrent conversions (each with its own profile) do not collide (None for the default profile)
+		:raises ValueError: When the backend is unknown
+		:raises DocxConversionError: When the libreoffice conversion fails or exports no .txt
+		"""
 		self.input_path = input_path
-		self.txt_path = f"{self.input_path.removesuffix('.docx')}.txt"
+		self.backend = backend
+		self.output_dir = output_dir
+		self.libreoffice_profile = libreoffice_profile
+		self.txt_path = os.path.join(
+			self.output_dir, f"{os.path.basename(self.input_path).removesuffix('.docx')}.txt"
+		)
 
 		# Convert and load .docx document as .txt raw string list representation
-		self.convert_docx_to_text(input_path=self.input_path)
-		self.raw_doc_content = self.load_parsed_docx_content(txt_path=self.txt_path)
-
-		self.clean_doc_content = self._clean_raw_doc_content()
-		self.doc_content: NaiveDecisionParserDocument = self._structure_clean_doc_content()
+		with METRICS.stage("convert", backend=str(self.backend)):
+			match self.backend:
+				case "libreoffice":
+					# A .txt left by an earlier conversion (e.g. of a previous revision) must never be parsed instead
+					if os.path.exists(self.txt_path):
+						os.remove(self.txt_path)
+					self.convert_docx_to_text(
+						input_path=self.input_path, output_dir=self.output_dir, libreoffice_profile=self.libreoffice_profile
+					)
+					if not os.path.isfile(self.txt_path):
+						raise DocxConversionError(f"libreoffice did not export {self.input_path} to {self.txt_path}")
+					self.raw_doc_content = self.load_parsed_docx_content(txt_path=self.txt_path)
+				case "docx":
+					self.raw_doc_content = self.read_docx_content(input_path=self.input_path)
+				case _:
+					raise ValueError(f"Unknown .docx conversion backend: {self.backend}")
+
+		self._parse()
+
+	@classmethod
+	def from_raw_doc_content(cls, raw_doc_content: list[str]) -> NaiveDecisionParser:
+		"""Parses an already converted document (its raw string list representation),
+		 without any .docx file nor conversion
+
+		:param raw_doc_content: Raw lines of the document (as the libreoffice .txt export)
+		:return: Parser with the parsed document
+		"""
+		parser = cls.__new__(cls)
+		parser.input_path = None
+		parser.backend = None
+		parser.output_dir = None
+		parser.libreoffice_profile = None
+		parser.txt_path = None
+		parser.raw_doc_content = raw_doc_content
+		parser._parse()
+		return parser
+
+	def _parse(self) -> None:
+		"""Parses the raw string list representation into the structured document and its node table
+		"""
+		with METRICS.stage("parse"):
+			self.clean_doc_content, rows = self._parse_raw_doc_content(raw_doc_content=self.raw_doc_content)
+			self.node_table: NaiveDecisionParserNodeTable = NaiveDecisionParserNodeTable(rows=rows)
+			self.doc_content: NaiveDecisionParserDocument = self.node_table.doc_content
+		METRICS.increment("document_nodes_total", len(self.node_table))
 
 	@staticmethod
-	def convert_docx_to_text(input_path: str) -> None:
+	def convert_docx_to_text(input_path: str, output_dir: str = ".", libreoffice_profile: str | None = None) -> None:
 		"""Converts .docx to plain .txt using libreoffice command,
 		 the output file will have the same name as the input file but with the .txt extension
 
 		:param input_path: Path of the input .docx file
+		:param output_dir: Folder where the output file is written
+		:param libreoffice_profile: Folder of the LibreOffice user profile (None for the default profile),
+		 a running LibreOffice locks its profile so concurrent conversions need one profile each
+		:raises DocxConversionError: When libreoffice cannot be run or the conversion fails
 		"""
+		profile_args: list[str] = (
+			[f"-env:UserInstallation={Path(libreoffice_profile).resolve().as_uri()}"]
+			if libreoffice_profile is not None else []
+		)
 		# File extension validation already taken care of by libreoffice
 		try:
 			# Run LibreOffice headless command to convert the file from .docx to .txt
 			subprocess.run(
 				[
-					"libreoffice", "--headless", "--convert-to", "txt:Text",
-					input_path, "--outdir", "."
+					"libreoffice", *profile_args, "--headless", "--convert-to", "txt:Text",
+					input_path, "--outdir", output_dir
 				],
 				check=True
 			)
 			print("Conversion to .txt using libreoffice successful")
-		except subprocess.CalledProcessError as e:
-			print(f"Error during export: {e}")
+		except (subprocess.CalledProcessError, OSError) as e:
+			raise DocxConversionError(f"Cannot convert {input_path} to .txt with libreoffice: {e}") from e
 
 	@staticmethod
 	def load_parsed_docx_content(txt_path: str) -> list[str]:
@@ -133,41 +374,54 @@ class NaiveDecisionParser:
 		else:
 			raise ValueError("Document to be processed is empty")
 
-	def _clean_raw_doc_content(self) -> list[str]:
-		"""Cleans raw string list representation of the parsed .docx file:
-		 - Remove empty lines
-		 - Remove lines that do not start with:
-		 	- Uppercase roman numeral.
-			- Uppercase letters.
-			- Number.
-			- (Lowercase letters)
-			- (Lowercase roman numeral)
-			- (Number)
+	@staticmethod
+	def read_docx_content(input_path: str) -> list[str]:
+		"""Reads the .docx into a raw list of strings equivalent to the libreoffice .txt export,
+		 recovering the list levels from the .docx numbering instead of the exported indentation
 
-		:return: Clean string list representation of the .txt file
+		:param input_path: Path of the input .docx file
+		:raises ValueError: If the document has no text and therefore no lines were read
+		:return: String list representation of the .docx file
 		"""
 
-		clean_doc_content: list[str] = [
-			line for line in self.raw_doc_content if line.strip() != ""
-		]
-
-		pattern: str = (
-			rf"^("
-			rf"{self.heading_numbering_pattern}|"
-			rf"{self.subheading_numbering_pattern}|"
-			rf"{self.subsubheading_numbering_pattern}|"
-			rf"{self.subsubsubheading_numbering_pattern}|"
-			rf"{self.paragraph_numbering_pattern}|"
-			rf"{self.subparagraph_numbering_pattern}|"
-			rf"{self.subsubparagraph_numbering_pattern}|"
-			rf"{self.subsubsubparagraph_numbering_pattern}"
-			rf")\s"
-		)
-		clean_doc_content = [
-			line for line in clean_doc_content if re.match(pattern, line.lstrip())
-		]
+		doc_content: list[str] = DocxReader(input_path=input_path)()
+
+		if any(line.strip() != "" for line in doc_content):
+			return doc_content
+		else:
+			raise ValueError("Document to be processed is empty")
 
-		return clean_doc_content
+	@classmethod
+	def _get_compiled_patterns(cls) -> tuple[re.Pattern, dict[NaiveDecisionParserTextLevel, re.Pattern]]:
+		"""Compiles (once per parser class) the numbering regex patterns:
+		 - A combined pattern with one named group per level, matching any numbered line
+		 - The pattern of each level, capturing the numbering and the text of a line
+
+		:return: Combined pattern and the pattern of each level
+		"""
+
+		if "_compiled_patterns" not in cls.__dict__:
+			level_patterns: dict[NaiveDecisionParserTextLevel, str] = {
+				NaiveDecisionParserTextLevel.Heading: cls.heading_numbering_pattern,
+				NaiveDecisionParserTextLevel.Subheading: cls.subheading_numbering_pattern,
+				NaiveDecisionParserTextLevel.Subsubheading: cls.subsubheading_numbering_pattern,
+				NaiveDecisionParserTextLevel.Subsubsubheading: cls.subsubsubheading_numbering_pattern,
+				NaiveDecisionParserTextLevel.Paragraph: cls.paragraph_numbering_pattern,
+				NaiveDecisionParserTextLevel.Subparagraph: cls.subparagraph_numbering_pattern,
+				NaiveDecisionParserTextLevel.Subsubparagraph: cls.subsubparagraph_numbering_pattern,
+				NaiveDecisionParserTextLevel.Subsubsubparagraph: cls.subsubsubparagraph_numbering_pattern,
+			}
+			numbered_line_regex: re.Pattern = re.compile(
+				"^(?:" + "|".join(
+					f"(?P<{level.name.lower()}>{pattern})" for level, pattern in level_patterns.items()
+				) + r")\s"
+			)
+			level_regexes: dict[NaiveDecisionParserTextLevel, re.Pattern] = {
+				level: re.compile(rf"^(?:{pattern})(.*)$") for level, pattern in level_patterns.items()
+			}
+			cls._compiled_patterns = (numbered_line_regex, level_regexes)
+
+		return cls._compiled_patterns
 
 	@staticmethod
 	def get_text_level(line: str) -> NaiveDecisionParserTextLevel:
@@ -180,43 +434,25 @@ class NaiveDecisionParser:
 		"""
 
 		# Match leading tabs or groups of 4 spaces
-		match = re.match(r'^((\t| {4})*)', line)
+		match = INDENTATION_REGEX.match(line)
 		if match:
 			# Count the total number of matched indentations
 			return NaiveDecisionParserTextLevel(len(match.group(1)) // 4 + match.group(1).count('\t'))
 		return NaiveDecisionParserTextLevel(0)
 
-	def _get_parent_text(
-			self, prev_text: NaiveDecisionParserText, text_level: NaiveDecisionParserTextLevel
-		) -> NaiveDecisionParserText | None:
-		"""Given a previous text and a the text level of the current text,
-		 find the parent text of the current text.
-		Recursive algorithm where:
-		 - When current text is a sublevel of the previous text, then it is assigned as the parent
-		 - When current text is of the same level of the previous text, then they share the parent
-		 - Otherwise, recursively do the same but with the previous text parent instead
-
-		:param prev_text: Previous text used to capture the parent of the current text
-		:param text_level: Current text level (
-		 as the full current text object has not been yet constructed
-		)
-		:return: The current text parent object (None if it is a root text)
+	def _parse_raw_doc_content(
+			self, raw_doc_content: Iterable[str]
+		) -> tuple[list[str], list[tuple[int, int, str, str]]]:
 		"""
-
-		if prev_text is not None:
-			if prev_text.level.value < text_level.value:
-				return prev_text
-			elif prev_text.level.value == text_level.value:
-				return prev_text.parent
-			elif prev_text.level.value > text_level.value:
-				return self._get_parent_text(prev_text=prev_text.parent, text_level=text_level)
-
-		return None
-
-	def _structure_clean_doc_content(self) -> NaiveDecisionParserDocument:
-		"""
-		From the clean text representation of the .txt file,
-		 parse the document into its structured version following the levels logic, where:
+		Single streaming pass over the raw string list representation of the parsed .docx file that:
+		 1. Cleans it, removing empty lines and the lines that do not start with:
+			- Uppercase roman numeral.
+			- Uppercase letters.
+			- Number.
+			- (Lowercase letters)
+			- (Lowercase roman numeral)
+			- (Number)
+		 2. Parses the clean lines into the node table rows of the structured document following the levels logic, where:
 			- \t{1}Roman numeral. ...X... is a heading
 			- \t{2}Uppercase letters. ...X... is a subheading
 			- \t{3}Number. ...X... is a subsubheading
@@ -232,39 +468,44 @@ class NaiveDecisionParser:
 		Subparagraph => (h) ...
 		Subsubparagraph => (i) ...
 
-		:return: Structured document content following the designed structure
+		The parent of each text is the top of a stack of the currently open ancestors,
+		 which is popped until its top is of a lower level than the current text.
+
+		:param raw_doc_content: Raw lines of the document
+		:raises RuntimeError: When a clean line does not match the numbering pattern of its level
+		:return: Clean string list representation of the document and the node table rows
+		 (level value, parent index (-1 for roots), numbering, text) of its structured content
 		"""
 
-		structured_doc_content: NaiveDecisionParserDocument = []
-		prev_text: NaiveDecisionParserText | None = None
-		for line in self.clean_doc_content:
-			text_level: NaiveDecisionParserTextLevel = NaiveDecisionParserTextLevel(
-				self.get_text_level(line=line)
-			)
-			clean_text: str = line.strip()
-			match = re.match(
-				rf"^(?:{self.get_numbering_pattern_from_text_level(level=text_level)})(.*)$",
-				clean_text
-			)
+		numbered_line_regex, level_regexes = self._get_compiled_patterns()
+
+		clean_doc_content: list[str] = []
+		rows: list[tuple[int, int, str, str]] = []
+		# (level value, row index) of the currently open ancestors
+		ancestors: list[tuple[int, int]] = []
+		for line in raw_doc_content:
+			numbered_line = numbered_line_regex.match(line.lstrip())
+			if numbered_line is None:
+				continue
+			clean_doc_content.append(line)
+
+			text_level: NaiveDecisionParserTextLevel = self.get_text_level(line=line)
+			level_regex = level_regexes.get(text_level)
+			if level_regex is None:
+				# Raises the no pattern for the level error
+				self.get_numbering_pattern_from_text_level(level=text_level)
+			match = level_regex.match(line.strip())
 
 			if match is not None:
-				current_text: NaiveDecisionParserText = NaiveDecisionParserText(
-					level=text_level,
-					parent=self._get_parent_text(prev_text=prev_text, text_level=text_level),
-					numbering=match.group(1),
-					text=match.group(2)
-				)
-
-				# Assign as a root of the doc content or as the child of the parent text
-				if current_text.parent is None:
-					structured_doc_content.append(current_text)
-				else:
-					current_text.parent.children.append(current_text)
-				prev_text = current_text
+				level: int = text_level.value
+				while len(ancestors) != 0 and ancestors[-1][0] >= level:
+					ancestors.pop()
+				rows.append((level, ancestors[-1][1] if len(ancestors) != 0 else -1, match.group(1), match.group(2)))
+				ancestors.append((level, len(rows) - 1))
 			else:
 				raise RuntimeError(
 					f"Failed to match line: {line}. Expected pattern: {self.get_numbering_pattern_from_text_level(level=text_level)}"
-				)	
+					f" (found {numbered_line.lastgroup} numbering)"
+				)
 		
-		return structured_doc_content
-	
\ No newline at end of file
+		return clean_doc_content, rows
@@ -1,27 +1,98 @@
+from __future__ import annotations
+
 import os
-from typing import Optional, Literal
+import time
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict
+from warnings import warn
+from typing import TYPE_CHECKING, Generator, Iterable, Iterator, Optional, Literal
 from pydantic import BaseModel
 
-from parser import NaiveDecisionParser, NaiveDecisionParserDocument, NaiveDecisionParserText, NaiveDecisionParserTextLevel
-from utils.transcript_parser import TranscriptParser
+from parser import (
+	NaiveDecisionParser, NaiveDecisionParserDocument, NaiveDecisionParserText, NaiveDecisionParserTextLevel,
+	NaiveDecisionParserNodeTable, get_numbering_path
+)
+
+from utils.prompts import (
+	MENTION_TREE_SEARCH_EVALUATOR_PROMPT, MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT, MENTION_TREE_SEARCH_PACKED_FRAGMENT
+)
+from utils.request_schemas import MentionTreeSearchEvaluator, MentionTreeSearchPackedEvaluator
+from utils.reference_extractor import ReferenceExtractor
+from utils.lexical_index import LexicalRelevanceIndex
+from utils.results_journal import MatchingJournal
+from utils.metrics import METRICS, COUNT_BUCKETS
+from utils.token_counter import estimate_tokens
+from utils.intervention_filter import InterventionFilter, InterventionFilterDecision
+from utils.intervention_windows import InterventionWindower
+from utils.results_export import MatchingResultsWriter, get_document_fingerprint
+from utils.document_diff import DocumentDiff
+from utils.vector_store import DocumentVectorStore
+
+# The LLM dependencies (langchain, openai, sqlalchemy) are only imported once matching actually starts,
+# so that importing the pipeline (e.g. for Intervention) stays fast and needs no credentials
+if TYPE_CHECKING:
+	from langchain_core.runnables import Runnable
+	from utils.evaluator_cache import MentionTreeSearchEvaluatorCache
+	from utils.rate_limiter import AdaptiveRateLimiter
 
-from utils.prompts import MENTION_TREE_SEARCH_EVALUATOR_PROMPT
-from utils.request_schemas import MentionTreeSearchEvaluator
 
-from langchain_openai import ChatOpenAI
-from langchain_community.callbacks import get_openai_callback
+def load_credentials() -> None:
+	"""Loads the OpenAI credentials from the .env file (or the environment)
 
-from dotenv import load_dotenv, find_dotenv
-if load_dotenv(find_dotenv()):
-	os.environ["OPENAI_API_KEY"] = os.getenv('OPENAI_API_KEY')
-else:
-	raise ValueError("Please set environment variables (.env not found)")
+	:raises ValueError: If there is no .env file nor OPENAI_API_KEY environment variable
+	"""
+	from dotenv import load_dotenv, find_dotenv
+
+	if load_dotenv(find_dotenv()) or os.getenv("OPENAI_API_KEY") is not None:
+		os.environ["OPENAI_API_KEY"] = os.getenv('OPENAI_API_KEY')
+	else:
+		raise ValueError("Please set environment variables (.env not found)")
 
 
 class Mention(BaseModel):
 	content: NaiveDecisionParserText
 	textual_reference: str
 	mention_type: str
+	# Search strategy that produced the mention ("reference" for the explicit references fast path,
+	# "duplicate" for mentions reused from an earlier near-verbatim intervention)
+	strategy: str = "exhaustive"
+
+	def to_record(self) -> dict:
+		"""Serializable record of the mention, referencing the document text by its node id
+
+		:return: Mention record
+		"""
+		return {
+			"node_id": self.content.node_id,
+			"numbering_path": list(get_numbering_path(text=self.content)),
+			"textual_reference": self.textual_reference,
+			"mention_type": self.mention_type,
+			"strategy": self.strategy
+		}
+
+	@classmethod
+	def from_record(cls, record: dict, node_table: NaiveDecisionParserNodeTable) -> Mention:
+		"""Rebuilds a mention from its record
+
+		:param record: Mention record (see to_record)
+		:param node_table: Node table of the document the record was written for
+		:raises ValueError: If the record does not match the document
+		:return: Mention
+		"""
+		if not 0 <= record["node_id"] < len(node_table):
+			raise ValueError(f"Mention of unknown document node {record['node_id']}")
+		content = node_table.nodes[record["node_id"]]
+		if list(get_numbering_path(text=content)) != record["numbering_path"]:
+			raise ValueError(
+				f"Mention of node {record['node_id']} {record['numbering_path']} does not match the document "
+				f"{list(get_numbering_path(text=content))}, was it recorded for another document?"
+			)
+		return cls(
+			content=content, textual_reference=record["textual_reference"], mention_type=record["mention_type"],
+			strategy=record.get("strategy", "exhaustive")
+		)
 
 
 class Intervention(BaseModel):
@@ -30,6 +101,7 @@ class Intervention(BaseModel):
 	participant: str
 	paragraph: str
 	mentions: Optional[list[Mention]] = None
+	cost: float = 0.0
 
 	def __str__(self):
 		s: str = f"{self.participant} - [{self.hour}]\n"
@@ -41,68 +113,1195 @@ class Intervention(BaseModel):
 				s += f"~[{mention.mention_type}]~>\t{mention.textual_reference}\n"
 		return s
 
+	def to_record(self) -> dict:
+		"""Serializable record of the matched intervention
+
+		:return: Intervention record
+		"""
+		return {
+			"oid": self.oid,
+			"hour": self.hour,
+			"participant": self.participant,
+			"paragraph": self.paragraph,
+			"cost": self.cost,
+			"mentions": [mention.to_record() for mention in self.mentions] if self.mentions is not None else None
+		}
+
+	@classmethod
+	def from_record(cls, record: dict, node_table: NaiveDecisionParserNodeTable) -> Intervention:
+		"""Rebuilds a matched intervention from its record
+
+		:param record: Intervention record (see to_record)
+		:param node_table: Node table of the document the record was written for
+		:return: Intervention
+		"""
+		return cls(
+			oid=record["oid"], hour=record["hour"], participant=record["participant"], paragraph=record["paragraph"],
+			cost=record["cost"],
+			mentions=[
+				Mention.from_record(record=mention, node_table=node_table) for mention in record["mentions"]
+			] if record["mentions"] is not None else None
+		)
+
 
 class NegotiationDocumentToTranscriptMatching:
 
-	def __init__(self, doc_content: NaiveDecisionParserDocument, transcript: list[Intervention]):
+	def __init__(
+			self, doc_content: NaiveDecisionParserDocument, transcript: Iterable[Intervention],
+			asynchronous: bool = False, max_concurrency: int = 8,
+			model_name: str = "gpt-4o-mini", cache: MentionTreeSearchEvaluatorCache | None = None,
+			reference_fast_path: Literal["off", "prune", "exclusive"] = "off",
+			lexical_index: LexicalRelevanceIndex | None = None,
+			journal: MatchingJournal | None = None, resume: bool = False,
+			evaluator: Runnable | None = None,
+			search_strategy: Literal["exhaustive", "best_first", "beam"] = "exhaustive", beam_width: int = 8,
+			max_calls: int | None = None, max_tokens: int | None = None, early_stop: bool = True,
+			rate_limiter: AdaptiveRateLimiter | None = None,
+			packed: bool = False, pack_max_tokens: int = 6_000, max_pack_size: int = 16,
+			intervention_filter: InterventionFilter | None = None,
+			results_writer: MatchingResultsWriter | None = None,
+			document_diff: DocumentDiff | None = None, previous_results: dict[int, dict] | None = None,
+			intervention_windower: InterventionWindower | None = None,
+			vector_store: DocumentVectorStore | None = None, semantic_top_k: int = 10, semantic_min_score: float = 0.2,
+			verbose: bool = True
+		):
+		"""
+		:param doc_content: Structured negotiation document
+		:param transcript: Interventions to be matched against the document,
+		 if it is not a list (e.g. a generator streaming a transcript being read)
+		 matching starts as soon as the first interventions are available
+		:param asynchronous: Whether to run the tree searches of all the interventions concurrently
+		 (asyncio) instead of one intervention at a time
+		:param max_concurrency: Global limit of in-flight LLM calls in asynchronous mode
+		:param model_name: Evaluator LLM name
+		:param cache: Persistent cache of evaluations, only cache misses are sent to the LLM
+		:param reference_fast_path: How explicit numbering references (e.g. "paragraph 29") are handled:
+		 - "off" (default): everything is left to the LLM tree search
+		 - "prune": resolved references are emitted as DIRECT mentions without any LLM call,
+		 and the resolved paragraphs (and their subparagraphs) are not evaluated again by the tree search
+		 - "exclusive": as "prune", but the LLM tree search is skipped for interventions
+		 where at least one reference was resolved
+		:param lexical_index: Lexical relevance index of the document,
+		 if given only its top candidates of each tree search level are sent to the LLM
+		:param journal: Journal where every intervention is recorded as soon as it is matched
+		:param resume: Whether to restore the interventions already in the journal instead of matching them again
+		 (their cost is carried over to total_cost). Only the records journaled against the same document,
+		 for the same participant, timestamp and paragraph, are restored (e.g. not the ones of another transcript)
+		:param evaluator: Mention tree search evaluator returning MentionTreeSearchEvaluator verdicts
+		 (e.g. the offline FakeMentionTreeSearchEvaluator), if None the model_name OpenAI model is loaded.
+		 In packed mode it also receives the packed prompts, returning MentionTreeSearchPackedEvaluator verdicts
+		:param search_strategy: How the document tree is explored:
+		 - "exhaustive": every positive text is expanded level by level,
+		 paragraphs directly into all their leaf subdivisions
+		 - "best_first": the beam_width most promising candidates found so far are evaluated at each step,
+		 expanding positive texts one level at a time
+		 - "beam": level by level, keeping only the beam_width most promising candidates of each level
+		 Candidates are ranked by lexical relevance when a lexical_index is given (otherwise by depth
+		 and document order)
+		:param beam_width: Candidates evaluated at each best_first step, or kept at each beam level
+		:param max_calls: Maximum number of evaluations of each intervention (None for unbounded)
+		:param max_tokens: Maximum number of (estimated) prompt tokens of each intervention (None for unbounded)
+		:param early_stop: Whether positive internal texts whose subtree could not be evaluated within
+		 the budget are returned as mentions
+		:param rate_limiter: Controller of the evaluator calls (rate limits, adaptive concurrency and retries),
+		 if given it replaces the max_concurrency limit and the client retries
+		:param packed: Whether the document texts of a level are evaluated in packs, sending the instructions
+		 and the intervention once per pack instead of once per document text.
+		 Fragments missing (or evaluated inconsistently) in a packed answer are evaluated again on their own
+		:param pack_max_tokens: Maximum (estimated) prompt tokens of a pack, which determines the pack sizes
+		:param max_pack_size: Maximum number of document texts of a pack
+		:param intervention_filter: Pre-filter of the interventions, if given procedural interventions
+		 are not matched (no mentions, no cost) and near-duplicates of an earlier intervention reuse its mentions
+		:param results_writer: Export where every intervention is written (in transcript order) once matched
+		:param document_diff: Diff from a previous revision of the document to doc_content, used with previous_results
+		 to re-match incrementally: the mentions of the unchanged parts of the document are carried over and the
+		 tree search is only run on the changed subtrees (unless an ancestor is known to be negative).
+		 The mentions are the same as a full re-run without budgets, except for the "beam" strategy
+		 (whose candidates compete with the whole level)
+		:param previous_results: Records of the interventions matched against the previous revision by oid
+		 (e.g. a loaded MatchingJournal, or the rows of a results export), whose mentions reference its node ids
+		:param intervention_windower: Splitter of long interventions into sentence windows, if given the prompt of
+		 each document text only includes the windows most relevant to its subtree (lexical relevance, with the
+		 lexical_index or an index of its own) instead of the whole intervention
+		:param vector_store: Embeddings of the document texts, if given the tree search of each intervention starts
+		 from the paragraphs (or headings) of its semantic_top_k most similar texts instead of the document roots.
+		 The interventions of a transcript given as a list are all scored at once, with one matrix multiply
+		:param semantic_top_k: Most similar document texts seeding the tree search
+		:param semantic_min_score: Cosine similarity of the most similar document text below which the intervention
+		 is not seeded (e.g. no term in common with the document, only hashing collisions) and gets the full search
+		:param verbose: Whether every intervention is printed once matched
+		"""
 		self.doc_content: NaiveDecisionParserDocument = doc_content
-		self.transcript: list[Intervention] = transcript
+		self.node_table: NaiveDecisionParserNodeTable = (
+			self.doc_content[0].node_table
+			if len(self.doc_content) != 0 and self.doc_content[0].node_table is not None
+			else NaiveDecisionParserNodeTable.from_document(doc_content=self.doc_content)
+		)
+		# Interventions read so far, in transcript order
+		self.transcript: list[Intervention] = transcript if isinstance(transcript, list) else []
+		self._unread_transcript: Iterator[Intervention] | None = (
+			None if isinstance(transcript, list) else iter(transcript)
+		)
+		self.asynchronous: bool = asynchronous
+		self.max_concurrency: int = max_concurrency
+		self.model_name: str = model_name
+		self.cache: MentionTreeSearchEvaluatorCache | None = cache
+		self.reference_fast_path: Literal["off", "prune", "exclusive"] = reference_fast_path
+		self.reference_extractor: ReferenceExtractor | None = (
+			ReferenceExtractor(doc_content=self.doc_content) if self.reference_fast_path != "off" else None
+		)
+		self.lexical_index: LexicalRelevanceIndex | None = lexical_index
+		self.journal: MatchingJournal | None = journal
+		self._journaled: dict[int, dict] = self.journal.load() if self.journal is not None and resume else {}
+		self._document_fingerprint: str | None = (
+			get_document_fingerprint(rows=self.node_table.rows()) if self.journal is not None else None
+		)
+		self.evaluator: Runnable | None = evaluator
+		self.search_strategy: Literal["exhaustive", "best_first", "beam"] = search_strategy
+		self.beam_width: int = beam_width
+		self.max_calls: int | None = max_calls
+		self.max_tokens: int | None = max_tokens
+		self.early_stop: bool = early_stop
+		self._prompt_tokens: int = estimate_tokens(MENTION_TREE_SEARCH_EVALUATOR_PROMPT)
+		self.rate_limiter: AdaptiveRateLimiter | None = rate_limiter
+		self.packed: bool = packed
+		self.pack_max_tokens: int = pack_max_tokens
+		self.max_pack_size: int = max_pack_size
+		self._packed_prompt_tokens: int = estimate_tokens(MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT)
+		self.intervention_filter: InterventionFilter | None = intervention_filter
+		self._interventions: dict[int, Intervention] = {}
+		self.results_writer: MatchingResultsWriter | None = results_writer
+		self.document_diff: DocumentDiff | None = document_diff
+		self.previous_results: dict[int, dict] = previous_results if previous_results is not None else {}
+		# Report of the incremental re-matching
+		self.n_rematched: int = 0
+		self.n_carried_mentions: int = 0
+		self.n_searched_subtrees: int = 0
+		self.n_skipped_subtrees: int = 0
+		self.intervention_windower: InterventionWindower | None = intervention_windower
+		self._window_index: LexicalRelevanceIndex | None = None
+		# Windows (and their relevance) of the interventions being searched, by oid and text
+		self._intervention_windows: OrderedDict[tuple[int, str], tuple[list[str], object]] = OrderedDict()
+		self.vector_store: DocumentVectorStore | None = vector_store
+		self.semantic_top_k: int = semantic_top_k
+		self.semantic_min_score: float = semantic_min_score
+		# Most similar node ids of the interventions scored but not searched yet, by oid
+		self._semantic_candidates: dict[int, list[tuple[int, float]]] = {}
+		self.verbose: bool = verbose
 		self._load_models()
 		self.total_cost = 0.0
 
 	def _load_models(self):
-		"""Load the necessary LLMs
+		"""Load the necessary LLMs (unless an evaluator was given)
 		"""
-		llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+		if self.evaluator is not None:
+			self.mention_tree_search_evaluator = self.evaluator
+			self.mention_tree_search_packed_evaluator = self.evaluator
+			return
+
+		from langchain_openai import ChatOpenAI
+
+		load_credentials()
+		if self.rate_limiter is not None:
+			# Retries are left to the rate limiter, which has to see every rate limit error
+			llm = ChatOpenAI(model=self.model_name, temperature=0.0, max_retries=0)
+		else:
+			llm = ChatOpenAI(model=self.model_name, temperature=0.0)
 		self.mention_tree_search_evaluator = llm.with_structured_output(MentionTreeSearchEvaluator)
+		self.mention_tree_search_packed_evaluator = llm.with_structured_output(MentionTreeSearchPackedEvaluator)
 
 	def mention_tree_search(self, intervention: Intervention) -> list[Mention]:
-		"""_summary_
+		"""Sequentially runs the mention tree search of an intervention,
+		 one evaluator batch per tree level
 
-		:return: _description_
+		:param intervention: Intervention to be matched
+		:return: Mentions found in the document
 		"""
 
-		# Root level pass
-		selected_content, decided_content = self._mention_tree_search_iteration(
-			selected_content=self.doc_content,
-			intervention=intervention
+		root_candidates, carried_mentions = self._get_rematch_plan(intervention=intervention)
+		if root_candidates is None:
+			root_candidates = self._get_semantic_root_candidates(intervention=intervention)
+		search = self._mention_tree_search_steps(intervention=intervention, root_candidates=root_candidates)
+		cost: float = 0.0
+		try:
+			selected_content = next(search)
+			level: int = 0
+			while True:
+				with METRICS.stage("tree_search_level", level=level):
+					continue_search_batch, _cost = self._evaluate(
+						selected_content=selected_content, intervention=intervention
+					)
+				cost += _cost
+				level += 1
+				selected_content = search.send(continue_search_batch)
+		except StopIteration as stop:
+			decided_content: list[Mention] = stop.value
+
+		intervention.cost = cost
+		self.total_cost += cost
+		return self._merge_carried_mentions(decided_content=decided_content, carried_mentions=carried_mentions)
+
+	async def amention_tree_search(self, intervention: Intervention) -> list[Mention]:
+		"""Asynchronous counterpart of mention_tree_search, every evaluation is bounded
+		 by the global concurrency limit so that many interventions can be searched at once.
+		The intervention cost is stored in the intervention, total_cost is aggregated
+		 by acall in transcript order to keep it deterministic.
+
+		:param intervention: Intervention to be matched
+		:return: Mentions found in the document
+		"""
+
+		root_candidates, carried_mentions = self._get_rematch_plan(intervention=intervention)
+		if root_candidates is None:
+			root_candidates = self._get_semantic_root_candidates(intervention=intervention)
+		search = self._mention_tree_search_steps(intervention=intervention, root_candidates=root_candidates)
+		cost: float = 0.0
+		try:
+			selected_content = next(search)
+			level: int = 0
+			while True:
+				with METRICS.stage("tree_search_level", level=level):
+					continue_search_batch, _cost = await self._aevaluate(
+						selected_content=selected_content, intervention=intervention
+					)
+				cost += _cost
+				level += 1
+				selected_content = search.send(continue_search_batch)
+		except StopIteration as stop:
+			decided_content: list[Mention] = stop.value
+
+		intervention.cost = cost
+		return self._merge_carried_mentions(decided_content=decided_content, carried_mentions=carried_mentions)
+
+	def _mention_tree_search_steps(
+			self, intervention: Intervention, root_candidates: NaiveDecisionParserDocument | None = None
+		) -> Generator[NaiveDecisionParserDocument, list[MentionTreeSearchEvaluator], list[Mention]]:
+		"""Tree search logic independent of how the evaluator is called:
+		 yields the content to be evaluated at each level and receives back its evaluations.
+
+		:param intervention: Intervention to be matched
+		:param root_candidates: Candidates of the first level, if None the document roots
+		 (e.g. only the changed subtrees when re-matching incrementally)
+		:return: Mentions found in the document (as the generator return value)
+		"""
+
+		# Explicit references fast path
+		decided_content: list[Mention] = self._reference_fast_path(intervention=intervention)
+		METRICS.increment("reference_mentions_total", len(decided_content))
+		if self.reference_fast_path == "exclusive" and len(decided_content) != 0:
+			self._record_search_metrics(n_levels=0, n_evaluated=0, n_pruned=0)
+			return decided_content
+		resolved_content: set[int] = {
+			id(mention.content) for mention in decided_content
+			if mention.content.level.value >= NaiveDecisionParserTextLevel.Paragraph.value
+		}
+
+		lexical_scores = (
+			self.lexical_index.score(text=intervention.paragraph) if self.lexical_index is not None else None
 		)
-		
+
 		# Tree traverse
-		while len(selected_content) != 0:
-			selected_content, _decided_content = self._mention_tree_search_iteration(
+		n_levels, n_evaluated, n_pruned, n_tokens = 0, 0, 0, 0
+		# Positive internal texts (and their evaluation) by id,
+		# and the id of the positive text each candidate was expanded from
+		expanded: dict[int, tuple[NaiveDecisionParserText, MentionTreeSearchEvaluator]] = {}
+		expanded_from: dict[int, int] = {}
+		# Candidates not evaluated because the budget was exhausted
+		pending: NaiveDecisionParserDocument | None = None
+		frontier: list[tuple[float, int, int, NaiveDecisionParserText]] = []
+		order = itertools.count()
+
+		# Root level pass
+		candidates: NaiveDecisionParserDocument = self.doc_content if root_candidates is None else root_candidates
+		while True:
+			kept = self._prune_candidates(
+				candidates=candidates, resolved_content=resolved_content, lexical_scores=lexical_scores
+			)
+			n_pruned += len(candidates) - len(kept)
+			if self.search_strategy == "best_first":
+				for content in kept:
+					heapq.heappush(frontier, (
+						-self._get_priority(content=content, lexical_scores=lexical_scores),
+						-content.level.value, next(order), content
+					))
+				selected_content = [heapq.heappop(frontier)[-1] for _ in range(min(self.beam_width, len(frontier)))]
+			elif self.search_strategy == "beam":
+				selected_content = self._get_beam(candidates=kept, lexical_scores=lexical_scores)
+				n_pruned += len(kept) - len(selected_content)
+			else:
+				selected_content = kept
+
+			n_fitting, tokens = self._fit_budget(
+				selected_content=selected_content, intervention=intervention, n_calls=n_evaluated, n_tokens=n_tokens
+			)
+			if n_fitting < len(selected_content):
+				pending = selected_content[n_fitting:] + [entry[-1] for entry in frontier]
+				selected_content = selected_content[:n_fitting]
+			if len(selected_content) == 0:
+				break
+			n_levels += 1
+			n_evaluated += len(selected_content)
+			n_tokens += tokens
+			continue_search_batch: list[MentionTreeSearchEvaluator] = yield selected_content
+			candidates, _decided_content = self._mention_tree_search_iteration(
 				selected_content=selected_content,
-			intervention=intervention
+				continue_search_batch=continue_search_batch,
+				unpack_paragraphs=self.search_strategy == "exhaustive",
+				expanded=expanded, expanded_from=expanded_from
 			)
 			decided_content += _decided_content
+			if pending is not None:
+				pending += candidates
+				break
 
+		if pending is not None:
+			METRICS.increment("tree_search_budget_exhausted_total", strategy=self.search_strategy)
+			if self.early_stop:
+				early_stop_content = self._get_early_stop_mentions(
+					pending=pending, decided_content=decided_content, expanded=expanded, expanded_from=expanded_from
+				)
+				METRICS.increment("tree_search_early_stop_mentions_total", len(early_stop_content))
+				decided_content += early_stop_content
+
+		self._record_search_metrics(n_levels=n_levels, n_evaluated=n_evaluated, n_pruned=n_pruned)
 		return decided_content
 
-	def _mention_tree_search_iteration(
+	def _get_rematch_plan(
+			self, intervention: Intervention
+		) -> tuple[NaiveDecisionParserDocument | None, list[Mention]]:
+		"""Plans the incremental re-matching of an intervention matched against the previous document revision:
+		 each changed subtree is searched again unless its nearest evaluated ancestor is negative,
+		 which is known from the evaluations cache or from the previous mentions (the ancestors of a mention
+		 are positive). Ancestors of unknown evaluation below the nearest known one are searched again too.
+
+		:param intervention: Intervention to be matched
+		:return: Root candidates of the tree search (None for a full search)
+		 and the previous mentions carried over
+		"""
+
+		record = self.previous_results.get(intervention.oid)
+		if self.document_diff is None or record is None or record["mentions"] is None:
+			return None, []
+		diff = self.document_diff
+		nodes = self.node_table.nodes
+		parents = self.node_table.parents
+
+		# Ancestors of the previous mentions found by the search (not by the reference fast path) are positive
+		positive: set[int] = set()
+		for mention in record["mentions"]:
+			if mention["strategy"] == "reference":
+				continue
+			old_id = diff.old.parents[mention["node_id"]]
+			while old_id != -1:
+				if (new_id := diff.carry_over(old_node_id=old_id)) is not None:
+					positive.add(new_id)
+				old_id = diff.old.parents[old_id]
+
+		# Nearest evaluated ancestor first (paragraphs are unpacked into their leaves in the exhaustive search)
+		chains: dict[int, list[int]] = {}
+		for root in diff.dirty_roots:
+			chain: list[int] = []
+			ancestor = parents[root]
+			while ancestor != -1:
+				if self.search_strategy != "exhaustive" or nodes[ancestor].level.value <= NaiveDecisionParserTextLevel.Paragraph.value:
+					chain.append(ancestor)
+				ancestor = parents[ancestor]
+			chains[root] = chain
+		chain_ids = sorted({ancestor for chain in chains.values() for ancestor in chain})
+		cached, _ = self._get_cached_evaluations(
+			prompts=self._get_prompts(selected_content=[nodes[i] for i in chain_ids], intervention=intervention)
+		)
+		verdicts: dict[int, bool] = {
+			i: evaluation.contains_mention for i, evaluation in zip(chain_ids, cached) if evaluation is not None
+		}
+
+		seeds: set[int] = set()
+		for root, chain in chains.items():
+			# Ancestors of unknown evaluation are searched again along with the changed subtree
+			seed = root
+			for ancestor in chain:
+				verdict = verdicts.get(ancestor, True if ancestor in positive else None)
+				if verdict is None:
+					seed = ancestor
+					continue
+				if verdict:
+					seeds.add(seed)
+				else:
+					self.n_skipped_subtrees += 1
+				break
+			else:
+				seeds.add(seed)
+		# Subtrees of other seeds are searched with them
+		seeds = {
+			seed for seed in seeds
+			if not any(ancestor in seeds for ancestor in self._iter_ancestor_ids(node_id=seed))
+		}
+		self.n_searched_subtrees += len(seeds)
+
+		root_candidates: NaiveDecisionParserDocument = []
+		for seed in sorted(seeds):
+			if self.search_strategy == "exhaustive" and nodes[seed].level.value > NaiveDecisionParserTextLevel.Paragraph.value:
+				root_candidates += self._unpack_paragraph_children(content=nodes[seed])
+			else:
+				root_candidates.append(nodes[seed])
+
+		carried_mentions: list[Mention] = []
+		for mention in record["mentions"]:
+			new_id = diff.carry_over(old_node_id=mention["node_id"])
+			if new_id is None or mention["strategy"] == "reference" or diff.has_dirty_descendant[new_id]:
+				continue
+			if any(ancestor in seeds for ancestor in self._iter_ancestor_ids(node_id=new_id, include_self=True)):
+				continue
+			carried_mentions.append(Mention(
+				content=nodes[new_id], textual_reference=mention["textual_reference"],
+				mention_type=mention["mention_type"], strategy=mention["strategy"]
+			))
+		self.n_rematched += 1
+		self.n_carried_mentions += len(carried_mentions)
+		return root_candidates, carried_mentions
+
+	def _search_semantic_candidates(self, interventions: list[Intervention]) -> None:
+		"""Scores interventions against the document embeddings at once (if there is a vector store),
+		 keeping the most similar node ids of each one until it is searched
+
+		:param interventions: Interventions to be matched
+		"""
+
+		if self.vector_store is None:
+			return
+		interventions = [
+			intervention for intervention in interventions if intervention.oid not in self._semantic_candidates
+		]
+		with METRICS.stage("semantic_search"):
+			candidates = self.vector_store.search_with_scores(
+				queries=[intervention.paragraph for intervention in interventions], top_k=self.semantic_top_k
+			)
+		for intervention, hits in zip(interventions, candidates):
+			self._semantic_candidates[intervention.oid] = hits
+
+	def _get_semantic_root_candidates(self, intervention: Intervention) -> NaiveDecisionParserDocument | None:
+		"""Root candidates of the tree search from the texts most similar to the intervention:
+		 their paragraphs (texts below a paragraph are searched from their paragraph), or the texts themselves
+		 above the paragraph level, without the ones inside the subtree of another candidate
+
+		:param intervention: Intervention to be matched
+		:return: Root candidates in document order, None without vector store or when even the most similar text
+		 scores below semantic_min_score (full search)
+		"""
+
+		if self.vector_store is None:
+			return None
+		if intervention.oid not in self._semantic_candidates:
+			self._search_semantic_candidates(interventions=[intervention])
+		hits = self._semantic_candidates.pop(intervention.oid)
+		if len(hits) == 0 or hits[0][1] < self.semantic_min_score:
+			# Unrelated to every text: seeding from arbitrary ones would miss its mentions
+			METRICS.increment("semantic_fallbacks_total")
+			return None
+		node_ids = [node_id for node_id, _ in hits]
+
+		nodes = self.node_table.nodes
+		seeds: set[int] = set()
+		for node_id in node_ids:
+			seed = node_id
+			for ancestor in self._iter_ancestor_ids(node_id=node_id, include_self=True):
+				if nodes[ancestor].level.value <= NaiveDecisionParserTextLevel.Paragraph.value:
+					seed = ancestor
+					break
+			seeds.add(seed)
+		seeds = {
+			seed for seed in seeds
+			if not any(ancestor in seeds for ancestor in self._iter_ancestor_ids(node_id=seed))
+		}
+		METRICS.increment("semantic_seeds_total", len(seeds))
+		return [nodes[seed] for seed in sorted(seeds)]
+
+	def _iter_ancestor_ids(self, node_id: int, include_self: bool = False) -> Iterator[int]:
+		"""Iterates over the node ids of the ancestors of a document text
+
+		:param node_id: Node id of the text
+		:param include_self: Whether the text itself is included
+		:return: Iterator over the node ids, from the text up to its root
+		"""
+
+		if include_self:
+			yield node_id
+		while (node_id := self.node_table.parents[node_id]) != -1:
+			yield node_id
+
+	@staticmethod
+	def _merge_carried_mentions(decided_content: list[Mention], carried_mentions: list[Mention]) -> list[Mention]:
+		"""Adds the carried over mentions to the mentions found by the tree search (without repeating texts)
+
+		:param decided_content: Mentions found by the tree search
+		:param carried_mentions: Mentions carried over from the previous document revision
+		:return: All the mentions
+		"""
+
+		found: set[int] = {id(mention.content) for mention in decided_content}
+		return decided_content + [mention for mention in carried_mentions if id(mention.content) not in found]
+
+	def rematch_report(self) -> str:
+		"""Report of the incremental re-matching
+
+		:return: Human readable report
+		"""
+		return (
+			f"Incremental re-matching: {self.n_rematched} interventions, {self.n_carried_mentions} mentions carried over, "
+			f"{self.n_searched_subtrees} changed subtrees searched again, "
+			f"{self.n_skipped_subtrees} skipped (negative ancestor)"
+		)
+
+	def _prune_candidates(
+			self, candidates: NaiveDecisionParserDocument, resolved_content: set[int], lexical_scores
+		) -> NaiveDecisionParserDocument:
+		"""Removes the candidates already resolved by the reference fast path
+		 and the ones below the lexical relevance cut (if any)
+
+		:param candidates: Candidate document texts
+		:param resolved_content: Ids of the document texts resolved by the reference fast path
+		:param lexical_scores: Lexical relevance scores of the intervention (None without lexical index)
+		:return: Kept candidates
+		"""
+
+		if len(resolved_content) != 0:
+			candidates = [content for content in candidates if id(content) not in resolved_content]
+		if lexical_scores is not None:
+			candidates = self.lexical_index.prune(selected_content=candidates, scores=lexical_scores)
+		return candidates
+
+	def _get_priority(self, content: NaiveDecisionParserText, lexical_scores) -> float:
+		"""Priority of a candidate in the best_first and beam strategies
+
+		:param content: Candidate document text
+		:param lexical_scores: Lexical relevance scores of the intervention (None without lexical index)
+		:return: Lexical relevance of the candidate subtree (0 without lexical index)
+		"""
+
+		if lexical_scores is None:
+			return 0.0
+		return float(lexical_scores[self.lexical_index.text_index[id(content)]])
+
+	def _get_beam(
+			self, candidates: NaiveDecisionParserDocument, lexical_scores
+		) -> NaiveDecisionParserDocument:
+		"""Keeps the beam_width most promising candidates of a level, in document order
+
+		:param candidates: Candidates of a tree search level
+		:param lexical_scores: Lexical relevance scores of the intervention (None without lexical index)
+		:return: Kept candidates
+		"""
+
+		if len(candidates) <= self.beam_width:
+			return candidates
+		ranking = sorted(
+			range(len(candidates)),
+			key=lambda i: -self._get_priority(content=candidates[i], lexical_scores=lexical_scores)
+		)
+		return [candidates[i] for i in sorted(ranking[:self.beam_width])]
+
+	def _fit_budget(
+			self, selected_content: NaiveDecisionParserDocument, intervention: Intervention,
+			n_calls: int, n_tokens: int
+		) -> tuple[int, int]:
+		"""Obtains how many of the selected candidates fit in the remaining budget of the intervention
+
+		:param selected_content: Candidates to be evaluated, in evaluation order
+		:param intervention: Intervention to be matched
+		:param n_calls: Evaluations already spent
+		:param n_tokens: Estimated prompt tokens already spent
+		:return: Number of fitting candidates and their estimated prompt tokens
+		"""
+
+		n_fitting: int = len(selected_content)
+		if self.max_calls is not None:
+			n_fitting = min(n_fitting, max(0, self.max_calls - n_calls))
+
+		tokens: int = 0
+		if self.max_tokens is not None:
+			prompts = self._get_prompts(selected_content=selected_content[:n_fitting], intervention=intervention)
+			for i, (document, intervention_text) in enumerate(prompts):
+				content_tokens = self._prompt_tokens + estimate_tokens(intervention_text) + estimate_tokens(document)
+				if n_tokens + tokens + content_tokens > self.max_tokens:
+					n_fitting = i
+					break
+				tokens += content_tokens
+		return n_fitting, tokens
+
+	def _get_early_stop_mentions(
+			self, pending: NaiveDecisionParserDocument, decided_content: list[Mention],
+			expanded: dict[int, tuple[NaiveDecisionParserText, MentionTreeSearchEvaluator]],
+			expanded_from: dict[int, int]
+		) -> list[Mention]:
+		"""Obtains the mentions of the deepest positive internal texts whose subtree
+		 could not be evaluated within the budget, and where no mention was found
+
+		:param pending: Candidates not evaluated because the budget was exhausted
+		:param decided_content: Mentions found by the search
+		:param expanded: Positive internal texts (and their evaluation) by id
+		:param expanded_from: Id of the positive text each candidate was expanded from
+		:return: Mentions at internal texts
+		"""
+
+		def iter_ancestors(content_id: int) -> Iterator[int]:
+			while (content_id := expanded_from.get(content_id)) is not None:
+				yield content_id
+
+		# Positive texts with a mention below them, or with a deeper positive text pending
+		covered: set[int] = {
+			ancestor for mention in decided_content for ancestor in iter_ancestors(content_id=id(mention.content))
+		}
+		pending_parents: dict[int, None] = dict.fromkeys(
+			expanded_from[id(content)] for content in pending if id(content) in expanded_from
+		)
+		for parent in pending_parents:
+			covered.update(iter_ancestors(content_id=parent))
+
+		mentions: list[Mention] = []
+		for parent in pending_parents:
+			if parent not in covered:
+				content, continue_search = expanded[parent]
+				mentions.append(
+					Mention(
+						content=content,
+						textual_reference=continue_search.textual_reference,
+						mention_type=continue_search.mention_type,
+						strategy=self.search_strategy
+					)
+				)
+		return mentions
+
+	@staticmethod
+	def _record_search_metrics(n_levels: int, n_evaluated: int, n_pruned: int) -> None:
+		"""Records the metrics of a finished intervention tree search
+
+		:param n_levels: Number of tree levels evaluated
+		:param n_evaluated: Number of document texts expanded (evaluated)
+		:param n_pruned: Number of document texts pruned without evaluation
+		 (resolved by the reference fast path or below the lexical relevance cut)
+		"""
+
+		METRICS.increment("interventions_searched_total")
+		METRICS.increment("tree_search_nodes_evaluated_total", n_evaluated)
+		METRICS.increment("tree_search_nodes_pruned_total", n_pruned)
+		METRICS.observe("tree_search_depth", n_levels, buckets=COUNT_BUCKETS)
+		METRICS.observe("tree_search_nodes_evaluated", n_evaluated, buckets=COUNT_BUCKETS)
+		METRICS.observe("tree_search_nodes_pruned", n_pruned, buckets=COUNT_BUCKETS)
+
+	def _reference_fast_path(self, intervention: Intervention) -> list[Mention]:
+		"""Deterministically resolves the explicit numbering references of the intervention
+		 (e.g. "paragraph 29", "section II.B") into DIRECT mentions, without any LLM call
+
+		:param intervention: Intervention to be matched
+		:return: Mentions of the referenced document texts
+		"""
+
+		if self.reference_extractor is None:
+			return []
+
+		return [
+			Mention(content=content, textual_reference=textual_reference, mention_type="DIRECT", strategy="reference")
+			for content, textual_reference in self.reference_extractor(text=intervention.paragraph)
+		]
+
+	def _get_prompts(
 			self, selected_content: NaiveDecisionParserDocument,
 			intervention: Intervention
-		) -> tuple[NaiveDecisionParserDocument, list[Mention]]:
-		"""_summary_
+		) -> list[tuple[str, str]]:
+		"""Renders the (document, intervention) inputs of the evaluator prompt
+		 of each selected document text
 
-		:param selected_content: _description_
-		:return: _description_
+		:param selected_content: Document texts to be evaluated
+		:param intervention: Intervention to be matched
+		:return: One (document, intervention) pair per document text
+		 (the intervention reduced to its windows relevant to the document text, if windowed)
 		"""
 
-		prompts = [
-			[{
-				"role": "system",
-				"content": MENTION_TREE_SEARCH_EVALUATOR_PROMPT.format(
-					document=document_text.__str__(), intervention=intervention.paragraph
+		windows, relevance = self._get_intervention_windows(intervention=intervention)
+		if relevance is None:
+			return [
+				(document_text.__str__(), intervention.paragraph)
+				for document_text in selected_content
+			]
+
+		return [
+			(
+				document_text.__str__(),
+				self.intervention_windower.select(
+					windows=windows, scores=relevance[:, self._window_index.text_index[id(document_text)]]
 				)
-			}]
+			)
 			for document_text in selected_content
 		]
+
+	def _get_intervention_windows(self, intervention: Intervention) -> tuple[list[str], object]:
+		"""Splits an intervention into windows (memoized for the interventions being searched)
+
+		:param intervention: Intervention to be matched
+		:return: Windows and their relevance to every document subtree (windows x document texts),
+		 None if there is no windower or the intervention is not long enough to be windowed
+		"""
+
+		if self.intervention_windower is None:
+			return [intervention.paragraph], None
+
+		key = (intervention.oid, intervention.paragraph)
+		windows = self._intervention_windows.get(key)
+		if windows is None:
+			split = self.intervention_windower.split(text=intervention.paragraph)
+			relevance = None
+			if len(split) > 1:
+				if self._window_index is None:
+					self._window_index = (
+						self.lexical_index if self.lexical_index is not None
+						else LexicalRelevanceIndex(doc_content=self.doc_content)
+					)
+				relevance = self.intervention_windower.get_relevance(windows=split, lexical_index=self._window_index)
+				METRICS.observe("intervention_windows", len(split), buckets=COUNT_BUCKETS)
+			windows = self._intervention_windows[key] = (split, relevance)
+			if len(self._intervention_windows) > 256:
+				self._intervention_windows.popitem(last=False)
+		return windows
+
+	@staticmethod
+	def _get_messages(document: str, intervention: str) -> list[dict]:
+		"""Builds the evaluator prompt messages
+
+		:param document: Rendered document text
+		:param intervention: Intervention paragraph
+		:return: Evaluator prompt
+		"""
+
+		return [{
+			"role": "system",
+			"content": MENTION_TREE_SEARCH_EVALUATOR_PROMPT.format(
+				document=document, intervention=intervention
+			)
+		}]
+
+	@staticmethod
+	def _get_packed_messages(documents: list[str], intervention: str) -> list[dict]:
+		"""Builds the packed evaluator prompt messages
+
+		:param documents: Rendered document texts, enumerated as fragments 0, 1...
+		:param intervention: Intervention paragraph
+		:return: Packed evaluator prompt
+		"""
+
+		return [{
+			"role": "system",
+			"content": MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT.format(
+				documents="\n".join(
+					MENTION_TREE_SEARCH_PACKED_FRAGMENT.format(fragment_id=fragment_id, document=document)
+					for fragment_id, document in enumerate(documents)
+				),
+				intervention=intervention
+			)
+		}]
+
+	def _get_packs(self, prompts: list[tuple[str, str]]) -> list[list[int]]:
+		"""Groups consecutive prompts (the siblings of a level are consecutive) into packs
+		 fitting in the pack token budget, a pack only groups prompts with the same intervention text
+		 (windowed interventions may send different windows to different document texts)
+
+		:param prompts: (document, intervention) pairs of the same intervention
+		:return: Indexes of the prompts of each pack
+		"""
+
+		if len(prompts) == 0:
+			return []
+
+		base_tokens: int = self._packed_prompt_tokens + estimate_tokens(prompts[0][1])
+		packs: list[list[int]] = []
+		pack: list[int] = []
+		tokens: int = base_tokens
+		for i, (document, intervention) in enumerate(prompts):
+			document_tokens = estimate_tokens(
+				MENTION_TREE_SEARCH_PACKED_FRAGMENT.format(fragment_id=len(pack), document=document)
+			)
+			if len(pack) != 0 and (
+					len(pack) >= self.max_pack_size or tokens + document_tokens > self.pack_max_tokens
+					or intervention != prompts[pack[0]][1]
+				):
+				packs.append(pack)
+				pack, tokens = [], self._packed_prompt_tokens + estimate_tokens(intervention)
+			pack.append(i)
+			tokens += document_tokens
+		packs.append(pack)
+		return packs
+
+	@staticmethod
+	def _unpack_evaluations(
+			packed_evaluation: MentionTreeSearchPackedEvaluator, n_fragments: int
+		) -> list[MentionTreeSearchEvaluator | None]:
+		"""Validates a packed evaluation: unknown fragment ids are ignored, duplicated ones are only kept
+		 if they agree on whether there is a mention
+
+		:param packed_evaluation: Packed evaluation
+		:param n_fragments: Number of fragments of the pack
+		:return: Evaluation of each fragment (None if it is missing or inconsistent)
+		"""
+
+		evaluations: list[MentionTreeSearchEvaluator | None] = [None] * n_fragments
+		inconsistent: set[int] = set()
+		n_unknown, n_duplicated = 0, 0
+		for fragment_evaluation in packed_evaluation.evaluations:
+			fragment_id = fragment_evaluation.fragment_id
+			if not 0 <= fragment_id < n_fragments:
+				n_unknown += 1
+				continue
+			if evaluations[fragment_id] is not None:
+				n_duplicated += 1
+				if evaluations[fragment_id].contains_mention != fragment_evaluation.contains_mention:
+					inconsistent.add(fragment_id)
+				continue
+			evaluations[fragment_id] = MentionTreeSearchEvaluator(
+				contains_mention=fragment_evaluation.contains_mention,
+				textual_reference=fragment_evaluation.textual_reference,
+				mention_type=fragment_evaluation.mention_type
+			)
+		for fragment_id in inconsistent:
+			evaluations[fragment_id] = None
+
+		METRICS.increment("packed_fragments_unknown_total", n_unknown)
+		METRICS.increment("packed_fragments_duplicated_total", n_duplicated)
+		METRICS.increment("packed_fragments_missing_total", sum(evaluation is None for evaluation in evaluations))
+		return evaluations
+
+	def _get_cached_evaluations(
+			self, prompts: list[tuple[str, str]]
+		) -> tuple[list[MentionTreeSearchEvaluator | None], list[str]]:
+		"""Looks up the prompts in the evaluations cache (if any), under the packed prompt version in packed mode,
+		 falling back to the single prompt version (texts evaluated on their own)
+
+		:param prompts: (document, intervention) pairs
+		:return: Cached evaluations (None for the misses) and the cache keys of the prompts
+		"""
+
+		if self.cache is None:
+			return [None] * len(prompts), []
+
+		keys = [
+			self.cache.get_key(document=document, intervention=intervention, packed=self.packed)
+			for document, intervention in prompts
+		]
+		fallback_keys = [
+			self.cache.get_key(document=document, intervention=intervention) for document, intervention in prompts
+		] if self.packed else None
+		cached = self.cache.get_many(keys=keys, fallback_keys=fallback_keys)
+		return [cached.get(key) for key in keys], keys
+
+	async def _aget_cached_evaluations(
+			self, prompts: list[tuple[str, str]]
+		) -> tuple[list[MentionTreeSearchEvaluator | None], list[str]]:
+		"""Asynchronous counterpart of _get_cached_evaluations, the (blocking) database reads run in a worker thread
+		 so that they do not stall the event loop
+
+		:param prompts: (document, intervention) pairs
+		:return: Cached evaluations (None for the misses) and the cache keys of the prompts
+		"""
+
+		if self.cache is None:
+			return [None] * len(prompts), []
+		return await asyncio.to_thread(self._get_cached_evaluations, prompts)
+
+	def _set_cached_evaluations(
+			self, prompts: list[tuple[str, str]], keys: list[str],
+			continue_search_batch: list[MentionTreeSearchEvaluator], misses: list[int], unpacked: list[int]
+		) -> None:
+		"""Stores the freshly obtained evaluations in the evaluations cache (if any), the ones evaluated
+		 on their own under the single prompt version even in packed mode
+
+		:param prompts: (document, intervention) pairs
+		:param keys: Cache keys of all the prompts
+		:param continue_search_batch: Evaluations of all the prompts
+		:param misses: Indexes of the prompts that were sent to the LLM
+		:param unpacked: Indexes of the misses evaluated on their own (all of them outside packed mode)
+		"""
+
+		if self.cache is None:
+			return
+		if not self.packed:
+			self.cache.set_many(evaluations={keys[i]: continue_search_batch[i] for i in misses})
+			return
+		unpacked_indexes = set(unpacked)
+		self.cache.set_many(
+			evaluations={keys[i]: continue_search_batch[i] for i in misses if i not in unpacked_indexes}, packed=True
+		)
+		self.cache.set_many(evaluations={
+			self.cache.get_key(document=prompts[i][0], intervention=prompts[i][1]): continue_search_batch[i]
+			for i in unpacked
+		})
+
+	async def _aset_cached_evaluations(
+			self, prompts: list[tuple[str, str]], keys: list[str],
+			continue_search_batch: list[MentionTreeSearchEvaluator], misses: list[int], unpacked: list[int]
+		) -> None:
+		"""Asynchronous counterpart of _set_cached_evaluations, the (blocking) database writes run in a worker thread
+
+		:param prompts: (document, intervention) pairs
+		:param keys: Cache keys of all the prompts
+		:param continue_search_batch: Evaluations of all the prompts
+		:param misses: Indexes of the prompts that were sent to the LLM
+		:param unpacked: Indexes of the misses evaluated on their own (all of them outside packed mode)
+		"""
+
+		if self.cache is not None:
+			await asyncio.to_thread(self._set_cached_evaluations, prompts, keys, continue_search_batch, misses, unpacked)
+
+	@staticmethod
+	def _record_evaluation_metrics(
+			n_prompts: int, n_misses: int, mode: str, elapsed: float = 0.0,
+			prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = 0.0, n_calls: int | None = None
+		) -> None:
+		"""Records the metrics of the evaluation of a tree search level
+
+		:param n_prompts: Number of document texts evaluated
+		:param n_misses: Number of them sent to the LLM (not cached)
+		:param mode: How the LLM was called ("batch" or "async")
+		:param elapsed: Seconds waiting for the LLM
+		:param prompt_tokens: Prompt tokens of the LLM calls
+		:param completion_tokens: Completion tokens of the LLM calls
+		:param cost: Cost of the LLM calls
+		:param n_calls: Number of LLM calls (if None, one per document text sent)
+		"""
+
+		METRICS.increment("evaluations_cached_total", n_prompts - n_misses)
+		if n_misses == 0:
+			return
+		METRICS.increment("llm_calls_total", n_misses if n_calls is None else n_calls, mode=mode)
+		METRICS.increment("llm_prompt_tokens_total", prompt_tokens)
+		METRICS.increment("llm_completion_tokens_total", completion_tokens)
+		METRICS.increment("llm_cost_total", cost)
+		METRICS.observe("evaluator_batch_seconds", elapsed, mode=mode)
+		METRICS.observe("evaluator_batch_size", n_misses, buckets=COUNT_BUCKETS, mode=mode)
+		METRICS.observe("llm_prompt_tokens_per_node", prompt_tokens / n_misses, buckets=COUNT_BUCKETS)
+
+	def _evaluate(
+			self, selected_content: NaiveDecisionParserDocument,
+			intervention: Intervention
+		) -> tuple[list[MentionTreeSearchEvaluator], float]:
+		"""Evaluates the selected document texts against the intervention,
+		 sending the cache misses to the LLM in a single batch
+
+		:param selected_content: Document texts to be evaluated
+		:param intervention: Intervention to be matched
+		:return: Evaluations (in the same order as the selected content) and their cost
+		"""
+
+		prompts = self._get_prompts(selected_content=selected_content, intervention=intervention)
+		continue_search_batch, keys = self._get_cached_evaluations(prompts=prompts)
+		misses = [i for i, continue_search in enumerate(continue_search_batch) if continue_search is None]
+		if len(misses) == 0:
+			self._record_evaluation_metrics(n_prompts=len(prompts), n_misses=0, mode="cache")
+			return continue_search_batch, 0.0
+
+		from langchain_community.callbacks import get_openai_callback
+
+		start: float = time.perf_counter()
 		with get_openai_callback() as cb:
-			continue_search_batch: list[MentionTreeSearchEvaluator] = self.mention_tree_search_evaluator.batch(prompts)
-		self.total_cost += cb.total_cost
+			if self.packed:
+				evaluated_batch, unpacked, n_calls = self._evaluate_packed(prompts=[prompts[i] for i in misses])
+				unpacked = [misses[i] for i in unpacked]
+			else:
+				evaluated_batch: list[MentionTreeSearchEvaluator] = self._batch(
+					evaluator=self.mention_tree_search_evaluator, messages=[self._get_messages(*prompts[i]) for i in misses]
+				)
+				unpacked, n_calls = misses, len(misses)
+		self._record_evaluation_metrics(
+			n_prompts=len(prompts), n_misses=len(misses), mode="batch", elapsed=time.perf_counter() - start,
+			prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens, cost=cb.total_cost, n_calls=n_calls
+		)
+		for i, continue_search in zip(misses, evaluated_batch):
+			continue_search_batch[i] = continue_search
+		self._set_cached_evaluations(
+			prompts=prompts, keys=keys, continue_search_batch=continue_search_batch, misses=misses, unpacked=unpacked
+		)
+		return continue_search_batch, cb.total_cost
+
+	async def _aevaluate(
+			self, selected_content: NaiveDecisionParserDocument,
+			intervention: Intervention
+		) -> tuple[list[MentionTreeSearchEvaluator], float]:
+		"""Asynchronous counterpart of _evaluate, each cache miss waits for a slot
+		 of the global concurrency limit
+
+		:param selected_content: Document texts to be evaluated
+		:param intervention: Intervention to be matched
+		:return: Evaluations (in the same order as the selected content) and their cost
+		"""
+
+		prompts = self._get_prompts(selected_content=selected_content, intervention=intervention)
+		continue_search_batch, keys = await self._aget_cached_evaluations(prompts=prompts)
+		misses = [i for i, continue_search in enumerate(continue_search_batch) if continue_search is None]
+		if len(misses) == 0:
+			self._record_evaluation_metrics(n_prompts=len(prompts), n_misses=0, mode="cache")
+			return continue_search_batch, 0.0
+
+		from langchain_community.callbacks import get_openai_callback
+
+		start: float = time.perf_counter()
+		with get_openai_callback() as cb:
+			if self.packed:
+				evaluated_batch, unpacked, n_calls = await self._aevaluate_packed(prompts=[prompts[i] for i in misses])
+				unpacked = [misses[i] for i in unpacked]
+			else:
+				evaluated_batch: list[MentionTreeSearchEvaluator] = await self._abatch(
+					evaluator=self.mention_tree_search_evaluator, messages=[self._get_messages(*prompts[i]) for i in misses]
+				)
+				unpacked, n_calls = misses, len(misses)
+		self._record_evaluation_metrics(
+			n_prompts=len(prompts), n_misses=len(misses), mode="async", elapsed=time.perf_counter() - start,
+			prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens, cost=cb.total_cost, n_calls=n_calls
+		)
+		for i, continue_search in zip(misses, evaluated_batch):
+			continue_search_batch[i] = continue_search
+		await self._aset_cached_evaluations(
+			prompts=prompts, keys=keys, continue_search_batch=continue_search_batch, misses=misses, unpacked=unpacked
+		)
+		return continue_search_batch, cb.total_cost
+
+	def _evaluate_packed(
+			self, prompts: list[tuple[str, str]]
+		) -> tuple[list[MentionTreeSearchEvaluator], list[int], int]:
+		"""Evaluates the prompts in packs, the fragments missing in the packed answers
+		 (and the packs of a single prompt) are evaluated on their own
+
+		:param prompts: (document, intervention) pairs of the same intervention
+		:return: Evaluations (in the same order as the prompts) indexes of the ones
+		 evaluated on their own and number of LLM calls
+		"""
+
+		packs = [pack for pack in self._get_packs(prompts=prompts) if len(pack) > 1]
+		packed_batch: list[MentionTreeSearchPackedEvaluator] = self._batch(
+			evaluator=self.mention_tree_search_packed_evaluator,
+			messages=[
+				self._get_packed_messages(documents=[prompts[i][0] for i in pack], intervention=prompts[pack[0]][1])
+				for pack in packs
+			]
+		)
+		evaluations = self._merge_packed_evaluations(n_prompts=len(prompts), packs=packs, packed_batch=packed_batch)
+
+		unpacked = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+		unpacked_batch: list[MentionTreeSearchEvaluator] = self._batch(
+			evaluator=self.mention_tree_search_evaluator, messages=[self._get_messages(*prompts[i]) for i in unpacked]
+		)
+		for i, evaluation in zip(unpacked, unpacked_batch):
+			evaluations[i] = evaluation
+		return evaluations, unpacked, len(packs) + len(unpacked)
+
+	async def _aevaluate_packed(
+			self, prompts: list[tuple[str, str]]
+		) -> tuple[list[MentionTreeSearchEvaluator], list[int], int]:
+		"""Asynchronous counterpart of _evaluate_packed
+
+		:param prompts: (document, intervention) pairs of the same intervention
+		:return: Evaluations (in the same order as the prompts) indexes of the ones
+		 evaluated on their own and number of LLM calls
+		"""
+
+		packs = [pack for pack in self._get_packs(prompts=prompts) if len(pack) > 1]
+		packed_batch: list[MentionTreeSearchPackedEvaluator] = await self._abatch(
+			evaluator=self.mention_tree_search_packed_evaluator,
+			messages=[
+				self._get_packed_messages(documents=[prompts[i][0] for i in pack], intervention=prompts[pack[0]][1])
+				for pack in packs
+			]
+		)
+		evaluations = self._merge_packed_evaluations(n_prompts=len(prompts), packs=packs, packed_batch=packed_batch)
+
+		unpacked = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+		unpacked_batch: list[MentionTreeSearchEvaluator] = await self._abatch(
+			evaluator=self.mention_tree_search_evaluator, messages=[self._get_messages(*prompts[i]) for i in unpacked]
+		)
+		for i, evaluation in zip(unpacked, unpacked_batch):
+			evaluations[i] = evaluation
+		return evaluations, unpacked, len(packs) + len(unpacked)
+
+	def _merge_packed_evaluations(
+			self, n_prompts: int, packs: list[list[int]], packed_batch: list[MentionTreeSearchPackedEvaluator]
+		) -> list[MentionTreeSearchEvaluator | None]:
+		"""Assigns the validated packed evaluations to their prompts
+
+		:param n_prompts: Number of prompts
+		:param packs: Indexes of the prompts of each pack
+		:param packed_batch: Packed evaluation of each pack
+		:return: Evaluation of each prompt (None if it is missing)
+		"""
+
+		evaluations: list[MentionTreeSearchEvaluator | None] = [None] * n_prompts
+		for pack, packed_evaluation in zip(packs, packed_batch):
+			METRICS.observe("packed_fragments", len(pack), buckets=COUNT_BUCKETS)
+			pack_evaluations = self._unpack_evaluations(packed_evaluation=packed_evaluation, n_fragments=len(pack))
+			for i, evaluation in zip(pack, pack_evaluations):
+				evaluations[i] = evaluation
+		return evaluations
+
+	def _batch(self, evaluator: Runnable, messages: list[list[dict]]) -> list:
+		"""Invokes an evaluator on several prompts at once (through the rate limiter, if any)
+
+		:param evaluator: Evaluator runnable
+		:param messages: Prompts
+		:return: Evaluations, in the same order as the prompts
+		"""
+
+		if len(messages) == 0:
+			return []
+		if self.rate_limiter is not None:
+			return self.rate_limiter.batch(evaluator=evaluator, prompts=messages)
+		return evaluator.batch(messages)
+
+	async def _abatch(self, evaluator: Runnable, messages: list[list[dict]]) -> list:
+		"""Asynchronous counterpart of _batch, each prompt waits for a slot of the global concurrency limit
+
+		:param evaluator: Evaluator runnable
+		:param messages: Prompts
+		:return: Evaluations, in the same order as the prompts
+		"""
+
+		return await asyncio.gather(*[self._ainvoke(prompt=prompt, evaluator=evaluator) for prompt in messages])
+
+	async def _ainvoke(self, prompt: list[dict], evaluator: Runnable | None = None) -> MentionTreeSearchEvaluator:
+		"""Invokes the evaluator once the global concurrency limit (or the rate limiter) allows it
+
+		:param prompt: Evaluator prompt
+		:param evaluator: Evaluator runnable (the mention tree search evaluator by default)
+		:return: Evaluation
+		"""
+
+		evaluator = evaluator if evaluator is not None else self.mention_tree_search_evaluator
+		if self.rate_limiter is not None:
+			start: float = time.perf_counter()
+			evaluation = await self.rate_limiter.ainvoke(evaluator=evaluator, prompt=prompt)
+			METRICS.observe("evaluator_call_seconds", time.perf_counter() - start)
+			return evaluation
+
+		async with self._semaphore:
+			start: float = time.perf_counter()
+			evaluation = await evaluator.ainvoke(prompt)
+			METRICS.observe("evaluator_call_seconds", time.perf_counter() - start)
+			return evaluation
+
+	def _mention_tree_search_iteration(
+			self, selected_content: NaiveDecisionParserDocument,
+			continue_search_batch: list[MentionTreeSearchEvaluator],
+			unpack_paragraphs: bool = True,
+			expanded: dict[int, tuple[NaiveDecisionParserText, MentionTreeSearchEvaluator]] | None = None,
+			expanded_from: dict[int, int] | None = None
+		) -> tuple[NaiveDecisionParserDocument, list[Mention]]:
+		"""Given the evaluations of a level, decides the mentions found at leaf texts
+		 and the content to be evaluated at the next level
+
+		:param selected_content: Document texts evaluated at this level
+		:param continue_search_batch: Evaluations of the selected content
+		:param unpack_paragraphs: Whether positive paragraphs are expanded directly into all their leaf subdivisions
+		:param expanded: If given, positive internal texts (and their evaluation) are recorded by id
+		:param expanded_from: If given, the id of the positive text each new candidate was expanded from is recorded
+		:return: Content for the next level and mentions found at this level
+		"""
 
 		_selected_content: NaiveDecisionParserDocument = []
-		decided_content: NaiveDecisionParserDocument = []
+		decided_content: list[Mention] = []
 		for content, continue_search in zip(selected_content, continue_search_batch):
 			if continue_search.contains_mention:
 				if len(content.children) == 0:
@@ -110,14 +1309,20 @@ class NegotiationDocumentToTranscriptMatching:
 						Mention(
 							content=content,
 							textual_reference=continue_search.textual_reference,
-							mention_type=continue_search.mention_type
+							mention_type=continue_search.mention_type,
+							strategy=self.search_strategy
 						)
 					)
 				else:
-					if content.level.value >= NaiveDecisionParserTextLevel.Paragraph.value:
-						_selected_content += self._unpack_paragraph_children(content=content)
+					if unpack_paragraphs and content.level.value >= NaiveDecisionParserTextLevel.Paragraph.value:
+						children = self._unpack_paragraph_children(content=content)
 					else:
-						_selected_content += content.children
+						children = content.children
+					_selected_content += children
+					if expanded is not None:
+						expanded[id(content)] = (content, continue_search)
+					if expanded_from is not None:
+						expanded_from.update((id(child), id(content)) for child in children)
 
 		return _selected_content, decided_content
 	
@@ -142,25 +1347,187 @@ class NegotiationDocumentToTranscriptMatching:
 		return unpacked_children_content
 
 	def __call__(self):
-		for intervention in self.transcript:
-			intervention.mentions = self.mention_tree_search(intervention=intervention)
-			print(intervention)
+		if self.asynchronous:
+			asyncio.run(self.acall())
+			return
+
+		if self._unread_transcript is None:
+			self._search_semantic_candidates(interventions=self.transcript)
+		for intervention in self._iter_transcript():
+			decision = self._filter_intervention(intervention=intervention)
+			if self._restore_journaled(intervention=intervention):
+				self.total_cost += intervention.cost
+			elif decision is not None and decision.action != "match":
+				self._apply_filter_decision(intervention=intervention, decision=decision)
+				self._journal_intervention(intervention=intervention)
+			else:
+				intervention.mentions = self.mention_tree_search(intervention=intervention)
+				self._journal_intervention(intervention=intervention)
+			self._export_intervention(intervention=intervention)
+			if self.verbose:
+				print(intervention)
+
+	def _filter_intervention(self, intervention: Intervention) -> InterventionFilterDecision | None:
+		"""Runs the pre-filter on an intervention (in transcript order, including the restored ones,
+		 so that later repeats are still detected)
+
+		:param intervention: Intervention to be matched
+		:return: Decision, None if there is no pre-filter
+		"""
+
+		self._interventions[intervention.oid] = intervention
+		if self.intervention_filter is None:
+			return None
+		decision = self.intervention_filter(
+			oid=intervention.oid, text=intervention.paragraph, participant=intervention.participant, hour=intervention.hour
+		)
+		METRICS.increment("prefilter_decisions_total", action=decision.action, reason=decision.reason)
+		return decision
+
+	def _apply_filter_decision(self, intervention: Intervention, decision: InterventionFilterDecision) -> None:
+		"""Sets the mentions of a procedural (none) or duplicate intervention (those of the intervention it repeats,
+		 which must already be matched)
+
+		:param intervention: Filtered intervention
+		:param decision: Pre-filter decision (not "match")
+		"""
+
+		if decision.action == "duplicate":
+			original = self._interventions[decision.duplicate_of]
+			intervention.mentions = [
+				mention.model_copy(update={"strategy": "duplicate"}) for mention in original.mentions or []
+			]
+		else:
+			intervention.mentions = []
+		intervention.cost = 0.0
+
+	def _restore_journaled(self, intervention: Intervention) -> bool:
+		"""Restores the mentions and cost of an intervention from the journal of a previous run (if resuming)
+
+		:param intervention: Intervention to be matched
+		:return: Whether the intervention was restored
+		"""
+
+		record = self._journaled.get(intervention.oid)
+		if record is None:
+			return False
+		if (
+			record.get("document") != self._document_fingerprint
+			or (record["participant"], record["hour"], record["paragraph"])
+			!= (intervention.participant, intervention.hour, intervention.paragraph)
+		):
+			# Journaled by a run on another transcript, document or shard split: matched again
+			warn(f"Journal record of intervention {intervention.oid} does not match it, matching it again")
+			METRICS.increment("journal_records_mismatched_total")
+			return False
+
+		restored = Intervention.from_record(record=record, node_table=self.node_table)
+		intervention.mentions = restored.mentions
+		intervention.cost = restored.cost
+		return True
+
+	def _journal_intervention(self, intervention: Intervention) -> None:
+		"""Records a matched intervention in the journal (if any), with the fingerprint of the document
+
+		:param intervention: Matched intervention
+		"""
+
+		if self.journal is not None:
+			self.journal.append(record={**intervention.to_record(), "document": self._document_fingerprint})
+
+	def _export_intervention(self, intervention: Intervention) -> None:
+		"""Writes a matched intervention to the results export (if any)
+
+		:param intervention: Matched intervention
+		"""
+
+		if self.results_writer is not None:
+			self.results_writer.write(intervention=intervention)
+
+	async def _amatch_intervention(
+			self, intervention: Intervention, decision: InterventionFilterDecision | None = None,
+			original: asyncio.Task | None = None
+		) -> None:
+		"""Matches (or restores from the journal) an intervention,
+		 journaling it as soon as its tree search finishes
+
+		:param intervention: Intervention to be matched
+		:param decision: Pre-filter decision of the intervention (None if there is no pre-filter)
+		:param original: Task matching the intervention repeated by a duplicate, awaited before reusing its mentions
+		"""
+
+		if self._restore_journaled(intervention=intervention):
+			return
+		if decision is not None and decision.action != "match":
+			if original is not None:
+				await asyncio.shield(original)
+			self._apply_filter_decision(intervention=intervention, decision=decision)
+		else:
+			intervention.mentions = await self.amention_tree_search(intervention=intervention)
+		self._journal_intervention(intervention=intervention)
+
+	def _iter_transcript(self) -> Iterator[Intervention]:
+		"""Iterates over the transcript, reading the interventions that are still unread
+		 (and keeping them in self.transcript)
+
+		:return: Iterator over the interventions in transcript order
+		"""
+
+		yield from list(self.transcript)
+		if self._unread_transcript is not None:
+			for intervention in self._unread_transcript:
+				self.transcript.append(intervention)
+				yield intervention
+			self._unread_transcript = None
+
+	async def acall(self):
+		"""Runs the tree searches of all the interventions concurrently,
+		 bounded by max_concurrency in-flight LLM calls.
+		The searches start as soon as the interventions are read (the transcript is read in a worker thread).
+		Results are assigned, printed and costed in transcript order.
+		"""
+
+		self._semaphore = asyncio.Semaphore(self.max_concurrency)
+		searches: asyncio.Queue = asyncio.Queue()
+		if self._unread_transcript is None:
+			self._search_semantic_candidates(interventions=self.transcript)
+
+		tasks: dict[int, asyncio.Task] = {}
+
+		async def read_transcript():
+			transcript = self._iter_transcript()
+			try:
+				while (intervention := await asyncio.to_thread(next, transcript, None)) is not None:
+					decision = self._filter_intervention(intervention=intervention)
+					original = tasks.get(decision.duplicate_of) if decision is not None else None
+					task = tasks[intervention.oid] = asyncio.create_task(self._amatch_intervention(
+						intervention=intervention, decision=decision, original=original
+					))
+					await searches.put((intervention, task))
+			finally:
+				await searches.put(None)
+
+		reader = asyncio.create_task(read_transcript())
+		try:
+			while (search := await searches.get()) is not None:
+				intervention, task = search
+				await task
+				self.total_cost += intervention.cost
+				self._export_intervention(intervention=intervention)
+				if self.verbose:
+					print(intervention)
+			await reader
+		except BaseException:
+			# No tree search (nor its LLM calls) outlives a failed (or cancelled) run
+			reader.cancel()
+			for task in tasks.values():
+				task.cancel()
+			await asyncio.gather(reader, *tasks.values(), return_exceptions=True)
+			raise
 
 
 if __name__ == "__main__":
-	f_input = "Art_6.2_CMA_15a_DD_Party Inputs.docx"
-	negotiation_document = NaiveDecisionParser(input_path=f_input).doc_content
-
-	transcript_path = "A62 IC 3.txt"
-	parser = TranscriptParser(input_file=transcript_path, folder_name="")
-	interventions = [Intervention(**intervention_dict) for intervention_dict in parser()]
-
-	x = NegotiationDocumentToTranscriptMatching(
-		doc_content=negotiation_document, transcript=interventions
-	)
-	x()
-	with open("test.txt", "w") as f:
-		f.writelines([f"{intervention.__str__()}\n{'-'*42}\n" for intervention in x.transcript])
-		
-	print("#"*42)
-	print(x.total_cost)
+	import sys
+	from cli import main
+
+	main(["match", *sys.argv[1:]])
@@ -0,0 +1,76 @@
+import threading
+from multiprocessing import Process
+
+from utils.evaluator_cache import MentionTreeSearchEvaluatorCache
+from utils.request_schemas import MentionTreeSearchEvaluator
+
+
+def _get_evaluation(contains_mention: bool) -> MentionTreeSearchEvaluator:
+	return MentionTreeSearchEvaluator(
+		contains_mention=contains_mention, textual_reference="option 2", mention_type="DIRECT"
+	)
+
+
+def _set_overlapping_keys(db_path: str, worker: int) -> None:
+	cache = MentionTreeSearchEvaluatorCache(db_path=db_path)
+	for i in range(50):
+		cache.set_many(evaluations={
+			cache.get_key(document=f"document {j}", intervention="intervention"):
+				_get_evaluation(contains_mention=worker % 2 == 0)
+			for j in range(i, i + 5)
+		})
+
+
+def test_set_many_upserts_existing_keys(tmp_path) -> None:
+	cache = MentionTreeSearchEvaluatorCache(db_path=str(tmp_path / "cache.sqlite"))
+	key = cache.get_key(document="document", intervention="intervention")
+	cache.set_many(evaluations={key: _get_evaluation(contains_mention=False)})
+	cache.set_many(evaluations={key: _get_evaluation(contains_mention=True)})
+	assert len(cache) == 1
+	assert cache.get_many(keys=[key])[key].contains_mention
+	assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_concurrent_set_many_on_overlapping_keys_from_threads(tmp_path) -> None:
+	db_path = str(tmp_path / "cache.sqlite")
+	MentionTreeSearchEvaluatorCache(db_path=db_path)
+	errors: list[BaseException] = []
+
+	def work(worker: int) -> None:
+		try:
+			_set_overlapping_keys(db_path=db_path, worker=worker)
+		except BaseException as e:
+			errors.append(e)
+
+	threads = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert errors == []
+	assert len(MentionTreeSearchEvaluatorCache(db_path=db_path)) == 54
+
+
+def test_concurrent_set_many_on_overlapping_keys_from_processes(tmp_path) -> None:
+	db_path = str(tmp_path / "cache.sqlite")
+	processes = [Process(target=_set_overlapping_keys, args=(db_path, worker)) for worker in range(4)]
+	for process in processes:
+		process.start()
+	for process in processes:
+		process.join()
+	assert [process.exitcode for process in processes] == [0] * 4
+	assert len(MentionTreeSearchEvaluatorCache(db_path=db_path)) == 54
+
+
+def test_get_many_falls_back_to_the_fallback_keys(tmp_path) -> None:
+	cache = MentionTreeSearchEvaluatorCache(db_path=str(tmp_path / "cache.sqlite"))
+	keys = [cache.get_key(document=f"document {i}", intervention="intervention", packed=True) for i in range(3)]
+	fallback_keys = [cache.get_key(document=f"document {i}", intervention="intervention") for i in range(3)]
+	cache.set_many(evaluations={keys[0]: _get_evaluation(contains_mention=True)}, packed=True)
+	cache.set_many(evaluations={
+		fallback_keys[0]: _get_evaluation(contains_mention=False), fallback_keys[1]: _get_evaluation(contains_mention=False)
+	})
+	cached = cache.get_many(keys=keys, fallback_keys=fallback_keys)
+	assert sorted(cached) == sorted(keys[:2])
+	assert cached[keys[0]].contains_mention and not cached[keys[1]].contains_mention
+	assert (cache.hits, cache.misses) == (2, 1)
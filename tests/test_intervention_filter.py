@@ -0,0 +1,33 @@
+import pytest
+
+from utils.intervention_filter import InterventionFilter
+
+
+@pytest.mark.parametrize("text", [
+	"We support option 2.",
+	"We prefer deleting 14(b).",
+	"Remove the brackets.",
+	"Thank you chair. We cannot accept this.",
+	"We oppose that proposal.",
+	"We agree with Brazil.",
+	"Thank you chair, we support the text as is.",
+	"No objection.",
+	"We do not agree.",
+	"Thank you, Chair. Paragraph 29 should stay.",
+	"Thank you chair, the guidance needs more work on reporting.",
+])
+def test_positions_are_matched(text: str) -> None:
+	decision = InterventionFilter()._get_procedural_decision(oid=0, text=text)
+	assert decision.action == "match", decision
+
+
+@pytest.mark.parametrize("text, reason", [
+	("Thank you, Chair.", "too_short"),
+	("Thank you very much, Mr. Chair.", "procedural_phrases"),
+	("Good morning everyone, can you hear me?", "procedural_phrases"),
+	("Okay, thank you. I give the floor to the next speaker on my list.", "procedural_phrases"),
+	("Sorry, I was on mute.", "procedural_phrases"),
+])
+def test_procedural_interventions_are_skipped(text: str, reason: str) -> None:
+	decision = InterventionFilter()._get_procedural_decision(oid=0, text=text)
+	assert (decision.action, decision.reason) == ("procedural", reason), decision
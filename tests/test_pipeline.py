@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from parser import NaiveDecisionParser, NaiveDecisionParserDocument
+from pipeline import NegotiationDocumentToTranscriptMatching, Intervention
+from benchmarks.synthetic import generate_decision_items, generate_transcript, render_decision_lines
+from utils.evaluator_backends import FakeMentionTreeSearchEvaluator
+from utils.evaluator_cache import MentionTreeSearchEvaluatorCache
+from utils.exceptions import SimulatedRateLimitError
+from utils.vector_store import DocumentVectorStore, HashingEmbedder
+
+
+@pytest.fixture(scope="module")
+def doc_content() -> NaiveDecisionParserDocument:
+	lines = render_decision_lines(items=generate_decision_items(n_lines=300))
+	return NaiveDecisionParser.from_raw_doc_content(raw_doc_content=lines).doc_content
+
+
+def get_transcript(doc_content: NaiveDecisionParserDocument, **kwargs) -> list[Intervention]:
+	return [Intervention(**paragraph) for paragraph in generate_transcript(doc_content=doc_content, **kwargs)]
+
+
+def get_results(matching: NegotiationDocumentToTranscriptMatching) -> list[tuple[int, list[tuple]]]:
+	return [
+		(
+			intervention.oid,
+			[
+				(mention.content.node_id, mention.mention_type, mention.textual_reference)
+				for mention in intervention.mentions or []
+			]
+		)
+		for intervention in matching.transcript
+	]
+
+
+@pytest.mark.parametrize("kwargs", [
+	{},
+	{"packed": True},
+	{"search_strategy": "best_first", "max_calls": 20},
+])
+def test_sync_and_async_results_are_equal(doc_content: NaiveDecisionParserDocument, kwargs: dict) -> None:
+	results = []
+	for asynchronous in (False, True):
+		matching = NegotiationDocumentToTranscriptMatching(
+			doc_content=doc_content, transcript=get_transcript(doc_content=doc_content, n_interventions=20),
+			asynchronous=asynchronous, evaluator=FakeMentionTreeSearchEvaluator(seed=0), verbose=False, **kwargs
+		)
+		matching()
+		results.append(get_results(matching=matching))
+	assert results[0] == results[1]
+	assert any(len(mentions) != 0 for _, mentions in results[0])
+
+
+def test_async_cache_with_repeated_interventions(doc_content: NaiveDecisionParserDocument, tmp_path) -> None:
+	transcript = get_transcript(doc_content=doc_content, n_interventions=20)
+	# The same text twice in a row: both tree searches miss the same cache keys concurrently
+	transcript = [
+		intervention.model_copy(update={"oid": oid})
+		for oid, intervention in enumerate(i for intervention in transcript for i in (intervention, intervention))
+	]
+	cache = MentionTreeSearchEvaluatorCache(db_path=str(tmp_path / "cache.sqlite"))
+	matching = NegotiationDocumentToTranscriptMatching(
+		doc_content=doc_content, transcript=transcript, asynchronous=True, cache=cache,
+		evaluator=FakeMentionTreeSearchEvaluator(seed=0, latency=0.001), verbose=False
+	)
+	matching()
+	results = get_results(matching=matching)
+	assert [mentions for _, mentions in results[::2]] == [mentions for _, mentions in results[1::2]]
+	assert len(cache) != 0
+
+
+def test_failed_async_run_leaves_no_pending_tasks(doc_content: NaiveDecisionParserDocument) -> None:
+	matching = NegotiationDocumentToTranscriptMatching(
+		doc_content=doc_content, transcript=get_transcript(doc_content=doc_content, n_interventions=20),
+		asynchronous=True, verbose=False,
+		evaluator=FakeMentionTreeSearchEvaluator(seed=0, latency=0.01, rate_limit_rate=0.05)
+	)
+
+	async def run() -> list[asyncio.Task]:
+		with pytest.raises(SimulatedRateLimitError):
+			await matching.acall()
+		return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+	assert asyncio.run(run()) == []
+
+
+def test_unrelated_intervention_falls_back_to_the_full_search(doc_content: NaiveDecisionParserDocument, tmp_path) -> None:
+	related = get_transcript(doc_content=doc_content, n_interventions=1)[0]
+	unrelated = Intervention(oid=1, hour="00:01", participant="Chair", paragraph="Qwxz vbnjk plmq.\n")
+	results = []
+	for vector_store in (None, DocumentVectorStore.load_or_build(
+		node_table=doc_content[0].node_table, embed=HashingEmbedder(), cache_dir=str(tmp_path)
+	)):
+		matching = NegotiationDocumentToTranscriptMatching(
+			doc_content=doc_content, transcript=[related, unrelated], vector_store=vector_store,
+			evaluator=FakeMentionTreeSearchEvaluator(seed=0), verbose=False
+		)
+		if vector_store is not None:
+			assert matching._get_semantic_root_candidates(intervention=related) is not None
+			assert matching._get_semantic_root_candidates(intervention=unrelated) is None
+		matching()
+		results.append(get_results(matching=matching)[1])
+	assert results[0] == results[1]
+
+
+def test_packed_fallbacks_are_cached_under_the_single_prompt_version(
+		doc_content: NaiveDecisionParserDocument, tmp_path
+	) -> None:
+	transcript = get_transcript(doc_content=doc_content, n_interventions=10)
+	cache = MentionTreeSearchEvaluatorCache(db_path=str(tmp_path / "cache.sqlite"))
+	results = []
+	for packed in (True, False, True):
+		matching = NegotiationDocumentToTranscriptMatching(
+			doc_content=doc_content, transcript=[intervention.model_copy() for intervention in transcript],
+			packed=packed, cache=cache, evaluator=FakeMentionTreeSearchEvaluator(seed=0, packed_error_rate=1.0),
+			verbose=False
+		)
+		hits, misses = cache.hits, cache.misses
+		matching()
+		results.append((get_results(matching=matching), cache.hits - hits, cache.misses - misses))
+	# Every packed answer misses a fragment, whose evaluation on its own is also valid outside packed mode
+	assert results[1][1] != 0
+	assert results[2][2] == 0
+	assert results[0][0] == results[2][0]
@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+from utils.rate_limiter import AdaptiveRateLimiter
+
+
+def test_increase_wakes_up_a_waiting_thread() -> None:
+	rate_limiter = AdaptiveRateLimiter(requests_per_minute=None, tokens_per_minute=None, initial_concurrency=1)
+	rate_limiter._acquire()
+	waiter = threading.Thread(target=rate_limiter._acquire, daemon=True)
+	waiter.start()
+	waiter.join(timeout=0.1)
+	assert waiter.is_alive()
+	rate_limiter._increase(latency=0.0)
+	waiter.join(timeout=1.0)
+	assert not waiter.is_alive()
+	assert rate_limiter.in_flight == 2
+
+
+def test_increase_wakes_up_a_waiting_task() -> None:
+	rate_limiter = AdaptiveRateLimiter(requests_per_minute=None, tokens_per_minute=None, initial_concurrency=1)
+
+	async def run() -> None:
+		await rate_limiter._aacquire()
+		waiter = asyncio.create_task(rate_limiter._aacquire())
+		await asyncio.sleep(0.1)
+		assert not waiter.done()
+		rate_limiter._increase(latency=0.0)
+		await asyncio.wait_for(waiter, timeout=1.0)
+
+	asyncio.run(run())
+	assert rate_limiter.in_flight == 2
@@ -0,0 +1,41 @@
+import pytest
+
+from parser import NaiveDecisionParser
+from utils.reference_extractor import ReferenceExtractor
+from benchmarks.synthetic import render_decision_lines
+
+
+@pytest.fixture(scope="module")
+def reference_extractor() -> ReferenceExtractor:
+	lines = render_decision_lines(items=[
+		(0, "Guidance"), (5, "Decides to adopt the guidance"), (5, "Requests the secretariat"),
+		(6, "To report"), (6, "To publish"), (5, "Invites Parties")
+	])
+	return ReferenceExtractor(doc_content=NaiveDecisionParser.from_raw_doc_content(raw_doc_content=lines).doc_content)
+
+
+@pytest.mark.parametrize("text", [
+	"Article 6, paragraph 2 of the Paris Agreement",
+	"Article 6, paragraph 2, sets out cooperative approaches",
+	"Art. 6.2, para 3",
+	"paragraph 2 of Article 6",
+	"paragraph 3 of decision 2/CMA.3",
+	"paragraph 3 of the decision",
+	"paragraphs 2 and 3 of the annex to decision 3/CMA.3",
+	"decision 2/CMA.3, paragraph 3",
+	"paragraph 2 of the Convention",
+])
+def test_other_instrument_references_are_not_resolved(reference_extractor: ReferenceExtractor, text: str) -> None:
+	assert reference_extractor(text=text) == []
+
+
+@pytest.mark.parametrize("text, numberings", [
+	("We support paragraph 2(b)", ["(b)"]),
+	("paragraphs 1 to 3 of this decision", ["1.", "2.", "3."]),
+	("paragraph 2 of the draft text", ["2."]),
+	("paragraph 2 and subparagraph (a)", ["2.", "(a)"]),
+])
+def test_document_references_are_resolved(
+		reference_extractor: ReferenceExtractor, text: str, numberings: list[str]
+	) -> None:
+	assert [content.numbering for content, _ in reference_extractor(text=text)] == numberings
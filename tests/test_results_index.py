@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from parser import NaiveDecisionParser
+from pipeline import NegotiationDocumentToTranscriptMatching, Intervention
+from benchmarks.synthetic import generate_decision_items, generate_transcript, render_decision_lines
+from utils.evaluator_backends import FakeMentionTreeSearchEvaluator
+from utils.results_export import MatchingResultsWriter
+from utils.results_index import MatchingResultsIndex
+
+
+def write_export(export_dir: str, seed: int) -> None:
+	lines = render_decision_lines(items=generate_decision_items(n_lines=100))
+	doc_content = NaiveDecisionParser.from_raw_doc_content(raw_doc_content=lines).doc_content
+	matching = NegotiationDocumentToTranscriptMatching(
+		doc_content=doc_content,
+		transcript=[
+			Intervention(**paragraph)
+			for paragraph in generate_transcript(doc_content=doc_content, n_interventions=10, seed=seed)
+		],
+		evaluator=FakeMentionTreeSearchEvaluator(seed=seed), verbose=False
+	)
+	with MatchingResultsWriter(output_dir=export_dir, node_table=matching.node_table) as writer:
+		matching.results_writer = writer
+		matching()
+
+
+def test_sessions_with_the_same_folder_name_are_kept_apart(tmp_path, monkeypatch) -> None:
+	monkeypatch.chdir(tmp_path)
+	export_dirs = [os.path.join("SB58", "transcript"), os.path.join("SB60", "transcript")]
+	indexes = []
+	for seed, export_dir in enumerate(export_dirs):
+		write_export(export_dir=export_dir, seed=seed)
+		indexes.append(MatchingResultsIndex.from_exports(export_dirs=[export_dir]))
+	index = MatchingResultsIndex.from_exports(export_dirs=export_dirs)
+	assert index.sessions == export_dirs
+	assert len(index) == sum(len(session_index) for session_index in indexes) != 0
+	with pytest.raises(ValueError):
+		index.add_export(export_dir=export_dirs[0])
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+from hashlib import sha256
+from typing import Literal
+
+from parser import (
+	NAIVE_DECISION_PARSER_VERSION, NaiveDecisionParser, NaiveDecisionParserDocument,
+	document_to_node_table, document_from_node_table
+)
+
+
+class ParsedDocumentCache:
+	"""
+	Content-addressed cache of parsed decision documents.
+	Each entry is the flat node table of a NaiveDecisionParserDocument (see document_to_node_table)
+	 stored as JSON, keyed on the SHA-256 of the .docx bytes, the parser version and the backend,
+	 so that a hit is loaded without converting nor parsing the document again.
+	"""
+
+	def __init__(self, cache_dir: str = os.path.join(".", "data", "cache", "documents")) -> None:
+		"""
+		:param cache_dir: Folder where the cache entries are written
+		"""
+		self.cache_dir: str = cache_dir
+		os.makedirs(self.cache_dir, exist_ok=True)
+
+	@staticmethod
+	def get_key(input_path: str, backend: str) -> str:
+		"""Obtains the cache key of a document
+
+		:param input_path: Path of the .docx file
+		:param backend: NaiveDecisionParser backend
+		:return: SHA-256 hex digest key
+		"""
+		key = sha256()
+		with open(input_path, "rb") as f:
+			for chunk in iter(lambda: f.read(1 << 20), b""):
+				key.update(chunk)
+		key.update(f"\x00{NAIVE_DECISION_PARSER_VERSION}\x00{backend}".encode("utf-8"))
+		return key.hexdigest()
+
+	def get_entry_path(self, key: str) -> str:
+		"""Path of the cache entry of a key
+
+		:param key: Cache key
+		:return: Cache entry path
+		"""
+		return os.path.join(self.cache_dir, f"{key}.json")
+
+	def get(self, key: str) -> NaiveDecisionParserDocument | None:
+		"""Loads a cached parsed document
+
+		:param key: Cache key
+		:return: Structured document content, None if not cached
+		"""
+		entry_path = self.get_entry_path(key=key)
+		if not os.path.isfile(entry_path):
+			return None
+
+		with open(entry_path, "r", encoding="utf-8") as f:
+			entry = json.load(f)
+		if entry.get("parser_version") != NAIVE_DECISION_PARSER_VERSION:
+			return None
+		return document_from_node_table(node_table=entry["nodes"])
+
+	def set(self, key: str, doc_content: NaiveDecisionParserDocument, input_path: str | None = None) -> None:
+		"""Stores a parsed document (atomically, so concurrent runs never read partial entries)
+
+		:param key: Cache key
+		:param doc_content: Structured document content
+		:param input_path: Path of the .docx file, kept for reference
+		"""
+		entry = {
+			"parser_version": NAIVE_DECISION_PARSER_VERSION,
+			"source": os.path.basename(input_path) if input_path is not None else None,
+			"nodes": document_to_node_table(doc_content=doc_content)
+		}
+		fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+		with os.fdopen(fd, "w", encoding="utf-8") as f:
+			json.dump(entry, f, ensure_ascii=False)
+		os.replace(tmp_path, self.get_entry_path(key=key))
+
+	def load_or_parse(
+			self, input_path: str, backend: Literal["libreoffice", "docx"] = "libreoffice",
+			output_dir: str | None = None, libreoffice_profile: str | None = None
+		) -> NaiveDecisionParserDocument:
+		"""Loads the parsed document from the cache, parsing (and caching) it on a miss
+
+		:param input_path: Path of the .docx file
+		:param backend: NaiveDecisionParser backend used on a miss
+		:param output_dir: Folder of the libreoffice .txt export on a miss, if None the cache folder.
+		 Each miss converts into a temporary folder of its own (deleted once parsed), so that a .txt left by
+		 another conversion (e.g. of a previous revision with the same file name) is never cached under this key
+		:param libreoffice_profile: LibreOffice user profile of the conversion on a miss (see NaiveDecisionParser)
+		:return: Structured document content
+		"""
+		key = self.get_key(input_path=input_path, backend=backend)
+		doc_content = self.get(key=key)
+		if doc_content is None:
+			output_dir = output_dir if output_dir is not None else self.cache_dir
+			os.makedirs(output_dir, exist_ok=True)
+			with tempfile.TemporaryDirectory(dir=output_dir, prefix="convert-") as conversion_dir:
+				doc_content = NaiveDecisionParser(
+					input_path=input_path, backend=backend, output_dir=conversion_dir,
+					libreoffice_profile=libreoffice_profile
+				).doc_content
+			self.set(key=key, doc_content=doc_content, input_path=input_path)
+		return doc_content
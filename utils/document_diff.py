@@ -0,0 +1,160 @@
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Literal
+
+from parser import NaiveDecisionParserDocument, NaiveDecisionParserNodeTable
+
+
+NodeStatus = Literal["unchanged", "modified", "renumbered", "added"]
+
+
+def get_node_table(doc_content: NaiveDecisionParserDocument) -> NaiveDecisionParserNodeTable:
+	"""Node table of a structured document (the one it is bound to, if any)
+
+	:param doc_content: Structured document content
+	:return: Node table
+	"""
+	if len(doc_content) != 0 and doc_content[0].node_table is not None:
+		return doc_content[0].node_table
+	return NaiveDecisionParserNodeTable.from_document(doc_content=doc_content)
+
+
+class DocumentDiff:
+	"""
+	Diff between two revisions of a structured document, matching the nodes of the new revision to the old one:
+	 1. same numbering path and same text: "unchanged"
+	 2. same level and same text elsewhere in the document: "renumbered"
+	 3. same numbering path and similar text: "modified"
+	 4. otherwise: "added" (unmatched old nodes are "removed")
+	A new node is dirty when it is not unchanged or when its children changed (a child was removed or moved).
+	Evaluations of a node are only valid for the new revision when neither the node nor any of its ancestors
+	 is dirty (its rendered context, which includes every ancestor numbering and text, is the same),
+	 so the tree search only has to be run again on the subtrees of the dirty roots (topmost dirty nodes).
+	"""
+
+	def __init__(
+			self, old_doc_content: NaiveDecisionParserDocument, new_doc_content: NaiveDecisionParserDocument,
+			similarity_threshold: float = 0.8
+		) -> None:
+		"""
+		:param old_doc_content: Previous revision of the document
+		:param new_doc_content: New revision of the document
+		:param similarity_threshold: Minimum text similarity (difflib ratio) of a node modified in place
+		"""
+		self.old: NaiveDecisionParserNodeTable = get_node_table(doc_content=old_doc_content)
+		self.new: NaiveDecisionParserNodeTable = get_node_table(doc_content=new_doc_content)
+		self.similarity_threshold: float = similarity_threshold
+
+		self.status: list[NodeStatus] = ["added"] * len(self.new)
+		# Old node id of each matched new node id
+		self.new_to_old: dict[int, int] = {}
+		self._match()
+		self.removed: list[int] = sorted(set(range(len(self.old))) - set(self.new_to_old.values()))
+		self._mark_dirty()
+
+	@staticmethod
+	def _get_numbering_paths(node_table: NaiveDecisionParserNodeTable) -> list[tuple[str, ...]]:
+		numbering_paths: list[tuple[str, ...]] = []
+		for parent, numbering in zip(node_table.parents, node_table.numberings):
+			numbering_paths.append((numbering_paths[parent] if parent != -1 else ()) + (numbering,))
+		return numbering_paths
+
+	def _match(self) -> None:
+		"""Matches the new nodes to the old ones (see the class description)
+		"""
+		old_paths = self._get_numbering_paths(node_table=self.old)
+		new_paths = self._get_numbering_paths(node_table=self.new)
+		old_by_path: dict[tuple[str, ...], int] = {}
+		for old_id, path in enumerate(old_paths):
+			old_by_path.setdefault(path, old_id)
+		matched_old: set[int] = set()
+
+		def match(new_id: int, old_id: int, status: NodeStatus) -> None:
+			self.new_to_old[new_id] = old_id
+			self.status[new_id] = status
+			matched_old.add(old_id)
+
+		for new_id, path in enumerate(new_paths):
+			old_id = old_by_path.get(path)
+			if old_id is not None and old_id not in matched_old and self.old.texts[old_id] == self.new.texts[new_id]:
+				match(new_id=new_id, old_id=old_id, status="unchanged")
+
+		# Texts moved elsewhere (e.g. paragraphs renumbered after an insertion), in document order
+		old_by_text: dict[tuple[int, str], list[int]] = {}
+		for old_id in range(len(self.old) - 1, -1, -1):
+			if old_id not in matched_old:
+				old_by_text.setdefault((self.old.levels[old_id], self.old.texts[old_id]), []).append(old_id)
+		for new_id in range(len(self.new)):
+			if new_id not in self.new_to_old:
+				candidates = old_by_text.get((self.new.levels[new_id], self.new.texts[new_id]))
+				if candidates:
+					match(new_id=new_id, old_id=candidates.pop(), status="renumbered")
+
+		for new_id, path in enumerate(new_paths):
+			old_id = old_by_path.get(path)
+			if new_id in self.new_to_old or old_id is None or old_id in matched_old:
+				continue
+			if self.old.levels[old_id] != self.new.levels[new_id]:
+				continue
+			if SequenceMatcher(None, self.old.texts[old_id], self.new.texts[new_id]).ratio() >= self.similarity_threshold:
+				match(new_id=new_id, old_id=old_id, status="modified")
+
+	def _mark_dirty(self) -> None:
+		"""Marks the dirty nodes, the nodes in a dirty subtree and the nodes with a dirty descendant
+		"""
+		old_children: list[list[int]] = [[] for _ in range(len(self.old))]
+		for old_id, parent in enumerate(self.old.parents):
+			if parent != -1:
+				old_children[parent].append(old_id)
+		new_children: list[list[int]] = [[] for _ in range(len(self.new))]
+		for new_id, parent in enumerate(self.new.parents):
+			if parent != -1:
+				new_children[parent].append(new_id)
+
+		self.dirty: list[bool] = []
+		for new_id in range(len(self.new)):
+			if self.status[new_id] != "unchanged":
+				self.dirty.append(True)
+				continue
+			children = [self.new_to_old.get(child) for child in new_children[new_id]]
+			self.dirty.append(children != old_children[self.new_to_old[new_id]])
+
+		# Parents come before their children in pre-order
+		self.in_dirty_subtree: list[bool] = []
+		for new_id, parent in enumerate(self.new.parents):
+			self.in_dirty_subtree.append(self.dirty[new_id] or (parent != -1 and self.in_dirty_subtree[parent]))
+		self.dirty_roots: list[int] = [
+			new_id for new_id, parent in enumerate(self.new.parents)
+			if self.dirty[new_id] and (parent == -1 or not self.in_dirty_subtree[parent])
+		]
+		self.has_dirty_descendant: list[bool] = [False] * len(self.new)
+		for new_id in range(len(self.new) - 1, -1, -1):
+			parent = self.new.parents[new_id]
+			if parent != -1 and (self.in_dirty_subtree[new_id] or self.has_dirty_descendant[new_id]):
+				self.has_dirty_descendant[parent] = True
+
+		self.old_to_clean_new: dict[int, int] = {
+			old_id: new_id for new_id, old_id in self.new_to_old.items() if not self.in_dirty_subtree[new_id]
+		}
+
+	def carry_over(self, old_node_id: int) -> int | None:
+		"""New node whose evaluations are the same as the given old node (same rendered context)
+
+		:param old_node_id: Node id in the old revision
+		:return: Node id in the new revision, None if the node was removed or its context changed
+		"""
+		return self.old_to_clean_new.get(old_node_id)
+
+	def report(self) -> str:
+		"""Report of the differences
+
+		:return: Human readable report
+		"""
+		counts = Counter(self.status)
+		n_clean = len(self.new) - sum(self.in_dirty_subtree)
+		return (
+			f"Document diff: {counts['unchanged']} unchanged, {counts['modified']} modified, "
+			f"{counts['renumbered']} renumbered, {counts['added']} added, {len(self.removed)} removed nodes; "
+			f"{n_clean} of {len(self.new)} nodes keep their evaluations, "
+			f"{len(self.dirty_roots)} changed subtrees to be searched again"
+		)
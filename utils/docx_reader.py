@@ -0,0 +1,292 @@
+import re
+import zipfile
+from typing import Iterator
+from xml.etree.ElementTree import Element, iterparse
+
+from utils.exceptions import DocxFormatError
+
+
+W_NAMESPACE: str = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _w(tag: str) -> str:
+	"""Qualified WordprocessingML tag name
+	"""
+	return f"{W_NAMESPACE}{tag}"
+
+
+def _to_roman(number: int) -> str:
+	"""Uppercase roman numeral of a positive integer
+	"""
+	numerals = (
+		(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+		(50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")
+	)
+	roman = ""
+	for value, numeral in numerals:
+		while number >= value:
+			roman += numeral
+			number -= value
+	return roman
+
+
+def _to_letter(number: int) -> str:
+	"""Uppercase letter numbering of a positive integer as Word does it (A, ..., Z, AA, ..., ZZ, AAA...)
+	"""
+	return chr(ord("A") + (number - 1) % 26) * ((number - 1) // 26 + 1)
+
+
+class DocxNumberingLevel:
+	__slots__ = ("start", "num_fmt", "lvl_text", "lvl_restart")
+
+	def __init__(
+			self, start: int = 1, num_fmt: str = "decimal", lvl_text: str = "", lvl_restart: int | None = None
+		) -> None:
+		self.start: int = start
+		self.num_fmt: str = num_fmt
+		self.lvl_text: str = lvl_text
+		# One-based level after which this level restarts (None: after any higher level, 0: never)
+		self.lvl_restart: int | None = lvl_restart
+
+	def restarts_after(self, ilvl: int) -> bool:
+		"""Whether this (deeper) level restarts its counter after an item of the given level
+		"""
+		if self.lvl_restart is None:
+			return True
+		return ilvl < self.lvl_restart
+
+	def format(self, number: int) -> str:
+		"""Formats a counter value following the level number format
+		"""
+		match self.num_fmt:
+			case "upperRoman":
+				return _to_roman(number)
+			case "lowerRoman":
+				return _to_roman(number).lower()
+			case "upperLetter":
+				return _to_letter(number)
+			case "lowerLetter":
+				return _to_letter(number).lower()
+			case "bullet" | "none":
+				return ""
+			case _:
+				return str(number)
+
+
+class DocxReader:
+	"""
+	Pure Python .docx reader that streams word/document.xml with an incremental XML parser
+	 and emulates the LibreOffice .txt export used by NaiveDecisionParser:
+	 each paragraph becomes a line, and list paragraphs are prefixed by one indentation level
+	 (4 spaces) per list level plus one, followed by their numbering label and a tab.
+	List levels are recovered from w:numPr/w:ilvl (directly or through the paragraph style)
+	 and numbering labels are computed from word/numbering.xml.
+	"""
+
+	def __init__(self, input_path: str) -> None:
+		"""
+		:param input_path: Path of the input .docx file
+		"""
+		self.input_path: str = input_path
+
+	def _read_numbering(
+			self, docx: zipfile.ZipFile
+		) -> tuple[dict[str, str], dict[str, dict[int, DocxNumberingLevel]], dict[str, dict[int, int]]]:
+		"""Reads the numbering definitions of word/numbering.xml
+
+		:param docx: Opened .docx file
+		:return: abstractNumId of each numId, levels of each abstractNumId
+		 and start overrides of each numId
+		"""
+		num_abstract: dict[str, str] = {}
+		abstract_levels: dict[str, dict[int, DocxNumberingLevel]] = {}
+		num_start_overrides: dict[str, dict[int, int]] = {}
+		if "word/numbering.xml" not in docx.namelist():
+			return num_abstract, abstract_levels, num_start_overrides
+
+		with docx.open("word/numbering.xml") as f:
+			for _, element in iterparse(f, events=("end",)):
+				if element.tag == _w("abstractNum"):
+					levels: dict[int, DocxNumberingLevel] = {}
+					for lvl in element.iter(_w("lvl")):
+						start = lvl.find(_w("start"))
+						num_fmt = lvl.find(_w("numFmt"))
+						lvl_text = lvl.find(_w("lvlText"))
+						lvl_restart = lvl.find(_w("lvlRestart"))
+						levels[int(lvl.get(_w("ilvl"), "0"))] = DocxNumberingLevel(
+							start=int(start.get(_w("val"), "1")) if start is not None else 1,
+							num_fmt=num_fmt.get(_w("val"), "decimal") if num_fmt is not None else "decimal",
+							lvl_text=lvl_text.get(_w("val"), "") if lvl_text is not None else "",
+							lvl_restart=int(lvl_restart.get(_w("val"), "0")) if lvl_restart is not None else None
+						)
+					abstract_levels[element.get(_w("abstractNumId"))] = levels
+					element.clear()
+				elif element.tag == _w("num"):
+					abstract_num_id = element.find(_w("abstractNumId"))
+					if abstract_num_id is not None:
+						num_abstract[element.get(_w("numId"))] = abstract_num_id.get(_w("val"))
+					overrides: dict[int, int] = {}
+					for lvl_override in element.iter(_w("lvlOverride")):
+						start_override = lvl_override.find(_w("startOverride"))
+						if start_override is not None:
+							overrides[int(lvl_override.get(_w("ilvl"), "0"))] = int(start_override.get(_w("val"), "1"))
+					if len(overrides) != 0:
+						num_start_overrides[element.get(_w("numId"))] = overrides
+					element.clear()
+
+		return num_abstract, abstract_levels, num_start_overrides
+
+	@staticmethod
+	def _read_style_numbering(docx: zipfile.ZipFile) -> dict[str, tuple[str, int]]:
+		"""Reads the numbering properties inherited from paragraph styles (e.g. numbered headings)
+
+		:param docx: Opened .docx file
+		:return: (numId, ilvl) of each numbered paragraph style
+		"""
+		style_numbering: dict[str, tuple[str | None, int | None]] = {}
+		based_on: dict[str, str] = {}
+		if "word/styles.xml" not in docx.namelist():
+			return {}
+
+		with docx.open("word/styles.xml") as f:
+			for _, element in iterparse(f, events=("end",)):
+				if element.tag == _w("style"):
+					style_id = element.get(_w("styleId"))
+					num_pr = element.find(f"{_w('pPr')}/{_w('numPr')}")
+					if num_pr is not None:
+						num_id = num_pr.find(_w("numId"))
+						ilvl = num_pr.find(_w("ilvl"))
+						style_numbering[style_id] = (
+							num_id.get(_w("val")) if num_id is not None else None,
+							int(ilvl.get(_w("val"), "0")) if ilvl is not None else None
+						)
+					parent_style = element.find(_w("basedOn"))
+					if parent_style is not None:
+						based_on[style_id] = parent_style.get(_w("val"))
+					element.clear()
+
+		# Resolve the style inheritance chain
+		resolved: dict[str, tuple[str, int]] = {}
+		for style_id in set(style_numbering) | set(based_on):
+			num_id, ilvl = None, None
+			current_style, visited = style_id, set()
+			while current_style is not None and current_style not in visited and (num_id is None or ilvl is None):
+				visited.add(current_style)
+				_num_id, _ilvl = style_numbering.get(current_style, (None, None))
+				num_id = num_id if num_id is not None else _num_id
+				ilvl = ilvl if ilvl is not None else _ilvl
+				current_style = based_on.get(current_style)
+			if num_id is not None:
+				resolved[style_id] = (num_id, ilvl if ilvl is not None else 0)
+		return resolved
+
+	@staticmethod
+	def _get_paragraph_text(paragraph: Element) -> str:
+		"""Plain text of a paragraph (tracked deletions are not included)
+
+		:param paragraph: w:p element
+		:return: Paragraph text
+		"""
+		chunks: list[str] = []
+		for element in paragraph.iter():
+			if element.tag == _w("t"):
+				chunks.append(element.text or "")
+			elif element.tag == _w("tab"):
+				chunks.append("\t")
+			elif element.tag in (_w("br"), _w("cr")):
+				chunks.append(" ")
+			elif element.tag == _w("noBreakHyphen"):
+				chunks.append("-")
+		return "".join(chunks)
+
+	def __iter__(self) -> Iterator[str]:
+		"""Streams the lines of the document
+
+		:raises DocxFormatError: If the file is not a valid .docx document
+		:return: Iterator over the document lines
+		"""
+		try:
+			docx = zipfile.ZipFile(self.input_path)
+		except zipfile.BadZipFile as e:
+			raise DocxFormatError(f"The file {self.input_path} is not a valid .docx file: {e}")
+
+		with docx:
+			if "word/document.xml" not in docx.namelist():
+				raise DocxFormatError(f"The file {self.input_path} has no word/document.xml")
+
+			num_abstract, abstract_levels, num_start_overrides = self._read_numbering(docx=docx)
+			style_numbering = self._read_style_numbering(docx=docx)
+
+			counters: dict[str, dict[int, int]] = {}
+			started_nums: set[str] = set()
+			with docx.open("word/document.xml") as f:
+				for _, element in iterparse(f, events=("end",)):
+					if element.tag != _w("p"):
+						continue
+
+					text = self._get_paragraph_text(paragraph=element)
+					num_id, ilvl = self._get_paragraph_numbering(paragraph=element, style_numbering=style_numbering)
+					element.clear()
+
+					abstract_num_id = num_abstract.get(num_id) if num_id is not None else None
+					if abstract_num_id is None or abstract_num_id not in abstract_levels:
+						yield f"{text}\n"
+						continue
+
+					levels = abstract_levels[abstract_num_id]
+					level_counters = counters.setdefault(abstract_num_id, {})
+					if num_id not in started_nums:
+						started_nums.add(num_id)
+						for override_ilvl, start in num_start_overrides.get(num_id, {}).items():
+							level_counters[override_ilvl] = start - 1
+					level = levels.get(ilvl, DocxNumberingLevel())
+					level_counters[ilvl] = level_counters.get(ilvl, level.start - 1) + 1
+					# Deeper levels restart after a higher level item (unless stated otherwise by w:lvlRestart)
+					for deeper_ilvl in [_ilvl for _ilvl in level_counters if _ilvl > ilvl]:
+						if levels.get(deeper_ilvl, DocxNumberingLevel()).restarts_after(ilvl=ilvl):
+							del level_counters[deeper_ilvl]
+
+					label = re.sub(
+						r"%(\d)",
+						lambda match: levels.get(int(match.group(1)) - 1, DocxNumberingLevel()).format(
+							level_counters.get(
+								int(match.group(1)) - 1, levels.get(int(match.group(1)) - 1, DocxNumberingLevel()).start
+							)
+						),
+						level.lvl_text
+					)
+					yield f"{'    ' * (ilvl + 1)}{label}\t{text}\n"
+
+	@staticmethod
+	def _get_paragraph_numbering(
+			paragraph: Element, style_numbering: dict[str, tuple[str, int]]
+		) -> tuple[str | None, int]:
+		"""Obtains the list (numId) and list level (ilvl) of a paragraph,
+		 from its own numbering properties or its style ones
+
+		:param paragraph: w:p element
+		:param style_numbering: (numId, ilvl) of each numbered paragraph style
+		:return: numId (None if not numbered) and ilvl
+		"""
+		num_id, ilvl = None, None
+		p_pr = paragraph.find(_w("pPr"))
+		if p_pr is not None:
+			style = p_pr.find(_w("pStyle"))
+			if style is not None and style.get(_w("val")) in style_numbering:
+				num_id, ilvl = style_numbering[style.get(_w("val"))]
+			num_pr = p_pr.find(_w("numPr"))
+			if num_pr is not None:
+				_num_id = num_pr.find(_w("numId"))
+				_ilvl = num_pr.find(_w("ilvl"))
+				if _num_id is not None:
+					num_id = _num_id.get(_w("val"))
+				if _ilvl is not None:
+					ilvl = int(_ilvl.get(_w("val"), "0"))
+
+		# numId 0 removes the numbering
+		if num_id == "0":
+			num_id = None
+		return num_id, ilvl if ilvl is not None else 0
+
+	def __call__(self) -> list[str]:
+		return list(self)
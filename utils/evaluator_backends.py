@@ -0,0 +1,304 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from hashlib import sha256
+from typing import Any
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from utils.exceptions import SimulatedRateLimitError
+from utils.lexical_index import tokenize
+from utils.prompts import (
+	MENTION_TREE_SEARCH_EVALUATOR_PROMPT, MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT, MENTION_TREE_SEARCH_PACKED_FRAGMENT
+)
+from utils.request_schemas import (
+	MentionTreeSearchEvaluator, MentionTreeSearchFragmentEvaluator, MentionTreeSearchPackedEvaluator
+)
+from utils.token_counter import estimate_tokens
+
+
+# Evaluator prompt around the document and intervention placeholders
+_PROMPT_PREFIX, _PROMPT_REST = MENTION_TREE_SEARCH_EVALUATOR_PROMPT.split("{document}")
+_PROMPT_MIDDLE, _PROMPT_SUFFIX = _PROMPT_REST.split("{intervention}")
+_PACKED_PROMPT_PREFIX, _PACKED_PROMPT_REST = MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT.split("{documents}")
+_PACKED_PROMPT_MIDDLE, _PACKED_PROMPT_SUFFIX = _PACKED_PROMPT_REST.split("{intervention}")
+_PACKED_FRAGMENT_REGEX = re.compile(
+	re.escape(MENTION_TREE_SEARCH_PACKED_FRAGMENT).replace(
+		re.escape("{fragment_id}"), r"(?P<fragment_id>\d+)"
+	).replace(re.escape("{document}"), r"(?P<document>.*?)"),
+	re.DOTALL
+)
+# Deepest "#Level numbering#: text" line of a rendered document text
+_FRAGMENT_LINE_REGEX = re.compile(r"#(?P<level>\w+) (?P<numbering>[^#]*)#: (?P<text>[^\n]*)$")
+
+
+def parse_evaluator_prompt(prompt: list[dict] | str) -> tuple[str, str]:
+	"""Recovers the rendered document text and the intervention paragraph of an evaluator prompt
+
+	:param prompt: Evaluator prompt messages (see NegotiationDocumentToTranscriptMatching._get_messages) or its text
+	:raises ValueError: If the prompt was not rendered from MENTION_TREE_SEARCH_EVALUATOR_PROMPT
+	:return: (document, intervention) pair
+	"""
+	content: str = prompt if isinstance(prompt, str) else prompt[-1]["content"]
+	if not (content.startswith(_PROMPT_PREFIX) and content.endswith(_PROMPT_SUFFIX)):
+		raise ValueError("Prompt not rendered from MENTION_TREE_SEARCH_EVALUATOR_PROMPT")
+	document, _, intervention = content[len(_PROMPT_PREFIX):len(content) - len(_PROMPT_SUFFIX)].rpartition(_PROMPT_MIDDLE)
+	return document, intervention
+
+
+def is_packed_evaluator_prompt(prompt: list[dict] | str) -> bool:
+	"""Checks whether an evaluator prompt was rendered from MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT
+
+	:param prompt: Evaluator prompt messages or its text
+	:return: Whether the prompt is packed
+	"""
+	content: str = prompt if isinstance(prompt, str) else prompt[-1]["content"]
+	return content.startswith(_PACKED_PROMPT_PREFIX) and content.endswith(_PACKED_PROMPT_SUFFIX)
+
+
+def parse_packed_evaluator_prompt(prompt: list[dict] | str) -> tuple[list[str], str]:
+	"""Recovers the rendered document texts and the intervention paragraph of a packed evaluator prompt
+
+	:param prompt: Packed evaluator prompt messages
+	 (see NegotiationDocumentToTranscriptMatching._get_packed_messages) or its text
+	:raises ValueError: If the prompt was not rendered from MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT
+	:return: Document texts (by fragment id) and intervention
+	"""
+	if not is_packed_evaluator_prompt(prompt=prompt):
+		raise ValueError("Prompt not rendered from MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT")
+	content: str = prompt if isinstance(prompt, str) else prompt[-1]["content"]
+	fragments, _, intervention = content[
+		len(_PACKED_PROMPT_PREFIX):len(content) - len(_PACKED_PROMPT_SUFFIX)
+	].rpartition(_PACKED_PROMPT_MIDDLE)
+	documents = {
+		int(match.group("fragment_id")): match.group("document") for match in _PACKED_FRAGMENT_REGEX.finditer(fragments)
+	}
+	return [documents[fragment_id] for fragment_id in sorted(documents)], intervention
+
+
+def get_fixture_key(document: str, intervention: str) -> str:
+	"""Obtains the key of a recorded evaluation
+
+	:param document: Rendered document text
+	:param intervention: Intervention paragraph
+	:return: SHA-256 hex digest key
+	"""
+	return sha256(f"{document}\x00{intervention}".encode("utf-8")).hexdigest()
+
+
+class FakeMentionTreeSearchEvaluator(Runnable):
+	"""
+	Deterministic offline stand-in of the mention tree search evaluator LLM,
+	 to run and benchmark the tree search without any API.
+
+	Verdicts are taken from recorded fixtures when available, otherwise from a seeded rule:
+	 the document text contains a mention if it shares at least min_overlap words with the intervention
+	 (or, with probability positive_rate, at random), DIRECT if its numbering is quoted by the intervention.
+	Every random draw is seeded by the seed and the prompt itself, so verdicts, latencies and rate limits
+	 do not depend on the order or concurrency of the calls.
+	Packed prompts get the same verdict for each fragment as its own prompt,
+	 and with probability packed_error_rate one of them is dropped or duplicated (as a LLM may do).
+	"""
+
+	def __init__(
+			self, seed: int = 0, fixtures: dict[str, MentionTreeSearchEvaluator] | None = None,
+			min_overlap: int = 2, positive_rate: float = 0.05,
+			latency: float = 0.0, jitter: float = 0.0, rate_limit_rate: float = 0.0, packed_error_rate: float = 0.0
+		) -> None:
+		"""
+		:param seed: Random seed of the rule, latencies and rate limits
+		:param fixtures: Recorded evaluations by fixture key (see get_fixture_key)
+		:param min_overlap: Minimum number of shared words for a mention
+		:param positive_rate: Probability of a mention regardless of the shared words
+		:param latency: Mean simulated latency of a call (seconds)
+		:param jitter: Maximum deviation from the mean latency (seconds)
+		:param rate_limit_rate: Probability of a call failing with SimulatedRateLimitError (HTTP 429)
+		:param packed_error_rate: Probability of a packed answer missing or duplicating a fragment evaluation
+		"""
+		self.seed: int = seed
+		self.fixtures: dict[str, MentionTreeSearchEvaluator] = fixtures if fixtures is not None else {}
+		self.min_overlap: int = min_overlap
+		self.positive_rate: float = positive_rate
+		self.latency: float = latency
+		self.jitter: float = jitter
+		self.rate_limit_rate: float = rate_limit_rate
+		self.packed_error_rate: float = packed_error_rate
+
+		self.calls: int = 0
+		self.rate_limited: int = 0
+		self.prompt_tokens: int = 0
+		self.completion_tokens: int = 0
+		self._attempts: dict[str, int] = {}
+		self._lock = threading.Lock()
+
+	@classmethod
+	def from_fixtures(cls, path: str, **kwargs: Any) -> "FakeMentionTreeSearchEvaluator":
+		"""Loads the recorded evaluations of a JSONL fixtures file (see MentionTreeSearchFixtureRecorder)
+
+		:param path: Path of the fixtures file
+		:param kwargs: FakeMentionTreeSearchEvaluator parameters
+		:return: Fake evaluator replaying the fixtures
+		"""
+		fixtures: dict[str, MentionTreeSearchEvaluator] = {}
+		with open(path, "r", encoding="utf-8") as f:
+			for line in f:
+				if line.strip() == "":
+					continue
+				record = json.loads(line)
+				fixtures[get_fixture_key(document=record["document"], intervention=record["intervention"])] = (
+					MentionTreeSearchEvaluator(**record["evaluation"])
+				)
+		return cls(fixtures=fixtures, **kwargs)
+
+	def _rule(self, document: str, intervention: str, rng: random.Random) -> MentionTreeSearchEvaluator:
+		"""Seeded rule verdict of a document text
+
+		:param document: Rendered document text
+		:param intervention: Intervention paragraph
+		:param rng: Random generator of the prompt
+		:return: Evaluation
+		"""
+		match = _FRAGMENT_LINE_REGEX.search(document)
+		fragment_text: str = match.group("text") if match is not None else document
+		number: str = match.group("numbering").strip("().") if match is not None else ""
+
+		if number != "" and re.search(rf"\b(?:paragraph|section)s?\s+{re.escape(number)}\b", intervention, re.IGNORECASE):
+			return MentionTreeSearchEvaluator(contains_mention=True, textual_reference=number, mention_type="DIRECT")
+
+		shared_words = set(tokenize(fragment_text)) & set(tokenize(intervention))
+		if len(shared_words) >= self.min_overlap or rng.random() < self.positive_rate:
+			return MentionTreeSearchEvaluator(
+				contains_mention=True, textual_reference=" ".join(sorted(shared_words)), mention_type="INDIRECT"
+			)
+		return MentionTreeSearchEvaluator(contains_mention=False, textual_reference="", mention_type="INDIRECT")
+
+	def _evaluate_document(self, document: str, intervention: str) -> MentionTreeSearchEvaluator:
+		"""Recorded or rule verdict of a document text
+
+		:param document: Rendered document text
+		:param intervention: Intervention paragraph
+		:return: Evaluation
+		"""
+		key = get_fixture_key(document=document, intervention=intervention)
+		evaluation = self.fixtures.get(key)
+		if evaluation is None:
+			evaluation = self._rule(document=document, intervention=intervention, rng=random.Random(f"{self.seed}:{key}"))
+		return evaluation
+
+	def _call(
+			self, input: list[dict] | str
+		) -> tuple[MentionTreeSearchEvaluator | MentionTreeSearchPackedEvaluator | None, float]:
+		"""Evaluates a (packed) prompt, simulating its latency and rate limits
+
+		:param input: Evaluator prompt
+		:return: Evaluation (None if rate limited) and simulated latency
+		"""
+		packed = is_packed_evaluator_prompt(prompt=input)
+		if packed:
+			documents, intervention = parse_packed_evaluator_prompt(prompt=input)
+			key = get_fixture_key(document="\x00".join(documents), intervention=intervention)
+		else:
+			document, intervention = parse_evaluator_prompt(prompt=input)
+			key = get_fixture_key(document=document, intervention=intervention)
+		with self._lock:
+			attempt = self._attempts.get(key, 0)
+			self._attempts[key] = attempt + 1
+
+		call_rng = random.Random(f"{self.seed}:{key}:{attempt}")
+		latency = max(0.0, self.latency + call_rng.uniform(-self.jitter, self.jitter))
+		if call_rng.random() < self.rate_limit_rate:
+			with self._lock:
+				self.rate_limited += 1
+			return None, latency
+
+		if packed:
+			fragment_evaluations = [
+				MentionTreeSearchFragmentEvaluator(
+					fragment_id=fragment_id,
+					**self._evaluate_document(document=document, intervention=intervention).model_dump()
+				)
+				for fragment_id, document in enumerate(documents)
+			]
+			if len(fragment_evaluations) != 0 and call_rng.random() < self.packed_error_rate:
+				fragment_id = call_rng.randrange(len(fragment_evaluations))
+				if call_rng.random() < 0.5:
+					del fragment_evaluations[fragment_id]
+				else:
+					fragment_evaluations.append(fragment_evaluations[fragment_id])
+			evaluation = MentionTreeSearchPackedEvaluator(evaluations=fragment_evaluations)
+		else:
+			evaluation = self._evaluate_document(document=document, intervention=intervention)
+		with self._lock:
+			self.calls += 1
+			self.prompt_tokens += estimate_tokens(input if isinstance(input, str) else input[-1]["content"])
+			self.completion_tokens += estimate_tokens(evaluation.model_dump_json())
+		return evaluation, latency
+
+	def invoke(
+			self, input: list[dict] | str, config: RunnableConfig | None = None, **kwargs: Any
+		) -> MentionTreeSearchEvaluator | MentionTreeSearchPackedEvaluator:
+		evaluation, latency = self._call(input=input)
+		time.sleep(latency)
+		if evaluation is None:
+			raise SimulatedRateLimitError("Rate limit reached (simulated HTTP 429)")
+		return evaluation
+
+	async def ainvoke(
+			self, input: list[dict] | str, config: RunnableConfig | None = None, **kwargs: Any
+		) -> MentionTreeSearchEvaluator | MentionTreeSearchPackedEvaluator:
+		evaluation, latency = self._call(input=input)
+		await asyncio.sleep(latency)
+		if evaluation is None:
+			raise SimulatedRateLimitError("Rate limit reached (simulated HTTP 429)")
+		return evaluation
+
+
+class MentionTreeSearchFixtureRecorder(Runnable):
+	"""
+	Wraps a (live) evaluator, appending every evaluation to a JSONL fixtures file
+	 that FakeMentionTreeSearchEvaluator.from_fixtures can replay offline.
+	"""
+
+	def __init__(self, evaluator: Runnable, path: str) -> None:
+		"""
+		:param evaluator: Evaluator to be recorded
+		:param path: Path of the fixtures file (appended to)
+		"""
+		self.evaluator: Runnable = evaluator
+		self.path: str = path
+		self._lock = threading.Lock()
+
+	def _record(
+			self, input: list[dict] | str, evaluation: MentionTreeSearchEvaluator | MentionTreeSearchPackedEvaluator
+		) -> None:
+		if is_packed_evaluator_prompt(prompt=input):
+			# Recorded by fragment, so that they can be replayed packed or not
+			documents, intervention = parse_packed_evaluator_prompt(prompt=input)
+			evaluations = [
+				(documents[fragment_evaluation.fragment_id], fragment_evaluation.model_dump(exclude={"fragment_id"}))
+				for fragment_evaluation in evaluation.evaluations if 0 <= fragment_evaluation.fragment_id < len(documents)
+			]
+		else:
+			document, intervention = parse_evaluator_prompt(prompt=input)
+			evaluations = [(document, evaluation.model_dump())]
+		with self._lock, open(self.path, "a", encoding="utf-8") as f:
+			for document, _evaluation in evaluations:
+				record = {"document": document, "intervention": intervention, "evaluation": _evaluation}
+				f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+	def invoke(
+			self, input: list[dict] | str, config: RunnableConfig | None = None, **kwargs: Any
+		) -> MentionTreeSearchEvaluator | MentionTreeSearchPackedEvaluator:
+		evaluation = self.evaluator.invoke(input, config, **kwargs)
+		self._record(input=input, evaluation=evaluation)
+		return evaluation
+
+	async def ainvoke(
+			self, input: list[dict] | str, config: RunnableConfig | None = None, **kwargs: Any
+		) -> MentionTreeSearchEvaluator | MentionTreeSearchPackedEvaluator:
+		evaluation = await self.evaluator.ainvoke(input, config, **kwargs)
+		self._record(input=input, evaluation=evaluation)
+		return evaluation
@@ -0,0 +1,219 @@
+import time
+import threading
+from hashlib import sha256
+
+from sqlalchemy import create_engine, delete, event, func, select, Boolean, Float, String, Text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+
+from utils.prompts import MENTION_TREE_SEARCH_EVALUATOR_PROMPT_VERSION, MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT_VERSION
+from utils.request_schemas import MentionTreeSearchEvaluator
+
+
+class _Base(DeclarativeBase):
+	pass
+
+
+class MentionTreeSearchEvaluatorCacheEntry(_Base):
+	__tablename__ = "mention_tree_search_evaluator_cache"
+
+	key: Mapped[str] = mapped_column(String(64), primary_key=True)
+	model_name: Mapped[str] = mapped_column(String(128))
+	prompt_version: Mapped[str] = mapped_column(String(64), index=True)
+	contains_mention: Mapped[bool] = mapped_column(Boolean)
+	textual_reference: Mapped[str] = mapped_column(Text)
+	mention_type: Mapped[str] = mapped_column(String(32))
+	last_access: Mapped[float] = mapped_column(Float, index=True)
+
+
+class MentionTreeSearchEvaluatorCache:
+	"""
+	Persistent (SQLite) cache of MentionTreeSearchEvaluator evaluations,
+	 keyed on the hash of the rendered document text, the intervention paragraph,
+	 the model name and the evaluator prompt version (the packed prompt version for the evaluations
+	 obtained in packed mode, so that packed and single evaluations are never mixed up).
+	When the cache exceeds max_entries, the least recently used entries are evicted.
+	The database is in WAL mode with a busy timeout, so that several processes (e.g. the shards of a session)
+	 can share it, and it can be used from worker threads (e.g. asyncio.to_thread).
+	"""
+
+	def __init__(
+			self, db_path: str = "mention_tree_search_cache.sqlite", model_name: str = "gpt-4o-mini",
+			prompt_version: str = MENTION_TREE_SEARCH_EVALUATOR_PROMPT_VERSION,
+			packed_prompt_version: str = MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT_VERSION,
+			max_entries: int | None = 100_000, timeout: float = 30.0
+		) -> None:
+		"""
+		:param db_path: Path of the SQLite database file
+		:param model_name: Name of the evaluator model, part of the key
+		:param prompt_version: Version of the evaluator prompt, part of the key
+		:param packed_prompt_version: Version of the packed evaluator prompt, part of the key of packed evaluations
+		:param max_entries: Maximum number of cached evaluations (None for unbounded)
+		:param timeout: Seconds waiting for the database lock of another writer before failing
+		"""
+		self.db_path: str = db_path
+		self.model_name: str = model_name
+		self.prompt_version: str = prompt_version
+		self.packed_prompt_version: str = packed_prompt_version
+		self.max_entries: int | None = max_entries
+
+		self.hits: int = 0
+		self.misses: int = 0
+		self._lock = threading.Lock()
+
+		self.engine = create_engine(f"sqlite:///{self.db_path}", connect_args={"timeout": timeout})
+		event.listen(self.engine, "connect", self._set_sqlite_pragmas)
+		try:
+			_Base.metadata.create_all(self.engine)
+		except OperationalError:
+			# Created concurrently by another process between the existence check and the creation
+			_Base.metadata.create_all(self.engine)
+
+	@staticmethod
+	def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+		"""Sets WAL mode on every new connection (readers do not block the writer nor the other way around)
+		"""
+		cursor = dbapi_connection.cursor()
+		cursor.execute("PRAGMA journal_mode=WAL")
+		cursor.execute("PRAGMA synchronous=NORMAL")
+		cursor.close()
+
+	def get_key(self, document: str, intervention: str, packed: bool = False) -> str:
+		"""Obtains the cache key of an evaluation
+
+		:param document: Rendered document text (as sent to the evaluator)
+		:param intervention: Intervention paragraph (as sent to the evaluator)
+		:param packed: Whether the evaluation is obtained in packed mode
+		:return: SHA-256 hex digest key
+		"""
+		key = sha256()
+		for part in (document, intervention, self.model_name, self.packed_prompt_version if packed else self.prompt_version):
+			key.update(part.encode("utf-8"))
+			key.update(b"\x00")
+		return key.hexdigest()
+
+	def get_many(self, keys: list[str], fallback_keys: list[str] | None = None) -> dict[str, MentionTreeSearchEvaluator]:
+		"""Looks up the evaluations of the given keys, refreshing their last access
+		 and updating the hit/miss counters
+
+		:param keys: Cache keys
+		:param fallback_keys: Key of each key whose evaluation is used when the key itself misses (e.g. the single
+		 prompt key of a packed mode key), counted as the same lookup
+		:return: Cached evaluations by key (misses are not included)
+		"""
+		if len(keys) == 0:
+			return {}
+
+		with Session(self.engine) as session:
+			entries = session.scalars(
+				select(MentionTreeSearchEvaluatorCacheEntry).where(
+					MentionTreeSearchEvaluatorCacheEntry.key.in_(set(keys) | set(fallback_keys or []))
+				)
+			).all()
+			now = time.time()
+			for entry in entries:
+				entry.last_access = now
+			cached = {
+				entry.key: MentionTreeSearchEvaluator(
+					contains_mention=entry.contains_mention,
+					textual_reference=entry.textual_reference,
+					mention_type=entry.mention_type
+				)
+				for entry in entries
+			}
+			session.commit()
+		if fallback_keys is not None:
+			cached = {
+				key: cached[key] if key in cached else cached[fallback_key]
+				for key, fallback_key in zip(keys, fallback_keys) if key in cached or fallback_key in cached
+			}
+
+		with self._lock:
+			n_hits = sum(key in cached for key in keys)
+			self.hits += n_hits
+			self.misses += len(keys) - n_hits
+		return cached
+
+	def set_many(self, evaluations: dict[str, MentionTreeSearchEvaluator], packed: bool = False) -> None:
+		"""Stores the given evaluations, evicting the least recently used entries
+		 if the size cap is exceeded
+
+		:param evaluations: Evaluations by key
+		:param packed: Whether the evaluations were obtained in packed mode (see get_key)
+		"""
+		if len(evaluations) == 0:
+			return
+
+		now = time.time()
+		rows = [
+			{
+				"key": key,
+				"model_name": self.model_name,
+				"prompt_version": self.packed_prompt_version if packed else self.prompt_version,
+				"contains_mention": evaluation.contains_mention,
+				"textual_reference": evaluation.textual_reference,
+				"mention_type": evaluation.mention_type,
+				"last_access": now
+			}
+			for key, evaluation in evaluations.items()
+		]
+		# Upsert in a single statement, as concurrent writers (threads or processes) may store the same keys
+		insert = sqlite_insert(MentionTreeSearchEvaluatorCacheEntry)
+		upsert = insert.on_conflict_do_update(
+			index_elements=[MentionTreeSearchEvaluatorCacheEntry.key],
+			set_={column: insert.excluded[column] for column in rows[0] if column != "key"}
+		)
+		with Session(self.engine) as session:
+			session.execute(upsert, rows)
+			self._evict(session=session)
+			session.commit()
+
+	def _evict(self, session: Session) -> None:
+		"""Evicts the least recently used entries exceeding max_entries
+
+		:param session: Open database session
+		"""
+		if self.max_entries is None:
+			return
+
+		n_entries: int = session.scalar(select(func.count()).select_from(MentionTreeSearchEvaluatorCacheEntry))
+		if n_entries > self.max_entries:
+			lru_keys = select(MentionTreeSearchEvaluatorCacheEntry.key).order_by(
+				MentionTreeSearchEvaluatorCacheEntry.last_access
+			).limit(n_entries - self.max_entries)
+			session.execute(
+				delete(MentionTreeSearchEvaluatorCacheEntry).where(MentionTreeSearchEvaluatorCacheEntry.key.in_(lru_keys))
+			)
+
+	def invalidate(self, prompt_version: str | None = None) -> int:
+		"""Deletes cached evaluations of outdated prompts
+
+		:param prompt_version: Prompt version to be invalidated,
+		 if None every version other than the current (single and packed) ones is invalidated
+		:return: Number of deleted entries
+		"""
+		if prompt_version is None:
+			condition = MentionTreeSearchEvaluatorCacheEntry.prompt_version.not_in(
+				[self.prompt_version, self.packed_prompt_version]
+			)
+		else:
+			condition = MentionTreeSearchEvaluatorCacheEntry.prompt_version == prompt_version
+
+		with Session(self.engine) as session:
+			result = session.execute(delete(MentionTreeSearchEvaluatorCacheEntry).where(condition))
+			session.commit()
+		return result.rowcount
+
+	def clear(self) -> None:
+		"""Deletes every cached evaluation and resets the counters
+		"""
+		with Session(self.engine) as session:
+			session.execute(delete(MentionTreeSearchEvaluatorCacheEntry))
+			session.commit()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self) -> int:
+		with Session(self.engine) as session:
+			return session.scalar(select(func.count()).select_from(MentionTreeSearchEvaluatorCacheEntry))
@@ -5,3 +5,17 @@ class IncorrectFileExtensionError(Exception):
 
 class FileNotFoundInError(Exception):
     pass
+
+
+# Decision Document Parser Errors
+class DocxFormatError(Exception):
+    pass
+
+
+class DocxConversionError(Exception):
+    pass
+
+
+# Mention Tree Search Evaluator Errors (simulated HTTP 429 of the offline evaluator backend)
+class SimulatedRateLimitError(Exception):
+    pass
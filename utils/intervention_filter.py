@@ -0,0 +1,356 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from hashlib import blake2b, sha256
+from typing import Literal
+
+import numpy as np
+from pydantic import BaseModel
+
+from utils.lexical_index import tokenize
+from utils.regex import (
+	PARAGRAPH_REFERENCE_REGEX, SECTION_REFERENCE_REGEX, PROCEDURAL_PHRASE_REGEX, POSITION_MARKER_REGEX, WORD_REGEX
+)
+
+
+# Modulus of the MinHash permutations (a * x + b fits in 64 bits for 32 bits hashes)
+_MINHASH_PRIME: int = (1 << 31) - 1
+
+
+class InterventionFilterDecision(BaseModel):
+	oid: int
+	# "match": sent to the tree search, "procedural": not matched, "duplicate": reuses the mentions of duplicate_of
+	action: Literal["match", "procedural", "duplicate"]
+	reason: str
+	n_words: int
+	n_content_words: int
+	procedural_probability: float | None = None
+	duplicate_of: int | None = None
+	similarity: float | None = None
+
+
+class ProceduralInterventionClassifier:
+	"""
+	Small logistic regression over hashed word unigrams and bigrams, telling procedural interventions
+	 (with no document content worth matching) from substantive ones.
+	It is trained on labeled interventions (e.g. reviewed InterventionFilter audit logs) and stored as a .npz file,
+	 its predictions are memoized by text hash.
+	"""
+
+	def __init__(self, n_features: int = 1 << 14, cache_size: int = 10_000) -> None:
+		"""
+		:param n_features: Number of hashed features
+		:param cache_size: Maximum number of memoized predictions
+		"""
+		self.n_features: int = n_features
+		self.weights: np.ndarray = np.zeros(n_features, dtype=np.float64)
+		self.bias: float = 0.0
+		self.cache_size: int = cache_size
+		self._cache: OrderedDict[str, float] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _get_features(self, text: str) -> np.ndarray:
+		"""Hashed feature indices of a text
+
+		:param text: Intervention text
+		:return: Feature indices (with repetitions)
+		"""
+		words = WORD_REGEX.findall(text.lower())
+		terms = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+		return np.array(
+			[int.from_bytes(blake2b(term.encode("utf-8"), digest_size=4).digest(), "little") % self.n_features for term in terms],
+			dtype=np.int64
+		)
+
+	def _get_matrix(self, texts: list[str]) -> np.ndarray:
+		"""Length normalized bag of hashed features of some texts
+
+		:param texts: Intervention texts
+		:return: Feature matrix (texts x features)
+		"""
+		matrix = np.zeros((len(texts), self.n_features), dtype=np.float64)
+		for i, text in enumerate(texts):
+			features = self._get_features(text=text)
+			if len(features) != 0:
+				np.add.at(matrix[i], features, 1 / np.sqrt(len(features)))
+		return matrix
+
+	def fit(
+			self, texts: list[str], labels: list[bool], epochs: int = 200, learning_rate: float = 1.0,
+			l2: float = 1e-4
+		) -> "ProceduralInterventionClassifier":
+		"""Trains the classifier with full batch gradient descent
+
+		:param texts: Intervention texts
+		:param labels: Whether each intervention is procedural
+		:param epochs: Gradient descent iterations
+		:param learning_rate: Gradient descent step
+		:param l2: L2 regularization strength
+		:return: The classifier itself
+		"""
+		matrix = self._get_matrix(texts=texts)
+		y = np.asarray(labels, dtype=np.float64)
+		for _ in range(epochs):
+			probabilities = 1 / (1 + np.exp(-(matrix @ self.weights + self.bias)))
+			error = probabilities - y
+			self.weights -= learning_rate * (matrix.T @ error / len(y) + l2 * self.weights)
+			self.bias -= learning_rate * float(error.mean())
+		with self._lock:
+			self._cache.clear()
+		return self
+
+	def predict_proba(self, text: str) -> float:
+		"""Probability of an intervention being procedural
+
+		:param text: Intervention text
+		:return: Probability
+		"""
+		key = sha256(text.encode("utf-8")).hexdigest()
+		with self._lock:
+			if key in self._cache:
+				self._cache.move_to_end(key)
+				return self._cache[key]
+
+		features = self._get_features(text=text)
+		score = self.bias + (
+			float(self.weights[features].sum() / np.sqrt(len(features))) if len(features) != 0 else 0.0
+		)
+		probability = float(1 / (1 + np.exp(-score)))
+		with self._lock:
+			self._cache[key] = probability
+			if len(self._cache) > self.cache_size:
+				self._cache.popitem(last=False)
+		return probability
+
+	def save(self, path: str) -> None:
+		"""Stores the classifier parameters
+
+		:param path: Path of the .npz file
+		"""
+		if os.path.dirname(path) != "":
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		np.savez(path, weights=self.weights, bias=np.array([self.bias]))
+
+	@classmethod
+	def load(cls, path: str, cache_size: int = 10_000) -> "ProceduralInterventionClassifier":
+		"""Loads a stored classifier
+
+		:param path: Path of the .npz file
+		:param cache_size: Maximum number of memoized predictions
+		:return: Classifier
+		"""
+		with np.load(path) as parameters:
+			classifier = cls(n_features=len(parameters["weights"]), cache_size=cache_size)
+			classifier.weights = parameters["weights"].astype(np.float64)
+			classifier.bias = float(parameters["bias"][0])
+		return classifier
+
+
+class MinHashIndex:
+	"""
+	MinHash signatures of word shingles with LSH banding, finding earlier texts whose
+	 estimated Jaccard similarity with a new text is over a threshold.
+	"""
+
+	def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 3, seed: int = 1) -> None:
+		"""
+		:param num_perm: Number of hash permutations (signature length)
+		:param bands: Number of LSH bands (num_perm must be a multiple),
+		 more bands find candidates with lower similarities
+		:param shingle_size: Words per shingle
+		:param seed: Random seed of the permutations
+		"""
+		if num_perm % bands != 0:
+			raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+		self.num_perm: int = num_perm
+		self.bands: int = bands
+		self.rows: int = num_perm // bands
+		self.shingle_size: int = shingle_size
+		rng = np.random.default_rng(seed)
+		self._a: np.ndarray = rng.integers(1, _MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+		self._b: np.ndarray = rng.integers(0, _MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+		self.signatures: dict[int, np.ndarray] = {}
+		self._buckets: dict[tuple[int, bytes], list[int]] = {}
+
+	def get_signature(self, text: str) -> np.ndarray | None:
+		"""MinHash signature of the word shingles of a text
+
+		:param text: Input text
+		:return: Signature, None if the text has no words
+		"""
+		words = WORD_REGEX.findall(text.lower())
+		if len(words) == 0:
+			return None
+		shingles = {
+			" ".join(words[i:i + self.shingle_size]) for i in range(max(1, len(words) - self.shingle_size + 1))
+		}
+		hashes = np.array(
+			[int.from_bytes(blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles],
+			dtype=np.uint64
+		)
+		return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MINHASH_PRIME).min(axis=1)
+
+	def _iter_band_keys(self, signature: np.ndarray):
+		for band in range(self.bands):
+			yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+	def query(self, signature: np.ndarray, threshold: float) -> tuple[int | None, float]:
+		"""Most similar indexed text (the earliest one on ties)
+
+		:param signature: MinHash signature of the new text
+		:param threshold: Minimum estimated Jaccard similarity
+		:return: Key of the most similar text and its similarity, (None, 0.0) if none is over the threshold
+		"""
+		candidates: set[int] = set()
+		for band_key in self._iter_band_keys(signature=signature):
+			candidates.update(self._buckets.get(band_key, ()))
+
+		best_key, best_similarity = None, 0.0
+		for key in sorted(candidates):
+			similarity = float(np.mean(self.signatures[key] == signature))
+			if similarity >= threshold and similarity > best_similarity:
+				best_key, best_similarity = key, similarity
+		return best_key, best_similarity
+
+	def add(self, key: int, signature: np.ndarray) -> None:
+		"""Indexes a text
+
+		:param key: Key of the text (e.g. intervention oid)
+		:param signature: MinHash signature of the text
+		"""
+		self.signatures[key] = signature
+		for band_key in self._iter_band_keys(signature=signature):
+			self._buckets.setdefault(band_key, []).append(key)
+
+
+class InterventionFilter:
+	"""
+	Local pre-filter of the transcript interventions, run before the mention tree search:
+	 - procedural interventions (thanks, floor management, audio checks...) are detected with length and
+	 keyword heuristics, and an optional ProceduralInterventionClassifier for the rest, and are not matched
+	 - near-verbatim repeats of an earlier matched intervention (MinHash of word shingles) reuse its mentions
+	Interventions with explicit numbering references (e.g. "paragraph 29") are always matched, and the heuristics
+	 only skip interventions that are procedural as a whole: never short positions on the text (options, brackets,
+	 deletions, bare numberings such as "14(b)", stance verbs, negations), which are left to the classifier (if any).
+	Every decision is appended to a JSONL audit log (if given), so that the recall of the filter can be reviewed.
+	"""
+
+	def __init__(
+			self, audit_log_path: str | None = None, min_words: int = 4, max_content_words: int = 0,
+			classifier: ProceduralInterventionClassifier | None = None, classifier_threshold: float = 0.8,
+			duplicate_threshold: float = 0.7, minhash_index: MinHashIndex | None = None
+		) -> None:
+		"""
+		:param audit_log_path: Path of the .jsonl audit log of the decisions (None for no log)
+		:param min_words: Procedural interventions with fewer words are logged as "too_short"
+		 (instead of "procedural_phrases")
+		:param max_content_words: Interventions with no position markers and at most this many content words
+		 (besides stopwords and procedural phrases) are procedural, by default only the ones that are procedural
+		 as a whole
+		:param classifier: Classifier of the interventions not caught by the heuristics (None to only use them)
+		:param classifier_threshold: Procedural probability over which an intervention is procedural
+		:param duplicate_threshold: Estimated Jaccard similarity over which an intervention is a duplicate
+		:param minhash_index: Index of the matched interventions, if None a default MinHashIndex
+		"""
+		self.audit_log_path: str | None = audit_log_path
+		if self.audit_log_path is not None and os.path.dirname(self.audit_log_path) != "":
+			os.makedirs(os.path.dirname(self.audit_log_path), exist_ok=True)
+		self.min_words: int = min_words
+		self.max_content_words: int = max_content_words
+		self.classifier: ProceduralInterventionClassifier | None = classifier
+		self.classifier_threshold: float = classifier_threshold
+		self.duplicate_threshold: float = duplicate_threshold
+		self.minhash_index: MinHashIndex = minhash_index if minhash_index is not None else MinHashIndex()
+
+		# Report of the filtered interventions
+		self.counts: dict[str, int] = {"match": 0, "procedural": 0, "duplicate": 0}
+		self._lock = threading.Lock()
+
+	def _get_procedural_decision(self, oid: int, text: str) -> InterventionFilterDecision:
+		"""Procedural heuristics and classifier
+
+		:param oid: Intervention oid
+		:param text: Intervention text
+		:return: "procedural" or "match" decision
+		"""
+		n_words = len(WORD_REGEX.findall(text))
+		content = PROCEDURAL_PHRASE_REGEX.sub(" ", text)
+		n_content_words = len(tokenize(content))
+		decision = dict(oid=oid, n_words=n_words, n_content_words=n_content_words)
+
+		if PARAGRAPH_REFERENCE_REGEX.search(text) is not None or SECTION_REFERENCE_REGEX.search(text) is not None:
+			return InterventionFilterDecision(action="match", reason="explicit_reference", **decision)
+		# Short positions on the text (e.g. "Thank you chair. We cannot accept this.") are never skipped
+		if POSITION_MARKER_REGEX.search(content) is None and n_content_words <= self.max_content_words:
+			return InterventionFilterDecision(
+				action="procedural", reason="too_short" if n_words < self.min_words else "procedural_phrases", **decision
+			)
+		if self.classifier is not None:
+			probability = self.classifier.predict_proba(text=text)
+			if probability >= self.classifier_threshold:
+				return InterventionFilterDecision(
+					action="procedural", reason="classifier", procedural_probability=probability, **decision
+				)
+			return InterventionFilterDecision(
+				action="match", reason="classifier", procedural_probability=probability, **decision
+			)
+		return InterventionFilterDecision(action="match", reason="content", **decision)
+
+	def __call__(self, oid: int, text: str, participant: str | None = None, hour: str | None = None) -> InterventionFilterDecision:
+		"""Decides whether an intervention is matched, skipped as procedural, or reuses the mentions
+		 of an earlier intervention. Interventions must be filtered in transcript order.
+
+		:param oid: Intervention oid
+		:param text: Intervention text
+		:param participant: Intervention participant (only logged)
+		:param hour: Intervention hour (only logged)
+		:return: Decision
+		"""
+		decision = self._get_procedural_decision(oid=oid, text=text)
+		if decision.action == "match":
+			signature = self.minhash_index.get_signature(text=text)
+			if signature is not None:
+				with self._lock:
+					# Explicit references are cheap to resolve, and their repeats may differ in a single number
+					duplicate_of, similarity = (None, 0.0) if decision.reason == "explicit_reference" else (
+						self.minhash_index.query(signature=signature, threshold=self.duplicate_threshold)
+					)
+					if duplicate_of is None:
+						self.minhash_index.add(key=oid, signature=signature)
+				if duplicate_of is not None:
+					decision = decision.model_copy(update=dict(
+						action="duplicate", reason="near_duplicate", duplicate_of=duplicate_of, similarity=similarity
+					))
+
+		with self._lock:
+			self.counts[decision.action] += 1
+		self._log(decision=decision, text=text, participant=participant, hour=hour)
+		return decision
+
+	def _log(self, decision: InterventionFilterDecision, text: str, participant: str | None, hour: str | None) -> None:
+		"""Appends a decision to the audit log (if any)
+
+		:param decision: Decision
+		:param text: Intervention text
+		:param participant: Intervention participant
+		:param hour: Intervention hour
+		"""
+		if self.audit_log_path is None:
+			return
+		record = {**decision.model_dump(), "participant": participant, "hour": hour, "text": text.strip()}
+		with self._lock:
+			with open(self.audit_log_path, "a", encoding="utf-8") as f:
+				f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+	def report(self) -> str:
+		"""Report of the filtered interventions
+
+		:return: Human readable report
+		"""
+		total = sum(self.counts.values())
+		filtered = self.counts["procedural"] + self.counts["duplicate"]
+		return (
+			f"Intervention filter: {filtered} of {total} interventions not matched "
+			f"({self.counts['procedural']} procedural, {self.counts['duplicate']} duplicates)"
+		)
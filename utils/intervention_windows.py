@@ -0,0 +1,137 @@
+import re
+
+import numpy as np
+
+from utils.lexical_index import LexicalRelevanceIndex
+from utils.regex import SENTENCE_BOUNDARY_REGEX
+from utils.token_counter import get_token_counter
+
+
+class InterventionWindower:
+	"""
+	Splits long interventions (chair summaries, group statements...) into windows of consecutive sentences
+	 of at most max_tokens tiktoken tokens. The evaluator prompt of each document text then only includes the
+	 windows with the highest lexical relevance to its subtree, instead of the whole intervention at every node.
+	Windows are verbatim slices of the intervention, so the textual references quoted by the evaluator
+	 are still quotes of the intervention, and a single evaluation per document text merges all its windows.
+	"""
+
+	def __init__(
+			self, max_tokens: int = 256, min_tokens: int = 512, max_windows: int = 2, relevance_ratio: float = 0.5,
+			model_name: str = "gpt-4o-mini", separator: str = "\n[...]\n"
+		) -> None:
+		"""
+		:param max_tokens: Maximum tokens of a window (a longer sentence is split between words)
+		:param min_tokens: Interventions of up to this many tokens are not windowed (sent whole as before)
+		:param max_windows: Maximum number of windows in the prompt of a document text
+		:param relevance_ratio: Minimum relevance of a selected window, relative to the most relevant one
+		:param model_name: Model whose tiktoken encoding is used to count the tokens
+		:param separator: Text marking the omitted text between two selected windows
+		"""
+		self.max_tokens: int = max_tokens
+		self.min_tokens: int = min_tokens
+		self.max_windows: int = max_windows
+		self.relevance_ratio: float = relevance_ratio
+		self.separator: str = separator
+		self.count_tokens = get_token_counter(model_name=model_name)
+
+		# Report of the windowed interventions and of the intervention text sent per prompt
+		self.n_interventions: int = 0
+		self.n_windowed: int = 0
+		self.n_windows: int = 0
+		self.n_prompts: int = 0
+		self.n_prompt_characters: int = 0
+		self.n_intervention_characters: int = 0
+
+	def _iter_pieces(self, text: str) -> list[tuple[int, int, int]]:
+		"""Sentences of a text, the ones longer than max_tokens split between words
+
+		:param text: Intervention text
+		:return: (start, end, tokens) of each piece, in text order
+		"""
+		starts = [0] + [match.end() for match in SENTENCE_BOUNDARY_REGEX.finditer(text)]
+		ends = [match.start() for match in SENTENCE_BOUNDARY_REGEX.finditer(text)] + [len(text)]
+		pieces: list[tuple[int, int, int]] = []
+		for start, end in zip(starts, ends):
+			tokens = self.count_tokens(text[start:end])
+			if tokens <= self.max_tokens:
+				pieces.append((start, end, tokens))
+				continue
+			for word in re.finditer(r"\S+\s*", text[start:end]):
+				pieces.append((start + word.start(), start + word.end(), self.count_tokens(word.group())))
+		return pieces
+
+	def split(self, text: str) -> list[str]:
+		"""Splits an intervention into windows of consecutive sentences
+
+		:param text: Intervention text
+		:return: Windows in text order (the whole text alone if it is not longer than min_tokens)
+		"""
+		self.n_interventions += 1
+		if self.count_tokens(text) <= self.min_tokens:
+			return [text]
+
+		windows: list[str] = []
+		window_start, window_end, window_tokens = None, 0, 0
+		for start, end, tokens in self._iter_pieces(text=text):
+			if window_start is not None and window_tokens + tokens > self.max_tokens:
+				windows.append(text[window_start:window_end].strip())
+				window_start, window_tokens = None, 0
+			if window_start is None:
+				window_start = start
+			window_end = end
+			window_tokens += tokens
+		if window_start is not None:
+			windows.append(text[window_start:window_end].strip())
+
+		windows = [window for window in windows if window != ""]
+		if len(windows) > 1:
+			self.n_windowed += 1
+			self.n_windows += len(windows)
+		return windows if len(windows) != 0 else [text]
+
+	@staticmethod
+	def get_relevance(windows: list[str], lexical_index: LexicalRelevanceIndex) -> np.ndarray:
+		"""Lexical relevance of each window to every document subtree
+
+		:param windows: Windows of an intervention
+		:param lexical_index: Lexical relevance index of the document
+		:return: BM25 scores (windows x document texts, in pre-order)
+		"""
+		return np.stack([lexical_index.score(text=window) for window in windows])
+
+	def select(self, windows: list[str], scores: np.ndarray) -> str:
+		"""Intervention text of the prompt of a document text: its most relevant windows, in text order
+		 (the first window if none of them shares any word with its subtree)
+
+		:param windows: Windows of an intervention
+		:param scores: Relevance of each window to the document text subtree
+		:return: Selected windows, joined by the separator where some text is omitted
+		"""
+		order = np.argsort(-scores, kind="stable")
+		best = scores[order[0]]
+		if best > 0:
+			selected = sorted(
+				int(i) for i in order[:self.max_windows] if scores[i] > 0 and scores[i] >= self.relevance_ratio * best
+			)
+		else:
+			selected = [0]
+
+		text = windows[selected[0]]
+		for previous, i in zip(selected, selected[1:]):
+			text += (" " if i == previous + 1 else self.separator) + windows[i]
+		self.n_prompts += 1
+		self.n_prompt_characters += len(text)
+		self.n_intervention_characters += sum(len(window) for window in windows)
+		return text
+
+	def report(self) -> str:
+		"""Report of the windowed interventions
+
+		:return: Human readable report
+		"""
+		ratio = self.n_prompt_characters / self.n_intervention_characters if self.n_intervention_characters != 0 else 1.0
+		return (
+			f"Intervention windowing: {self.n_windowed} of {self.n_interventions} interventions split into "
+			f"{self.n_windows} windows, prompts of windowed interventions include {ratio:.1%} of their text"
+		)
@@ -0,0 +1,161 @@
+import numpy as np
+
+from parser import NaiveDecisionParserDocument, NaiveDecisionParserText, iter_document_texts
+from utils.regex import WORD_REGEX
+
+
+STOPWORDS: frozenset[str] = frozenset((
+	"the", "and", "of", "to", "in", "on", "for", "as", "by", "with", "at", "from", "or", "an", "be", "is", "are",
+	"was", "were", "that", "this", "these", "those", "it", "its", "we", "our", "you", "your", "they", "their",
+	"which", "who", "what", "would", "could", "should", "will", "shall", "may", "can", "not", "no", "also", "so",
+	"but", "if", "all", "any", "such", "there", "here", "have", "has", "had", "do", "does", "thank", "chair"
+))
+
+
+def tokenize(text: str) -> list[str]:
+	"""Lowercase word tokens of a text, without stopwords
+
+	:param text: Input text
+	:return: Tokens
+	"""
+	return [token for token in WORD_REGEX.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalRelevanceIndex:
+	"""
+	BM25 index over every text of a structured document, where the text of each subtree
+	 is aggregated upward into its root text, so that a heading is scored with all its content.
+	Used to only send the top scoring candidates of each tree search level to the LLM evaluator.
+
+	The index is stored as NumPy postings lists (term -> subtree texts, term frequencies).
+	"""
+
+	def __init__(
+			self, doc_content: NaiveDecisionParserDocument,
+			top_k: int = 5, recall_safety: float = 0.9, k1: float = 1.2, b: float = 0.75
+		) -> None:
+		"""
+		:param doc_content: Structured document content
+		:param top_k: Minimum number of candidates kept at each tree search level
+		:param recall_safety: Fraction of the total score of a level candidates that must be kept,
+		 the higher the safer (1.0 keeps every candidate with any lexical overlap)
+		:param k1: BM25 term frequency saturation
+		:param b: BM25 length normalization
+		"""
+		self.top_k: int = top_k
+		self.recall_safety: float = recall_safety
+		self.k1: float = k1
+		self.b: float = b
+
+		# Report of the avoided LLM calls
+		self.n_candidates: int = 0
+		self.n_pruned: int = 0
+
+		self.texts: list[NaiveDecisionParserText] = list(iter_document_texts(doc_content=doc_content))
+		self.text_index: dict[int, int] = {id(text): i for i, text in enumerate(self.texts)}
+		self._build()
+
+	def _build(self) -> None:
+		"""Builds the postings lists of the aggregated subtree texts
+		"""
+		vocabulary: dict[str, int] = {}
+		own_counts: list[dict[int, int]] = []
+		for text in self.texts:
+			counts: dict[int, int] = {}
+			for token in tokenize(f"{text.numbering} {text.text}"):
+				term = vocabulary.setdefault(token, len(vocabulary))
+				counts[term] = counts.get(term, 0) + 1
+			own_counts.append(counts)
+		self.vocabulary: dict[str, int] = vocabulary
+
+		# Inverse document frequency over the texts themselves
+		document_frequency = np.zeros(len(vocabulary), dtype=np.float64)
+		for counts in own_counts:
+			document_frequency[list(counts.keys())] += 1
+		n_texts = max(len(self.texts), 1)
+		self.idf: np.ndarray = np.log(1 + (n_texts - document_frequency + 0.5) / (document_frequency + 0.5))
+
+		# Aggregate term counts upward (children come after their parents in pre-order)
+		subtree_counts: list[dict[int, int]] = [dict(counts) for counts in own_counts]
+		for i in range(len(self.texts) - 1, -1, -1):
+			parent = self.texts[i].parent
+			if parent is not None:
+				parent_counts = subtree_counts[self.text_index[id(parent)]]
+				for term, count in subtree_counts[i].items():
+					parent_counts[term] = parent_counts.get(term, 0) + count
+
+		self.lengths: np.ndarray = np.array([sum(counts.values()) for counts in subtree_counts], dtype=np.float64)
+		self.avg_length: float = float(self.lengths.mean()) if len(self.texts) != 0 and self.lengths.mean() > 0 else 1.0
+
+		postings: list[list[tuple[int, int]]] = [[] for _ in range(len(vocabulary))]
+		for i, counts in enumerate(subtree_counts):
+			for term, count in counts.items():
+				postings[term].append((i, count))
+		self.postings_indptr: np.ndarray = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+		self.postings_indptr[1:] = np.cumsum([len(term_postings) for term_postings in postings])
+		self.postings_texts: np.ndarray = np.array(
+			[i for term_postings in postings for i, _ in term_postings], dtype=np.int64
+		)
+		self.postings_frequencies: np.ndarray = np.array(
+			[count for term_postings in postings for _, count in term_postings], dtype=np.float64
+		)
+
+	def score(self, text: str) -> np.ndarray:
+		"""BM25 scores of every subtree against a query text
+
+		:param text: Query text (e.g. the intervention paragraph)
+		:return: Score of each document text subtree, in pre-order
+		"""
+		scores = np.zeros(len(self.texts), dtype=np.float64)
+		query_terms: dict[int, int] = {}
+		for token in tokenize(text):
+			term = self.vocabulary.get(token)
+			if term is not None:
+				query_terms[term] = query_terms.get(term, 0) + 1
+
+		for term in query_terms:
+			start, end = self.postings_indptr[term], self.postings_indptr[term + 1]
+			texts = self.postings_texts[start:end]
+			frequencies = self.postings_frequencies[start:end]
+			norm = self.k1 * (1 - self.b + self.b * self.lengths[texts] / self.avg_length)
+			scores[texts] += self.idf[term] * frequencies * (self.k1 + 1) / (frequencies + norm)
+		return scores
+
+	def prune(
+			self, selected_content: NaiveDecisionParserDocument, scores: np.ndarray
+		) -> NaiveDecisionParserDocument:
+		"""Keeps the most relevant candidates of a tree search level:
+		 at least the top_k ones, and as many as needed to cover the recall_safety fraction of the level score.
+		The document order of the kept candidates is preserved.
+
+		:param selected_content: Candidates of a tree search level
+		:param scores: Scores of the intervention (from score)
+		:return: Kept candidates
+		"""
+		self.n_candidates += len(selected_content)
+		if len(selected_content) <= self.top_k:
+			return selected_content
+
+		content_scores = scores[[self.text_index[id(content)] for content in selected_content]]
+		order = np.argsort(-content_scores, kind="stable")
+		sorted_scores = content_scores[order]
+		n_kept = self.top_k
+		total_score = sorted_scores.sum()
+		if total_score > 0:
+			covered = np.cumsum(sorted_scores) / total_score
+			n_kept = max(n_kept, int(np.searchsorted(covered, self.recall_safety - 1e-12)) + 1)
+		kept = np.sort(order[:n_kept])
+
+		self.n_pruned += len(selected_content) - len(kept)
+		return [selected_content[i] for i in kept]
+
+	def report(self) -> str:
+		"""Report of the evaluator calls avoided by pruning
+
+		:return: Human readable report
+		"""
+		ratio = self.n_pruned / self.n_candidates if self.n_candidates != 0 else 0.0
+		return (
+			f"Lexical pruning: {self.n_pruned} of {self.n_candidates} candidate evaluations avoided ({ratio:.1%}), "
+			"not counting the evaluations of their subtrees"
+		)
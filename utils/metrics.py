@@ -0,0 +1,198 @@
+import json
+import math
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+
+# Default histogram buckets (seconds), from LLM call latencies to whole pipeline stages
+DEFAULT_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Histogram buckets for counts (e.g. nodes or tokens)
+COUNT_BUCKETS: tuple[float, ...] = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_NO_OP_STAGE = nullcontext()
+
+
+class Histogram:
+	__slots__ = ("buckets", "bucket_counts", "count", "sum", "min", "max")
+
+	def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+		self.buckets: tuple[float, ...] = buckets
+		self.bucket_counts: list[int] = [0] * len(buckets)
+		self.count: int = 0
+		self.sum: float = 0.0
+		self.min: float = math.inf
+		self.max: float = -math.inf
+
+	def observe(self, value: float) -> None:
+		"""Records an observation
+		"""
+		self.count += 1
+		self.sum += value
+		self.min = min(self.min, value)
+		self.max = max(self.max, value)
+		for i, bucket in enumerate(self.buckets):
+			if value <= bucket:
+				self.bucket_counts[i] += 1
+				break
+
+	def cumulative_counts(self) -> list[int]:
+		"""Observations less or equal than each bucket upper bound
+		"""
+		cumulative_counts, total = [], 0
+		for bucket_count in self.bucket_counts:
+			total += bucket_count
+			cumulative_counts.append(total)
+		return cumulative_counts
+
+	def to_dict(self) -> dict:
+		return {
+			"count": self.count,
+			"sum": self.sum,
+			"mean": self.sum / self.count if self.count != 0 else None,
+			"min": self.min if self.count != 0 else None,
+			"max": self.max if self.count != 0 else None,
+			"buckets": {str(bucket): count for bucket, count in zip(self.buckets, self.cumulative_counts())}
+		}
+
+
+class PipelineMetrics:
+	"""
+	In-process metrics of the matching pipeline: counters and histograms with labels,
+	 exported as a JSON summary or in the Prometheus text format.
+	When disabled (the default) every recording call returns immediately.
+	"""
+
+	def __init__(self, enabled: bool = False, prefix: str = "negotiation_matching") -> None:
+		"""
+		:param enabled: Whether metrics are recorded
+		:param prefix: Prefix of the exported metric names
+		"""
+		self.enabled: bool = enabled
+		self.prefix: str = prefix
+		self.counters: dict[str, dict[tuple[tuple[str, str], ...], float]] = {}
+		self.histograms: dict[str, dict[tuple[tuple[str, str], ...], Histogram]] = {}
+		self.histogram_buckets: dict[str, tuple[float, ...]] = {}
+
+	def enable(self) -> None:
+		self.enabled = True
+
+	def disable(self) -> None:
+		self.enabled = False
+
+	def reset(self) -> None:
+		"""Deletes every recorded metric
+		"""
+		self.counters.clear()
+		self.histograms.clear()
+		self.histogram_buckets.clear()
+
+	def increment(self, name: str, value: float = 1, **labels: object) -> None:
+		"""Increments a counter
+
+		:param name: Counter name
+		:param value: Increment
+		:param labels: Counter labels
+		"""
+		if not self.enabled:
+			return
+		series = self.counters.setdefault(name, {})
+		key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+		series[key] = series.get(key, 0) + value
+
+	def observe(self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: object) -> None:
+		"""Records an observation in a histogram
+
+		:param name: Histogram name
+		:param value: Observed value
+		:param buckets: Histogram buckets upper bounds (only used when the histogram is created)
+		:param labels: Histogram labels
+		"""
+		if not self.enabled:
+			return
+		series = self.histograms.setdefault(name, {})
+		buckets = self.histogram_buckets.setdefault(name, buckets)
+		key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+		histogram = series.get(key)
+		if histogram is None:
+			histogram = series[key] = Histogram(buckets=buckets)
+		histogram.observe(value)
+
+	def stage(self, name: str, **labels: object):
+		"""Context manager timing a pipeline stage into the stage_seconds histogram
+
+		:param name: Stage name (e.g. "convert", "parse", "transcript_split", "tree_search_level")
+		:param labels: Additional labels
+		:return: Context manager
+		"""
+		if not self.enabled:
+			return _NO_OP_STAGE
+		return self._timed_stage(name=name, **labels)
+
+	@contextmanager
+	def _timed_stage(self, name: str, **labels: object) -> Iterator[None]:
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe("stage_seconds", time.perf_counter() - start, stage=name, **labels)
+
+	def to_json(self) -> dict:
+		"""JSON summary of the recorded metrics
+
+		:return: Counters and histograms, with one entry per label set
+		"""
+		return {
+			"counters": {
+				name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+				for name, series in self.counters.items()
+			},
+			"histograms": {
+				name: [{"labels": dict(key), **histogram.to_dict()} for key, histogram in series.items()]
+				for name, series in self.histograms.items()
+			}
+		}
+
+	@staticmethod
+	def _format_labels(key: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+		labels = key + extra
+		if len(labels) == 0:
+			return ""
+		escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+		return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + "}"
+
+	def to_prometheus(self) -> str:
+		"""Recorded metrics in the Prometheus text exposition format
+
+		:return: Prometheus text
+		"""
+		lines: list[str] = []
+		for name, series in self.counters.items():
+			metric = f"{self.prefix}_{name}"
+			lines.append(f"# TYPE {metric} counter")
+			for key, value in series.items():
+				lines.append(f"{metric}{self._format_labels(key)} {value}")
+		for name, series in self.histograms.items():
+			metric = f"{self.prefix}_{name}"
+			lines.append(f"# TYPE {metric} histogram")
+			for key, histogram in series.items():
+				for bucket, count in zip(histogram.buckets, histogram.cumulative_counts()):
+					lines.append(f"{metric}_bucket{self._format_labels(key, (('le', str(bucket)),))} {count}")
+				lines.append(f"{metric}_bucket{self._format_labels(key, (('le', '+Inf'),))} {histogram.count}")
+				lines.append(f"{metric}_sum{self._format_labels(key)} {histogram.sum}")
+				lines.append(f"{metric}_count{self._format_labels(key)} {histogram.count}")
+		return "\n".join(lines) + "\n"
+
+	def write(self, path_prefix: str) -> None:
+		"""Writes the JSON summary (.json) and the Prometheus text (.prom) of the recorded metrics
+
+		:param path_prefix: Output path without extension
+		"""
+		with open(f"{path_prefix}.json", "w", encoding="utf-8") as f:
+			json.dump(self.to_json(), f, indent=2)
+		with open(f"{path_prefix}.prom", "w", encoding="utf-8") as f:
+			f.write(self.to_prometheus())
+
+
+# Global metrics of the pipeline, disabled unless enabled explicitly
+METRICS = PipelineMetrics()
@@ -1,3 +1,5 @@
+from hashlib import sha256
+
 MENTION_TREE_SEARCH_EVALUATOR_PROMPT = """
 # Task Overview
 
@@ -41,4 +43,37 @@ Submit a single boolean value (True or False), along with the exact textual refe
 
 {intervention}
 
-"""
\ No newline at end of file
+"""
+
+# Version of the evaluator prompt, used to key and invalidate cached evaluations whenever the prompt changes
+MENTION_TREE_SEARCH_EVALUATOR_PROMPT_VERSION: str = sha256(MENTION_TREE_SEARCH_EVALUATOR_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+# Packed variant of the evaluator prompt: the instructions and the intervention are sent once
+# together with several enumerated document fragments, each one evaluated independently
+MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT = MENTION_TREE_SEARCH_EVALUATOR_PROMPT.split("# Response Format:")[0] + """# Response Format:
+
+Several document fragments are provided, each one enclosed in <fragment id="...">...</fragment> tags. Evaluate every fragment independently against the intervention, exactly as if it was the only fragment provided.
+
+Submit exactly one evaluation per fragment, with the fragment id, the boolean value (True or False), the exact textual reference used to make this determination and the type of reference.
+
+# Input:
+
+## Negotiation Document Fragments
+
+{documents}
+
+## Intervention
+
+{intervention}
+
+"""
+
+MENTION_TREE_SEARCH_PACKED_FRAGMENT = """<fragment id="{fragment_id}">
+{document}
+</fragment>"""
+
+# Version of the packed evaluator prompt (and of its fragments), keying the evaluations obtained in packed mode
+# apart from the ones of the single document text prompt
+MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT_VERSION: str = sha256(
+	(MENTION_TREE_SEARCH_PACKED_EVALUATOR_PROMPT + MENTION_TREE_SEARCH_PACKED_FRAGMENT).encode("utf-8")
+).hexdigest()[:16]
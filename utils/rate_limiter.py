@@ -0,0 +1,302 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any
+
+import openai
+from langchain_core.runnables import Runnable
+
+from utils.exceptions import SimulatedRateLimitError
+from utils.metrics import METRICS
+from utils.token_counter import get_token_counter
+
+
+# Errors signalling that the provider rate limits are being exceeded (HTTP 429)
+RATE_LIMIT_ERRORS: tuple[type[Exception], ...] = (openai.RateLimitError, SimulatedRateLimitError)
+# Other transient errors worth retrying
+TRANSIENT_ERRORS: tuple[type[Exception], ...] = (
+	openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError
+)
+
+
+class TokenBucket:
+	"""
+	Token bucket refilled at a constant rate, where reservations may go into debt:
+	 each reservation returns how long its caller must wait, so that callers are served in order.
+	"""
+
+	def __init__(self, rate_per_minute: float, capacity: float | None = None) -> None:
+		"""
+		:param rate_per_minute: Refill rate (e.g. requests or tokens per minute)
+		:param capacity: Maximum burst, if None 10 seconds worth of the rate
+		"""
+		self.rate: float = rate_per_minute / 60
+		self.capacity: float = capacity if capacity is not None else max(1.0, rate_per_minute / 6)
+		self.level: float = self.capacity
+		self.updated: float = time.monotonic()
+		self._lock = threading.Lock()
+
+	def reserve(self, amount: float) -> float:
+		"""Reserves an amount of the bucket
+
+		:param amount: Amount to be consumed
+		:return: Seconds to wait before consuming it
+		"""
+		with self._lock:
+			now = time.monotonic()
+			self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+			self.updated = now
+			self.level -= amount
+			return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class AdaptiveRateLimiter:
+	"""
+	Concurrency controller of the evaluator calls:
+	 - requests and tokens per minute token buckets (prompt tokens counted with tiktoken)
+	 - AIMD in-flight limit, additively increased on success and multiplicatively decreased
+	 on rate limit errors (and on latencies over latency_target, if given)
+	 - per call retries with full jitter exponential backoff, so that a failure never re-runs a whole batch
+	"""
+
+	def __init__(
+			self, requests_per_minute: float | None = 500, tokens_per_minute: float | None = 200_000,
+			initial_concurrency: int = 4, min_concurrency: int = 1, max_concurrency: int = 32,
+			decrease_factor: float = 0.5, latency_target: float | None = None,
+			max_retries: int = 6, base_delay: float = 0.5, max_delay: float = 30.0,
+			completion_tokens: int = 64, model_name: str = "gpt-4o-mini", seed: int | None = None
+		) -> None:
+		"""
+		:param requests_per_minute: Requests per minute limit (None for unlimited)
+		:param tokens_per_minute: Tokens per minute limit (None for unlimited)
+		:param initial_concurrency: Initial in-flight requests limit
+		:param min_concurrency: Minimum in-flight requests limit
+		:param max_concurrency: Maximum in-flight requests limit
+		:param decrease_factor: Multiplicative decrease of the in-flight limit
+		:param latency_target: Latency (seconds) over which the in-flight limit is decreased (None to ignore latency)
+		:param max_retries: Maximum retries of each call
+		:param base_delay: Backoff delay of the first retry (seconds)
+		:param max_delay: Maximum backoff delay (seconds)
+		:param completion_tokens: Completion tokens reserved for each request on top of its prompt tokens
+		:param model_name: Model whose tiktoken encoding is used to count the prompt tokens
+		:param seed: Random seed of the backoff jitter
+		"""
+		self.requests = TokenBucket(rate_per_minute=requests_per_minute) if requests_per_minute is not None else None
+		self.tokens = TokenBucket(rate_per_minute=tokens_per_minute) if tokens_per_minute is not None else None
+		self.limit: float = float(initial_concurrency)
+		self.min_concurrency: int = min_concurrency
+		self.max_concurrency: int = max_concurrency
+		self.decrease_factor: float = decrease_factor
+		self.latency_target: float | None = latency_target
+		self.max_retries: int = max_retries
+		self.base_delay: float = base_delay
+		self.max_delay: float = max_delay
+		self.completion_tokens: int = completion_tokens
+		self.count_tokens = get_token_counter(model_name=model_name) if self.tokens is not None else None
+
+		self.n_requests: int = 0
+		self.n_retries: int = 0
+		self.n_rate_limited: int = 0
+		self.n_failed: int = 0
+
+		self.in_flight: int = 0
+		# Smoothed latency, also the cooldown between decreases (a burst of 429s only decreases the limit once)
+		self.latency: float = 1.0
+		self._last_decrease: float = 0.0
+		self._rng = random.Random(seed)
+		self._lock = threading.Lock()
+		self._released = threading.Condition(self._lock)
+		self._async_released: asyncio.Condition | None = None
+		self._async_loop: asyncio.AbstractEventLoop | None = None
+
+	def _reserve(self, prompt: Any) -> float:
+		"""Reserves a request and its tokens in the token buckets
+
+		:param prompt: Evaluator prompt
+		:return: Seconds to wait before sending it
+		"""
+		delay: float = 0.0
+		if self.requests is not None:
+			delay = max(delay, self.requests.reserve(amount=1))
+		if self.tokens is not None:
+			content = prompt if isinstance(prompt, str) else "".join(message["content"] for message in prompt)
+			delay = max(delay, self.tokens.reserve(amount=self.count_tokens(content) + self.completion_tokens))
+		return delay
+
+	def _increase(self, latency: float) -> None:
+		"""Additive increase of the in-flight limit (by one per limit successful requests), or decrease if
+		 the latency is over the target
+
+		:param latency: Latency of the successful request
+		"""
+		with self._lock:
+			self.latency = 0.8 * self.latency + 0.2 * latency
+		if self.latency_target is not None and latency > self.latency_target:
+			self._decrease()
+			return
+		with self._released:
+			n_slots = int(self.limit)
+			self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+			n_added = int(self.limit) - n_slots
+			if n_added > 0:
+				# The new slots are taken right away, not at the next release
+				self._released.notify(n_added)
+		if n_added > 0:
+			self._notify_async_threadsafe()
+
+	def _decrease(self) -> None:
+		"""Multiplicative decrease of the in-flight limit, at most once per smoothed latency
+		"""
+		with self._lock:
+			now = time.monotonic()
+			if now - self._last_decrease >= self.latency:
+				self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+				self._last_decrease = now
+		METRICS.observe("rate_limiter_concurrency", self.limit, buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+	def _get_backoff(self, attempt: int) -> float:
+		"""Full jitter exponential backoff delay
+
+		:param attempt: Number of the failed attempt (from 0)
+		:return: Seconds to wait before retrying
+		"""
+		with self._lock:
+			return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+	def _on_error(self, error: Exception, attempt: int) -> float:
+		"""Handles a failed attempt
+
+		:param error: Raised error
+		:param attempt: Number of the failed attempt (from 0)
+		:raises Exception: The error itself, if it is not retryable or the retries are exhausted
+		:return: Seconds to wait before retrying
+		"""
+		if not isinstance(error, RATE_LIMIT_ERRORS + TRANSIENT_ERRORS) or attempt >= self.max_retries:
+			with self._lock:
+				self.n_failed += 1
+			raise error
+		if isinstance(error, RATE_LIMIT_ERRORS):
+			with self._lock:
+				self.n_rate_limited += 1
+			METRICS.increment("llm_rate_limited_total")
+			self._decrease()
+		with self._lock:
+			self.n_retries += 1
+		METRICS.increment("llm_retries_total")
+		return self._get_backoff(attempt=attempt)
+
+	def _acquire(self) -> None:
+		with self._released:
+			while self.in_flight >= int(self.limit):
+				self._released.wait()
+			self.in_flight += 1
+			self.n_requests += 1
+
+	def _release(self) -> None:
+		with self._released:
+			self.in_flight -= 1
+			self._released.notify_all()
+		self._notify_async_threadsafe()
+
+	def _notify_async_threadsafe(self) -> None:
+		if self._async_loop is not None and not self._async_loop.is_closed():
+			self._async_loop.call_soon_threadsafe(self._notify_async)
+
+	def _notify_async(self) -> None:
+		async def notify():
+			async with self._async_released:
+				self._async_released.notify_all()
+		asyncio.ensure_future(notify())
+
+	async def _aacquire(self) -> None:
+		loop = asyncio.get_running_loop()
+		if self._async_loop is not loop:
+			self._async_loop, self._async_released = loop, asyncio.Condition()
+		async with self._async_released:
+			while True:
+				with self._lock:
+					if self.in_flight < int(self.limit):
+						self.in_flight += 1
+						self.n_requests += 1
+						return
+				await self._async_released.wait()
+
+	def invoke(self, evaluator: Runnable, prompt: Any) -> Any:
+		"""Invokes the evaluator within the rate limits, retrying it if needed
+
+		:param evaluator: Evaluator runnable
+		:param prompt: Evaluator prompt
+		:return: Evaluation
+		"""
+		attempt: int = 0
+		while True:
+			delay = self._reserve(prompt=prompt)
+			METRICS.observe("rate_limiter_wait_seconds", delay)
+			time.sleep(delay)
+			self._acquire()
+			start = time.perf_counter()
+			try:
+				evaluation = evaluator.invoke(prompt)
+			except Exception as error:
+				backoff = self._on_error(error=error, attempt=attempt)
+			else:
+				self._increase(latency=time.perf_counter() - start)
+				return evaluation
+			finally:
+				self._release()
+			time.sleep(backoff)
+			attempt += 1
+
+	async def ainvoke(self, evaluator: Runnable, prompt: Any) -> Any:
+		"""Asynchronous counterpart of invoke
+
+		:param evaluator: Evaluator runnable
+		:param prompt: Evaluator prompt
+		:return: Evaluation
+		"""
+		attempt: int = 0
+		while True:
+			delay = self._reserve(prompt=prompt)
+			METRICS.observe("rate_limiter_wait_seconds", delay)
+			await asyncio.sleep(delay)
+			await self._aacquire()
+			start = time.perf_counter()
+			try:
+				evaluation = await evaluator.ainvoke(prompt)
+			except Exception as error:
+				backoff = self._on_error(error=error, attempt=attempt)
+			else:
+				self._increase(latency=time.perf_counter() - start)
+				return evaluation
+			finally:
+				self._release()
+			await asyncio.sleep(backoff)
+			attempt += 1
+
+	def batch(self, evaluator: Runnable, prompts: list[Any]) -> list[Any]:
+		"""Invokes the evaluator on every prompt concurrently within the rate limits,
+		 each failed call is retried on its own
+
+		:param evaluator: Evaluator runnable
+		:param prompts: Evaluator prompts
+		:return: Evaluations, in the same order as the prompts
+		"""
+		if len(prompts) == 0:
+			return []
+		with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(prompts))) as executor:
+			# The callbacks context (e.g. get_openai_callback) is propagated to the worker threads
+			futures = [executor.submit(copy_context().run, self.invoke, evaluator, prompt) for prompt in prompts]
+			return [future.result() for future in futures]
+
+	def report(self) -> str:
+		"""Report of the rate limiting
+
+		:return: Human readable report
+		"""
+		return (
+			f"Rate limiter: {self.n_requests} requests, {self.n_retries} retries "
+			f"({self.n_rate_limited} rate limited), {self.n_failed} failed, in-flight limit {self.limit:.1f}"
+		)
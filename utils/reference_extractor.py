@@ -0,0 +1,201 @@
+from collections import defaultdict
+
+from parser import (
+	NaiveDecisionParserDocument, NaiveDecisionParserText, NaiveDecisionParserTextLevel,
+	iter_document_texts, get_numbering_path
+)
+from utils.regex import (
+	PARAGRAPH_REFERENCE_REGEX, PARAGRAPH_NUMBERING_REGEX, SUBDIVISION_NUMBERING_REGEX,
+	SUBPARAGRAPH_REFERENCE_REGEX, SECTION_REFERENCE_REGEX,
+	EXTERNAL_INSTRUMENT_SUFFIX_REGEX, EXTERNAL_INSTRUMENT_PREFIX_REGEX
+)
+
+
+class NumberingPathIndex:
+	"""
+	Index of the texts of a structured document by their numbering,
+	 used to resolve explicit numbering references (paragraphs, sections...) into document texts.
+	"""
+
+	def __init__(self, doc_content: NaiveDecisionParserDocument) -> None:
+		"""
+		:param doc_content: Structured document content
+		"""
+		self.by_numbering_path: dict[tuple[str, ...], list[NaiveDecisionParserText]] = defaultdict(list)
+		self.by_level_numbering: dict[
+			tuple[NaiveDecisionParserTextLevel, str], list[NaiveDecisionParserText]
+		] = defaultdict(list)
+
+		for text in iter_document_texts(doc_content=doc_content):
+			self.by_numbering_path[get_numbering_path(text=text)].append(text)
+			self.by_level_numbering[(text.level, text.numbering)].append(text)
+
+	def get_unique(
+			self, level: NaiveDecisionParserTextLevel, numbering: str
+		) -> NaiveDecisionParserText | None:
+		"""Obtains the only text of a given level and numbering
+
+		:param level: Text level
+		:param numbering: Text numbering (as in the document, e.g. "29." or "II.")
+		:return: The text, None if there is no such text or it is ambiguous
+		"""
+		texts = self.by_level_numbering.get((level, numbering), [])
+		return texts[0] if len(texts) == 1 else None
+
+	@staticmethod
+	def get_child(text: NaiveDecisionParserText, numbering: str) -> NaiveDecisionParserText | None:
+		"""Obtains the only child of a text with a given numbering
+
+		:param text: Parent text
+		:param numbering: Child numbering (as in the document, e.g. "(c)")
+		:return: The child text, None if there is no such child or it is ambiguous
+		"""
+		children = [child for child in text.children if child.numbering == numbering]
+		return children[0] if len(children) == 1 else None
+
+
+class ReferenceExtractor:
+	"""
+	Deterministic extractor of explicit numbering references made in an intervention
+	 (e.g. "paragraph 29", "section II.B", "subparagraph (c)"),
+	 resolved against the numbering of the negotiation document.
+	Ambiguous or unknown references, and references to the paragraphs of other instruments
+	 (e.g. "paragraph 2 of the Paris Agreement"), are left unresolved for the LLM tree search.
+	"""
+
+	max_range_length: int = 20
+
+	def __init__(self, doc_content: NaiveDecisionParserDocument) -> None:
+		"""
+		:param doc_content: Structured document content
+		"""
+		self.index = NumberingPathIndex(doc_content=doc_content)
+
+	def _resolve_paragraph(self, number: str, subdivisions: list[str]) -> NaiveDecisionParserText | None:
+		"""Resolves a paragraph reference and its subdivisions (subparagraphs...)
+
+		:param number: Paragraph number
+		:param subdivisions: Subdivisions numbering, e.g. ["c", "ii"]
+		:return: Referenced text, None if it cannot be resolved
+		"""
+		text = self.index.get_unique(level=NaiveDecisionParserTextLevel.Paragraph, numbering=f"{int(number)}.")
+		for subdivision in subdivisions:
+			if text is None:
+				break
+			text = self.index.get_child(text=text, numbering=f"({subdivision.lower()})")
+		return text
+
+	@staticmethod
+	def _get_paragraph_ancestor(text: NaiveDecisionParserText) -> NaiveDecisionParserText:
+		"""Obtains the paragraph a (sub)paragraph text belongs to
+
+		:param text: Paragraph or paragraph subdivision text
+		:return: Paragraph level text
+		"""
+		while text.level.value > NaiveDecisionParserTextLevel.Paragraph.value and text.parent is not None:
+			text = text.parent
+		return text
+
+	def _extract_paragraph_references(
+			self, text: str
+		) -> list[tuple[int, NaiveDecisionParserText, str]]:
+		"""Extracts the paragraph references (including lists and ranges of paragraphs)
+
+		:param text: Intervention text
+		:return: (position, referenced text, textual reference) of every resolved reference
+		"""
+		references: list[tuple[int, NaiveDecisionParserText, str]] = []
+		for match in PARAGRAPH_REFERENCE_REGEX.finditer(text):
+			# Paragraphs of another instrument, e.g. "Article 6, paragraph 2" or "paragraph 3 of decision 2/CMA.3"
+			if (
+				EXTERNAL_INSTRUMENT_SUFFIX_REGEX.search(text[match.end():]) is not None
+				or EXTERNAL_INSTRUMENT_PREFIX_REGEX.search(text[:match.start()]) is not None
+			):
+				continue
+			prev_number: int | None = None
+			for numbering in PARAGRAPH_NUMBERING_REGEX.finditer(match.group("references")):
+				number = int(numbering.group("number"))
+				subdivisions = SUBDIVISION_NUMBERING_REGEX.findall(numbering.group("subdivisions"))
+
+				# Ranges of paragraphs, e.g. "paragraphs 12 to 14"
+				numbers: list[int] = [number]
+				if (
+					numbering.group("separator") is not None and prev_number is not None
+					and 0 < number - prev_number <= self.max_range_length
+				):
+					numbers = list(range(prev_number + 1, number + 1))
+
+				for _number in numbers:
+					document_text = self._resolve_paragraph(
+						number=str(_number), subdivisions=subdivisions if _number == number else []
+					)
+					if document_text is not None:
+						references.append((match.start(), document_text, match.group(0)))
+				prev_number = number
+
+		return references
+
+	def _extract_subparagraph_references(
+			self, text: str, paragraph_references: list[tuple[int, NaiveDecisionParserText, str]]
+		) -> list[tuple[int, NaiveDecisionParserText, str]]:
+		"""Extracts the subparagraph references, relative to the last paragraph referenced before them
+
+		:param text: Intervention text
+		:param paragraph_references: Resolved paragraph references
+		:return: (position, referenced text, textual reference) of every resolved reference
+		"""
+		references: list[tuple[int, NaiveDecisionParserText, str]] = []
+		for match in SUBPARAGRAPH_REFERENCE_REGEX.finditer(text):
+			numbering = match.group("enclosed_numbering") or match.group("numbering")
+			preceding_paragraphs = [
+				self._get_paragraph_ancestor(text=document_text)
+				for position, document_text, _ in paragraph_references if position < match.start()
+			]
+			if len(preceding_paragraphs) == 0:
+				continue
+			document_text = self.index.get_child(text=preceding_paragraphs[-1], numbering=f"({numbering.lower()})")
+			if document_text is not None:
+				references.append((match.start(), document_text, match.group(0)))
+
+		return references
+
+	def _extract_section_references(self, text: str) -> list[tuple[int, NaiveDecisionParserText, str]]:
+		"""Extracts the section references, e.g. "section II" or "section II.B"
+
+		:param text: Intervention text
+		:return: (position, referenced text, textual reference) of every resolved reference
+		"""
+		references: list[tuple[int, NaiveDecisionParserText, str]] = []
+		for match in SECTION_REFERENCE_REGEX.finditer(text):
+			document_text = self.index.get_unique(
+				level=NaiveDecisionParserTextLevel.Heading, numbering=f"{match.group('heading')}."
+			)
+			if document_text is not None and match.group("subheading") is not None:
+				document_text = self.index.get_child(text=document_text, numbering=f"{match.group('subheading')}.")
+			if document_text is not None:
+				references.append((match.start(), document_text, match.group(0)))
+
+		return references
+
+	def __call__(self, text: str) -> list[tuple[NaiveDecisionParserText, str]]:
+		"""Extracts and resolves the explicit numbering references of an intervention
+
+		:param text: Intervention text
+		:return: (referenced text, textual reference) pairs, in order of appearance
+		 and without duplicated document texts
+		"""
+		paragraph_references = self._extract_paragraph_references(text=text)
+		references = (
+			paragraph_references
+			+ self._extract_subparagraph_references(text=text, paragraph_references=paragraph_references)
+			+ self._extract_section_references(text=text)
+		)
+		references.sort(key=lambda reference: reference[0])
+
+		seen: set[int] = set()
+		resolved_references: list[tuple[NaiveDecisionParserText, str]] = []
+		for _, document_text, textual_reference in references:
+			if id(document_text) not in seen:
+				seen.add(id(document_text))
+				resolved_references.append((document_text, textual_reference))
+		return resolved_references
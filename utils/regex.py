@@ -7,3 +7,77 @@ INTERVENTION_REGEX: re.Pattern = re.compile(r'(?P<name>.+) {2}(?P<timestamp>\b\d
 BULLET_REGEX_TOPIC: re.Pattern = re.compile(r'\|\s*(?P<bullet_point>.*?)\s*\|\s*(?P<reference>.*?)\s*\|\s*(?P<topic>.*?)\s*\|')
 # If the Item has no topics
 BULLET_REGEX_NO_TOPIC: re.Pattern = re.compile(r'\|\s*(?P<bullet_point>.*?)\s*\|\s*(?P<reference>.*?)\s*\|')
+
+# Explicit references to the numbering of the negotiation document made in an intervention
+# e.g. "paragraph 29", "paragraphs 29 and 30", "paras 12 to 14", "paragraph 29(c)(ii)"
+PARAGRAPH_REFERENCE_REGEX: re.Pattern = re.compile(
+	r'\b(?:paragraphs?|paras?\.?)\s+(?P<references>\d+(?:\s*\(\s*[a-z]{1,4}\s*\))*'
+	r'(?:\s*(?:,|and|&|to|-|–)\s*\d+(?:\s*\(\s*[a-z]{1,4}\s*\))*)*)',
+	re.IGNORECASE
+)
+# Single paragraph numbering (and its subdivisions) inside the references of PARAGRAPH_REFERENCE_REGEX
+PARAGRAPH_NUMBERING_REGEX: re.Pattern = re.compile(
+	r'(?P<separator>to|-|–)?\s*(?P<number>\d+)(?P<subdivisions>(?:\s*\(\s*[a-z]{1,4}\s*\))*)', re.IGNORECASE
+)
+SUBDIVISION_NUMBERING_REGEX: re.Pattern = re.compile(r'\(\s*([a-z]{1,4})\s*\)', re.IGNORECASE)
+# References to the paragraphs of another instrument, which are not resolved against the negotiation document
+# e.g. "paragraph 2 of the Paris Agreement", "paragraph 3 of (the annex to) decision 2/CMA.3" (right after the reference)
+EXTERNAL_INSTRUMENT_SUFFIX_REGEX: re.Pattern = re.compile(
+	r'^\s*,?\s*of\s+(?:the\s+|that\s+)?(?:[Aa]nnex(?:es)?\s+(?:[IVX]+\s+)?(?:to|of)\s+(?:the\s+)?)?(?:'
+	r'(?:[Aa]rticles?|[Aa]rt\.)\s|[Dd]ecisions?\b|\d+/[A-Z]+\b'
+	r'|(?:[A-Z][\w-]*\s+){0,3}(?:[Aa]greement|[Cc]onvention|[Pp]rotocol|[Cc]harter|[Rr]ules|[Mm]odalities)\b'
+	r')'
+)
+# e.g. "Article 6, paragraph 2", "decision 2/CMA.3, paragraph 3" (right before the reference)
+EXTERNAL_INSTRUMENT_PREFIX_REGEX: re.Pattern = re.compile(
+	r'(?:\b(?:[Aa]rticles?|[Aa]rt\.)\s+\d+(?:\.\d+)*|\b[Dd]ecisions?\s+\d+/[A-Z]+(?:\.\d+)?)\s*,?\s*$'
+)
+# e.g. "subparagraph (c)", "sub-paragraph c", relative to the last referenced paragraph
+SUBPARAGRAPH_REFERENCE_REGEX: re.Pattern = re.compile(
+	r'\bsub-?\s?paragraphs?\s+(?:\(\s*(?P<enclosed_numbering>[a-z]{1,4})\s*\)|(?P<numbering>[a-z])\b)',
+	re.IGNORECASE
+)
+# e.g. "section II", "section II.B", "chapter IV B"
+SECTION_REFERENCE_REGEX: re.Pattern = re.compile(
+	r'\b(?:[Ss]ection|[Cc]hapter)\s+(?P<heading>[IVXLCDM]+)\b(?:\s*\.?\s*(?P<subheading>[A-Z])\b)?'
+)
+
+# Word tokens used for lexical relevance scoring
+WORD_REGEX: re.Pattern = re.compile(r'\b[^\W_]{2,}\b')
+
+# Left indentation of a decision document line (tabs or groups of 4 spaces)
+INDENTATION_REGEX: re.Pattern = re.compile(r'^((\t| {4})*)')
+
+# Procedural phrases of a negotiation session (thanks, floor management, audio checks, breaks...)
+PROCEDURAL_PHRASE_REGEX: re.Pattern = re.compile(
+	r"\b(?:"
+	r"thanks?(?: you)?(?: (?:very|so) much)?(?:,? (?:mr\.?|madam|dear|distinguished))?(?:,? (?:co-?)?chairs?)?"
+	r"|(?:can|could|do) (?:you|everyone|everybody|we) (?:all )?hear (?:me|us)"
+	r"|(?:mic|microphone|sound|audio)(?: (?:check|test|is on|is off|is working|works))?"
+	r"|(?:i'?m|i am|i was|you'?re|you are|you were) (?:on )?mute(?:d)?|unmute(?:d)?"
+	r"|good (?:morning|afternoon|evening)(?: (?:everyone|colleagues|all))?"
+	r"|(?:i|we) (?:now )?(?:give|pass) (?:you )?the floor(?: to)?|the floor (?:is|goes) to"
+	r"|next (?:speaker|one)(?: on (?:my|the) list)?"
+	r"|(?:take|have) a (?:short |coffee |lunch )?break|reconvene(?: in \w+ minutes)?"
+	r"|(?:we )?(?:can|could) (?:go|move) (?:on|along)(?: with (?:that|this|it))?"
+	r"|(?:yes|yeah|okay|ok|alright|all right|sure|indeed|of course|sorry|hello|hi)"
+	r")\b",
+	re.IGNORECASE
+)
+
+# Markers of a position on the negotiation text, however short the intervention (options, brackets, deletions,
+# bare numberings, stance verbs and negations), e.g. "We support option 2.", "We prefer deleting 14(b).",
+# "Remove the brackets.", "We cannot accept this.", "We agree with Brazil.", "No objection."
+POSITION_MARKER_REGEX: re.Pattern = re.compile(
+	r"\b(?:options?|alternatives?|(?:un)?bracket(?:s|ed|ing)?|delet(?:e|es|ed|ing|ion)|strik(?:e|es|ing)"
+	r"|retain(?:s|ed|ing)?|insert(?:s|ed|ing|ion)?"
+	r"|support(?:s|ed|ing)?|oppos(?:e|es|ed|ing|ition)|(?:dis)?agree(?:s|d|ing)?|(?:un)?accept(?:s|ed|ing|able)?"
+	r"|object(?:s|ed|ing|ions?)?|reject(?:s|ed|ing|ion)?|prefer(?:s|red|ring|ence)?|favou?r(?:s|ed)?|endorse[sd]?"
+	r"|not|no|cannot|never|neither|nor|\w+n't)\b"
+	r"|\b\d+(?:\s*\(\s*[a-z]{1,4}\s*\))+|\b\d+(?:\.\d+)+\b|[\[\]]",
+	re.IGNORECASE
+)
+
+# Sentence boundary: whitespace after a terminal punctuation and before a capitalized sentence start
+# (so that "para. 29" or "29. (c)" numberings do not split a sentence)
+SENTENCE_BOUNDARY_REGEX: re.Pattern = re.compile(r'(?<=[.!?])\s+(?=["\'“(\[]?[A-Z])')
@@ -4,3 +4,9 @@ class MentionTreeSearchEvaluator(BaseModel):
 	contains_mention: bool = Field(description="True if contains mention or relation False otherwise")
 	textual_reference: str = Field(description="Exact textual reference used for evaluation, it is imperative that it is exactly the same text from the input.")
 	mention_type: str = Field(description="Whether the mention is 'DIRECT' (explicit) or 'INDIRECT' (implicit)")
+
+class MentionTreeSearchFragmentEvaluator(MentionTreeSearchEvaluator):
+	fragment_id: int = Field(description="Id of the evaluated document fragment, as in its <fragment id=\"...\"> tag")
+
+class MentionTreeSearchPackedEvaluator(BaseModel):
+	evaluations: list[MentionTreeSearchFragmentEvaluator] = Field(description="Exactly one evaluation per document fragment")
@@ -0,0 +1,280 @@
+import json
+import os
+from hashlib import sha256
+from typing import Any, Iterator, Literal
+from warnings import warn
+
+from parser import NaiveDecisionParserNodeTable, NaiveDecisionParserTextLevel
+
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:  # Optional, only needed for the Parquet export
+	pyarrow = None
+
+
+# Version of the export layout, to be bumped whenever the files or their rows change
+RESULTS_EXPORT_VERSION: str = "1"
+
+
+def get_document_fingerprint(rows: list[tuple[int, int, str, str]]) -> str:
+	"""Fingerprint of a document node table, to check that results are read against the right document
+
+	:param rows: (level value, parent index (-1 for roots), numbering, text) of each text, in pre-order
+	:return: SHA-256 hex digest
+	"""
+	return sha256(json.dumps(rows, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class MatchingResultsWriter:
+	"""
+	Compact export of the matching results to a folder:
+	 - nodes.jsonl: the document node table, written once (node_id, level, parent, numbering, text)
+	 - interventions.jsonl: one row per intervention, streamed as soon as it is matched,
+	 whose mentions reference the document texts by node id instead of rendering them
+	 - manifest.json: export version, document fingerprint and counts, written on close
+	 - optionally columnar files, written on close: results.npz (NumPy arrays),
+	 or nodes.parquet, interventions.parquet and mentions.parquet (requires pyarrow)
+	The human readable report is generated from the export afterwards (see MatchingResultsReader).
+	"""
+
+	def __init__(
+			self, output_dir: str, node_table: NaiveDecisionParserNodeTable,
+			columnar: Literal["off", "npz", "parquet"] = "off"
+		) -> None:
+		"""
+		:param output_dir: Folder of the export (its files are overwritten)
+		:param node_table: Node table of the matched document
+		:param columnar: Columnar files written on close, besides the JSONL files
+		:raises ImportError: If the Parquet export is requested without pyarrow installed
+		"""
+		if columnar == "parquet" and pyarrow is None:
+			raise ImportError("The Parquet export requires pyarrow (pip install pyarrow)")
+		self.output_dir: str = output_dir
+		self.node_table: NaiveDecisionParserNodeTable = node_table
+		self.columnar: Literal["off", "npz", "parquet"] = columnar
+		os.makedirs(self.output_dir, exist_ok=True)
+
+		rows = node_table.rows()
+		self.document_fingerprint: str = get_document_fingerprint(rows=rows)
+		with open(os.path.join(self.output_dir, "nodes.jsonl"), "w", encoding="utf-8") as f:
+			for node_id, (level, parent, numbering, text) in enumerate(rows):
+				f.write(json.dumps(
+					{"node_id": node_id, "level": level, "parent": parent, "numbering": numbering, "text": text},
+					ensure_ascii=False
+				) + "\n")
+
+		self._interventions_file = open(os.path.join(self.output_dir, "interventions.jsonl"), "w", encoding="utf-8")
+		self.n_interventions: int = 0
+		self.n_mentions: int = 0
+		self._intervention_columns: dict[str, list] = {
+			"oid": [], "hour": [], "participant": [], "cost": [], "n_mentions": []
+		}
+		self._mention_columns: dict[str, list] = {
+			"oid": [], "node_id": [], "mention_type": [], "strategy": [], "textual_reference": []
+		}
+
+	def write(self, intervention: Any) -> None:
+		"""Appends a matched intervention to the export
+
+		:param intervention: Matched Intervention
+		"""
+		mentions = [
+			{
+				"node_id": mention.content.node_id, "mention_type": mention.mention_type,
+				"strategy": mention.strategy, "textual_reference": mention.textual_reference
+			}
+			for mention in intervention.mentions
+		] if intervention.mentions is not None else None
+		self._interventions_file.write(json.dumps({
+			"oid": intervention.oid, "hour": intervention.hour, "participant": intervention.participant,
+			"paragraph": intervention.paragraph, "cost": intervention.cost, "mentions": mentions
+		}, ensure_ascii=False) + "\n")
+		self._interventions_file.flush()
+
+		self.n_interventions += 1
+		self.n_mentions += len(mentions) if mentions is not None else 0
+		if self.columnar == "off":
+			return
+		for column, value in (
+				("oid", intervention.oid), ("hour", intervention.hour), ("participant", intervention.participant),
+				("cost", intervention.cost), ("n_mentions", len(mentions) if mentions is not None else -1)
+			):
+			self._intervention_columns[column].append(value)
+		for mention in mentions or []:
+			self._mention_columns["oid"].append(intervention.oid)
+			for column in ("node_id", "mention_type", "strategy", "textual_reference"):
+				self._mention_columns[column].append(mention[column])
+
+	def _write_npz(self) -> None:
+		# Only imported here, so that reading an export stays fast
+		import numpy as np
+
+		rows = self.node_table.rows()
+		np.savez_compressed(
+			os.path.join(self.output_dir, "results.npz"),
+			nodes_level=np.array([level for level, _, _, _ in rows], dtype=np.uint8),
+			nodes_parent=np.array([parent for _, parent, _, _ in rows], dtype=np.int64),
+			nodes_numbering=np.array([numbering for _, _, numbering, _ in rows], dtype=str),
+			nodes_text=np.array([text for _, _, _, text in rows], dtype=str),
+			interventions_oid=np.array(self._intervention_columns["oid"], dtype=np.int64),
+			interventions_hour=np.array(self._intervention_columns["hour"], dtype=str),
+			interventions_participant=np.array(self._intervention_columns["participant"], dtype=str),
+			interventions_cost=np.array(self._intervention_columns["cost"], dtype=np.float64),
+			interventions_n_mentions=np.array(self._intervention_columns["n_mentions"], dtype=np.int64),
+			mentions_oid=np.array(self._mention_columns["oid"], dtype=np.int64),
+			mentions_node_id=np.array(self._mention_columns["node_id"], dtype=np.int64),
+			mentions_mention_type=np.array(self._mention_columns["mention_type"], dtype=str),
+			mentions_strategy=np.array(self._mention_columns["strategy"], dtype=str),
+			mentions_textual_reference=np.array(self._mention_columns["textual_reference"], dtype=str)
+		)
+
+	def _write_parquet(self) -> None:
+		rows = self.node_table.rows()
+		nodes = pyarrow.table({
+			"node_id": pyarrow.array(range(len(rows)), type=pyarrow.int64()),
+			"level": pyarrow.array([level for level, _, _, _ in rows], type=pyarrow.uint8()),
+			"parent": pyarrow.array([parent for _, parent, _, _ in rows], type=pyarrow.int64()),
+			"numbering": [numbering for _, _, numbering, _ in rows],
+			"text": [text for _, _, _, text in rows]
+		})
+		pyarrow.parquet.write_table(nodes, os.path.join(self.output_dir, "nodes.parquet"))
+		pyarrow.parquet.write_table(
+			pyarrow.table(self._intervention_columns), os.path.join(self.output_dir, "interventions.parquet")
+		)
+		pyarrow.parquet.write_table(
+			pyarrow.table(self._mention_columns), os.path.join(self.output_dir, "mentions.parquet")
+		)
+
+	def close(self) -> None:
+		"""Closes the interventions file and writes the manifest (and the columnar files, if any)
+		"""
+		if self._interventions_file.closed:
+			return
+		self._interventions_file.close()
+		if self.columnar == "npz":
+			self._write_npz()
+		elif self.columnar == "parquet":
+			self._write_parquet()
+		with open(os.path.join(self.output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+			json.dump({
+				"version": RESULTS_EXPORT_VERSION,
+				"document_fingerprint": self.document_fingerprint,
+				"n_nodes": len(self.node_table),
+				"n_interventions": self.n_interventions,
+				"n_mentions": self.n_mentions,
+				"columnar": self.columnar
+			}, f, indent=2)
+
+	def __enter__(self) -> "MatchingResultsWriter":
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+
+class MatchingResultsReader:
+	"""
+	Reader of a MatchingResultsWriter export. Interventions are streamed from the JSONL file,
+	 and the context of a document text (the text and all its ancestors) is only rendered
+	 the first time a mention references it.
+	"""
+
+	def __init__(self, export_dir: str) -> None:
+		"""
+		:param export_dir: Folder of the export
+		:raises ValueError: If the export version is not RESULTS_EXPORT_VERSION,
+		 or its node table does not match the document fingerprint of its manifest
+		"""
+		self.export_dir: str = export_dir
+		self.manifest: dict | None = None
+		manifest_path = os.path.join(self.export_dir, "manifest.json")
+		if os.path.isfile(manifest_path):
+			with open(manifest_path, "r", encoding="utf-8") as f:
+				self.manifest = json.load(f)
+			if self.manifest.get("version") != RESULTS_EXPORT_VERSION:
+				raise ValueError(
+					f"Results export {self.export_dir} has version {self.manifest.get('version')}, "
+					f"expected {RESULTS_EXPORT_VERSION}"
+				)
+		else:
+			# The manifest is written on close, e.g. not by a killed run
+			warn(f"Results export {self.export_dir} has no manifest, its version and document cannot be checked")
+
+		self.rows: list[tuple[int, int, str, str]] = []
+		with open(os.path.join(self.export_dir, "nodes.jsonl"), "r", encoding="utf-8") as f:
+			for line in f:
+				node = json.loads(line)
+				self.rows.append((node["level"], node["parent"], node["numbering"], node["text"]))
+		if (
+			self.manifest is not None
+			and get_document_fingerprint(rows=self.rows) != self.manifest.get("document_fingerprint")
+		):
+			raise ValueError(f"Node table of results export {self.export_dir} does not match its document fingerprint")
+		self._level_names: dict[int, str] = {level.value: level.name for level in NaiveDecisionParserTextLevel}
+		self._contexts: dict[int, str] = {}
+
+	def load_node_table(self) -> NaiveDecisionParserNodeTable:
+		"""Rebuilds the node table (and the structured document) of the export
+
+		:return: Node table
+		"""
+		return NaiveDecisionParserNodeTable(rows=self.rows)
+
+	def get_context(self, node_id: int) -> str:
+		"""Rendered context of a document text, as NaiveDecisionParserText.__str__
+
+		:param node_id: Node id of the text
+		:return: The text and all its ancestors
+		"""
+		context = self._contexts.get(node_id)
+		if context is None:
+			level, parent, numbering, text = self.rows[node_id]
+			context = self._contexts[node_id] = (
+				f"{self.get_context(node_id=parent) if parent != -1 else ''}\n#{self._level_names[level]} {numbering}#: {text}"
+			)
+		return context
+
+	def iter_interventions(self) -> Iterator[dict]:
+		"""Iterates over the exported interventions
+
+		:return: Iterator over the intervention rows, in the order they were written
+		"""
+		with open(os.path.join(self.export_dir, "interventions.jsonl"), "r", encoding="utf-8") as f:
+			for line in f:
+				if line.strip() != "":
+					yield json.loads(line)
+
+	def iter_mentions(self) -> Iterator[dict]:
+		"""Iterates over the exported mentions as flat rows
+
+		:return: Iterator over the mention rows (with the oid of their intervention)
+		"""
+		for intervention in self.iter_interventions():
+			for mention in intervention["mentions"] or []:
+				yield {"oid": intervention["oid"], **mention}
+
+	def iter_text_report(self) -> Iterator[str]:
+		"""Iterates over the blocks of the human readable report, one per intervention
+		 (the layout of Intervention.__str__)
+
+		:return: Iterator over the report blocks
+		"""
+		for intervention in self.iter_interventions():
+			s: str = f"{intervention['participant']} - [{intervention['hour']}]\n"
+			s += f"{intervention['paragraph']}\n"
+			if intervention["mentions"] is not None:
+				s += f"{len(intervention['mentions'])} mentions:\n"
+				for mention in intervention["mentions"]:
+					s += f"Document fragment:\n\t{self.get_context(node_id=mention['node_id'])}\n"
+					s += f"~[{mention['mention_type']}]~>\t{mention['textual_reference']}\n"
+			yield s
+
+	def write_text_report(self, path: str) -> None:
+		"""Writes the human readable report
+
+		:param path: Output .txt path
+		"""
+		with open(path, "w", encoding="utf-8") as f:
+			for block in self.iter_text_report():
+				f.write(f"{block}\n{'-'*42}\n")
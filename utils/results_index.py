@@ -0,0 +1,262 @@
+import os
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+from pydantic import BaseModel
+
+from parser import NaiveDecisionParserTextLevel
+from utils.regex import PARAGRAPH_NUMBERING_REGEX, SUBDIVISION_NUMBERING_REGEX, SECTION_REFERENCE_REGEX
+from utils.results_export import MatchingResultsReader
+
+
+class IndexedMention(BaseModel):
+	session: str
+	oid: int
+	participant: str
+	hour: str
+	mention_type: str
+	strategy: str
+	numbering_path: tuple[str, ...]
+	textual_reference: str
+
+
+def parse_hour(hour: str) -> int:
+	"""Converts a transcript timestamp into a number comparable across the session
+	 (e.g. "1:02:03" -> 3723, "02:03" -> 123)
+
+	:param hour: Timestamp with colon separated fields
+	:return: Timestamp value in its smallest unit
+	"""
+	value = 0
+	for field in hour.strip().split(":"):
+		value = 60 * value + int(field)
+	return value
+
+
+def get_paragraph_path(levels: list[int], numbering_path: tuple[str, ...]) -> tuple[str, ...] | None:
+	"""Numbering path of a text from its paragraph on (paragraphs are numbered continuously,
+	 so they are referenced without their headings, e.g. ("29.", "(c)"))
+
+	:param levels: Level value of every text of the numbering path
+	:param numbering_path: Numbering path from the root text
+	:return: Numbering path from the paragraph, None if the text is not a paragraph nor a paragraph subdivision
+	"""
+	for i, level in enumerate(levels):
+		if level == NaiveDecisionParserTextLevel.Paragraph.value:
+			return numbering_path[i:]
+	return None
+
+
+class MatchingResultsIndex:
+	"""
+	Reverse index of the matching results of one or several sessions, answering which participants
+	 mentioned a document text (or any text of its subtree), when, and how (DIRECT or INDIRECT).
+	Mentions are posted under every prefix of their numbering path (so that a heading rolls up all its
+	 paragraphs) and under every prefix of their path from the paragraph on ("paragraph 29(c)").
+	The mentions are stored as NumPy columns, so filtering a posting list never touches Python objects.
+	"""
+
+	def __init__(self) -> None:
+		self.sessions: list[str] = []
+		self.participants: list[str] = []
+		self.mention_types: list[str] = []
+		self._participant_codes: dict[str, int] = {}
+		self._mention_type_codes: dict[str, int] = {}
+		# Posting lists keyed by ("path", numbering path from the root) or ("paragraph", numbering path from the paragraph)
+		self._postings: dict[tuple[str, tuple[str, ...]], list[int]] = {}
+		self._arrays: dict[tuple[str, tuple[str, ...]], np.ndarray] | None = None
+
+		self._session: list[int] = []
+		self._participant: list[int] = []
+		self._time: list[int] = []
+		self._mention_type: list[int] = []
+		self._rows: list[IndexedMention] = []
+
+	@classmethod
+	def from_exports(cls, export_dirs: Iterable[str]) -> "MatchingResultsIndex":
+		"""Builds the index of saved results (see MatchingResultsWriter), without any LLM call
+
+		:param export_dirs: Folders of the exports, one per session (the folder path is the session name)
+		:return: Index
+		"""
+		index = cls()
+		for export_dir in export_dirs:
+			index.add_export(export_dir=export_dir)
+		return index
+
+	def add_export(self, export_dir: str, session: str | None = None) -> None:
+		"""Indexes the saved results of a session
+
+		:param export_dir: Folder of the export
+		:param session: Session name, if None the folder path relative to the working directory (folder names
+		 repeat across sessions, e.g. SB58/transcript and SB60/transcript)
+		"""
+		reader = MatchingResultsReader(export_dir=export_dir)
+		self.add_session(
+			session=session if session is not None else os.path.relpath(export_dir),
+			node_rows=reader.rows, interventions=reader.iter_interventions()
+		)
+
+	def add_session(
+			self, session: str, node_rows: list[tuple[int, int, str, str]], interventions: Iterable[dict]
+		) -> None:
+		"""Indexes the results of a session
+
+		:param session: Session name
+		:param node_rows: (level value, parent index (-1 for roots), numbering, text) of each document text
+		:param interventions: Intervention rows, as in the interventions.jsonl file of an export
+		:raises ValueError: If the session is already indexed
+		"""
+		if session in self.sessions:
+			raise ValueError(f"Session {session} is already indexed")
+
+		# Numbering and level paths of every node (parents come before their children)
+		numbering_paths: list[tuple[str, ...]] = []
+		level_paths: list[list[int]] = []
+		for level, parent, numbering, _ in node_rows:
+			numbering_paths.append((numbering_paths[parent] if parent != -1 else ()) + (numbering,))
+			level_paths.append((level_paths[parent] if parent != -1 else []) + [level])
+
+		session_code = len(self.sessions)
+		self.sessions.append(session)
+		for intervention in interventions:
+			for mention in intervention["mentions"] or []:
+				numbering_path = numbering_paths[mention["node_id"]]
+				row = len(self._rows)
+				self._rows.append(IndexedMention(
+					session=session, oid=intervention["oid"], participant=intervention["participant"],
+					hour=intervention["hour"], mention_type=mention["mention_type"], strategy=mention["strategy"],
+					numbering_path=numbering_path, textual_reference=mention["textual_reference"]
+				))
+				self._session.append(session_code)
+				self._participant.append(self._get_code(
+					value=intervention["participant"], codes=self._participant_codes, values=self.participants
+				))
+				self._time.append(parse_hour(hour=intervention["hour"]))
+				self._mention_type.append(self._get_code(
+					value=mention["mention_type"], codes=self._mention_type_codes, values=self.mention_types
+				))
+
+				for depth in range(1, len(numbering_path) + 1):
+					self._postings.setdefault(("path", numbering_path[:depth]), []).append(row)
+				paragraph_path = get_paragraph_path(levels=level_paths[mention["node_id"]], numbering_path=numbering_path)
+				if paragraph_path is not None:
+					for depth in range(1, len(paragraph_path) + 1):
+						self._postings.setdefault(("paragraph", paragraph_path[:depth]), []).append(row)
+		self._arrays = None
+
+	@staticmethod
+	def _get_code(value: str, codes: dict[str, int], values: list[str]) -> int:
+		code = codes.get(value)
+		if code is None:
+			code = codes[value] = len(values)
+			values.append(value)
+		return code
+
+	def _build_arrays(self) -> None:
+		"""Converts the mention columns and posting lists into NumPy arrays (once after each indexed session)
+		"""
+		self._session_array: np.ndarray = np.array(self._session, dtype=np.int32)
+		self._participant_array: np.ndarray = np.array(self._participant, dtype=np.int32)
+		self._time_array: np.ndarray = np.array(self._time, dtype=np.int64)
+		self._mention_type_array: np.ndarray = np.array(self._mention_type, dtype=np.int32)
+		self._arrays = {key: np.array(rows, dtype=np.int64) for key, rows in self._postings.items()}
+
+	@staticmethod
+	def parse_target(target: str | tuple[str, ...]) -> tuple[str, tuple[str, ...]]:
+		"""Parses a queried document text
+
+		:param target: Numbering path from the root as in the document, e.g. ("II.", "B.", "29."),
+		 or a reference such as "paragraph 29(c)", "section II.B", or "II. B. 29." (whitespace separated path)
+		:return: Posting list key
+		"""
+		if isinstance(target, tuple):
+			return "path", target
+
+		if target.strip().lower().startswith(("paragraph", "para")):
+			match = PARAGRAPH_NUMBERING_REGEX.search(target)
+			if match is not None:
+				subdivisions = SUBDIVISION_NUMBERING_REGEX.findall(match.group("subdivisions"))
+				return "paragraph", (f"{int(match.group('number'))}.", *(f"({s.lower()})" for s in subdivisions))
+		match = SECTION_REFERENCE_REGEX.match(target.strip())
+		if match is not None:
+			heading = (f"{match.group('heading')}.",)
+			return "path", heading + ((f"{match.group('subheading')}.",) if match.group("subheading") is not None else ())
+		return "path", tuple(target.split())
+
+	def _select(
+			self, target: str | tuple[str, ...], participants: Iterable[str] | None = None,
+			start: str | None = None, end: str | None = None, sessions: Iterable[str] | None = None,
+			mention_types: Iterable[str] | None = None
+		) -> np.ndarray:
+		"""Rows of the mentions of a document text and its subtree matching the filters
+
+		:return: Mention rows, in indexing order (session then transcript order)
+		"""
+		if self._arrays is None:
+			self._build_arrays()
+		rows = self._arrays.get(self.parse_target(target=target))
+		if rows is None or len(rows) == 0:
+			return np.zeros(0, dtype=np.int64)
+
+		mask = np.ones(len(rows), dtype=bool)
+		if participants is not None:
+			codes = [self._participant_codes[p] for p in participants if p in self._participant_codes]
+			mask &= np.isin(self._participant_array[rows], codes)
+		if sessions is not None:
+			selected = set(sessions)
+			codes = [i for i, session in enumerate(self.sessions) if session in selected]
+			mask &= np.isin(self._session_array[rows], codes)
+		if mention_types is not None:
+			codes = [self._mention_type_codes[t] for t in mention_types if t in self._mention_type_codes]
+			mask &= np.isin(self._mention_type_array[rows], codes)
+		if start is not None:
+			mask &= self._time_array[rows] >= parse_hour(hour=start)
+		if end is not None:
+			mask &= self._time_array[rows] <= parse_hour(hour=end)
+		return rows[mask]
+
+	def query(
+			self, target: str | tuple[str, ...], participants: Iterable[str] | None = None,
+			start: str | None = None, end: str | None = None, sessions: Iterable[str] | None = None,
+			mention_types: Iterable[str] | None = None
+		) -> list[IndexedMention]:
+		"""Mentions of a document text or any text of its subtree
+
+		:param target: Queried text (see parse_target)
+		:param participants: Only mentions by these participants (None for all)
+		:param start: Only mentions from this timestamp on, inclusive (None for no lower bound)
+		:param end: Only mentions up to this timestamp, inclusive (None for no upper bound)
+		:param sessions: Only mentions of these sessions (None for all)
+		:param mention_types: Only mentions of these types, e.g. ["DIRECT"] (None for all)
+		:return: Mentions, in session and transcript order
+		"""
+		rows = self._select(
+			target=target, participants=participants, start=start, end=end, sessions=sessions,
+			mention_types=mention_types
+		)
+		return [self._rows[row] for row in rows]
+
+	def summary(
+			self, target: str | tuple[str, ...], participants: Iterable[str] | None = None,
+			start: str | None = None, end: str | None = None, sessions: Iterable[str] | None = None
+		) -> dict[str, dict[str, int]]:
+		"""Number of mentions of a document text (or any text of its subtree) by participant and mention type
+
+		:param target: Queried text (see parse_target)
+		:param participants: Only mentions by these participants (None for all)
+		:param start: Only mentions from this timestamp on, inclusive (None for no lower bound)
+		:param end: Only mentions up to this timestamp, inclusive (None for no upper bound)
+		:param sessions: Only mentions of these sessions (None for all)
+		:return: Mention counts of each participant, by mention type
+		"""
+		rows = self._select(target=target, participants=participants, start=start, end=end, sessions=sessions)
+		counts = Counter(zip(self._participant_array[rows].tolist(), self._mention_type_array[rows].tolist()))
+		summary: dict[str, dict[str, int]] = {}
+		for (participant, mention_type), count in counts.items():
+			summary.setdefault(self.participants[participant], {})[self.mention_types[mention_type]] = count
+		return summary
+
+	def __len__(self) -> int:
+		return len(self._rows)
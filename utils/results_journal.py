@@ -0,0 +1,68 @@
+import json
+import os
+from warnings import warn
+
+try:
+	import fcntl
+except ImportError:  # Not available on Windows, appends are still atomic for a single process
+	fcntl = None
+
+
+class MatchingJournal:
+	"""
+	Append-only JSONL journal of the matched interventions of a run,
+	 one record per intervention written as soon as it is matched,
+	 so that an interrupted run can be resumed without repeating (and paying) its LLM calls.
+	Several processes can append to the same journal (each record is a single locked append).
+	"""
+
+	def __init__(self, path: str) -> None:
+		"""
+		:param path: Path of the .jsonl journal file
+		"""
+		self.path: str = path
+		if os.path.dirname(self.path) != "":
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+	def load(self) -> dict[int, dict]:
+		"""Loads the journaled records
+
+		:return: Record of each journaled intervention oid (the last one if journaled several times)
+		"""
+		records: dict[int, dict] = {}
+		if not os.path.isfile(self.path):
+			return records
+
+		with open(self.path, "r", encoding="utf-8") as f:
+			for n_line, line in enumerate(f, start=1):
+				if line.strip() == "":
+					continue
+				try:
+					record = json.loads(line)
+				except json.JSONDecodeError:
+					# e.g. the last line of a run killed while writing it
+					warn(f"Skipping malformed journal line {n_line} of {self.path}")
+					continue
+				records[record["oid"]] = record
+		return records
+
+	def append(self, record: dict) -> None:
+		"""Appends a record to the journal and flushes it to disk
+
+		:param record: JSON serializable record (with an "oid" key)
+		"""
+		line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+		fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+		try:
+			if fcntl is not None:
+				fcntl.flock(fd, fcntl.LOCK_EX)
+			# A run killed while writing leaves a partial last line, which must not swallow this record
+			size = os.fstat(fd).st_size
+			if size != 0 and os.pread(fd, 1, size - 1) != b"\n":
+				line = b"\n" + line
+			os.write(fd, line)
+			os.fsync(fd)
+		finally:
+			if fcntl is not None:
+				fcntl.flock(fd, fcntl.LOCK_UN)
+			os.close(fd)
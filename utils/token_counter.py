@@ -0,0 +1,31 @@
+from functools import lru_cache
+from typing import Callable
+from warnings import warn
+
+import tiktoken
+
+
+def estimate_tokens(text: str) -> int:
+	"""Approximate number of tokens of a text (~4 characters per token),
+	 deterministic and available offline
+
+	:param text: Input text
+	:return: Estimated number of tokens
+	"""
+	return max(1, len(text) // 4)
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str) -> Callable[[str], int]:
+	"""Obtains a function counting the tokens of a text with the tiktoken encoding of a model,
+	 falling back to estimate_tokens if the encoding is not available (unknown model, or offline without it cached)
+
+	:param model_name: OpenAI model name
+	:return: Token counting function
+	"""
+	try:
+		encoding = tiktoken.encoding_for_model(model_name)
+	except Exception as e:
+		warn(f"tiktoken encoding of {model_name} not available ({type(e).__name__}), tokens will be approximated")
+		return estimate_tokens
+	return lambda text: len(encoding.encode(text, disallowed_special=()))
@@ -1,8 +1,12 @@
+import io
 import os
+import time
 from itertools import islice
+from typing import Iterable, Iterator, TextIO
 from utils.exceptions import (IncorrectFileExtensionError, FileNotFoundInError)
 from warnings import warn
 from utils.regex import INTERVENTION_REGEX
+from utils.metrics import METRICS
 import re
 
 
@@ -13,9 +17,12 @@ class TranscriptParser:
 	:param input_folder: Name of the full path to input folder containing .txt files
 	"""
 
+	watermark: str = "Transcribed by https://otter.ai\n"
+
 	def __init__(
 			self, input_file: str | None, folder_name: str | None,
-			input_folder: str = os.path.join(".", "data", "input"), raw_file: str = None):
+			input_folder: str = os.path.join(".", "data", "input"), raw_file: str = None,
+			streaming: bool = False):
 		"""
 		:Attributes:
 		Initialization
@@ -25,7 +32,9 @@ class TranscriptParser:
 			- meeting_id: The meeting associated to the transcript
 			- file_path: Full path to the .txt file
 			- transcript: Transcript object from the db
+			- streaming: Whether the file is read incrementally by iter_paragraphs instead of at initialization
 		"""
+		self.streaming: bool = streaming
 		if raw_file is None:
 			if not input_file.endswith(".txt"):
 				raise IncorrectFileExtensionError(f"The file {input_file} is not a .txt extension")
@@ -37,7 +46,8 @@ class TranscriptParser:
 			if not os.path.isfile(self.file_path):
 				raise FileNotFoundInError(f"The file {input_file} not found in {self.file_path}")
 
-			self._read_txt()
+			if not self.streaming:
+				self._read_txt()
 		else:
 			self.raw_transcript: str = raw_file
 
@@ -48,7 +58,7 @@ class TranscriptParser:
 		"""
 		with open(self.file_path, "r", encoding="utf-8") as f:
 			self.raw_transcript: list[str] = f.readlines()
-		if self.raw_transcript[-1] == "Transcribed by https://otter.ai\n":
+		if self.raw_transcript[-1] == self.watermark:
 			self.raw_transcript: str = "".join(self.raw_transcript[:-1])
 		else:
 			warn(f"Watermark from otter not found, instead found: {self.raw_transcript[-1]}")
@@ -72,11 +82,13 @@ class TranscriptParser:
 		and stores them in a list of Paragraph objects
 		"""
 		# Split the text in interventions
-		interventions: list[str] = re.split(INTERVENTION_REGEX, self.raw_transcript)[1:]
-		interventions_list: list = self._group_interventions(interventions)
-		self.paragraphs = []
-		for oid, intervention in enumerate(interventions_list):
-			self._add_paragraph(oid, intervention)
+		with METRICS.stage("transcript_split"):
+			interventions: list[str] = re.split(INTERVENTION_REGEX, self.raw_transcript)[1:]
+			interventions_list: list = self._group_interventions(interventions)
+			self.paragraphs = []
+			for oid, intervention in enumerate(interventions_list):
+				self._add_paragraph(oid, intervention)
+		METRICS.increment("transcript_interventions_total", len(self.paragraphs))
 
 	def _add_paragraph(self, oid: int, intervention: list[str]) -> None:
 		"""
@@ -90,3 +102,100 @@ class TranscriptParser:
 	def __call__(self):
 		self._parse_transcript()
 		return self.paragraphs
+
+	def iter_paragraphs(
+			self, follow: bool = False, poll_interval: float = 1.0, idle_timeout: float | None = None
+		) -> Iterator[dict]:
+		"""
+		Streaming counterpart of __call__, reads the transcript incrementally
+		and yields each paragraph as soon as the next speaker/timestamp header confirms it is complete
+		:param follow: Keep reading a file that is still being appended to (e.g. by a transcription tool)
+		:param poll_interval: Seconds between reads when following a file that has no new lines
+		:param idle_timeout: Seconds without new lines after which a followed file is considered finished
+		 (None waits forever)
+		"""
+		if self.streaming and getattr(self, "raw_transcript", None) is None:
+			with open(self.file_path, "r", encoding="utf-8") as f:
+				yield from self.iter_stream_paragraphs(
+					stream=self._read_lines(f, follow=follow, poll_interval=poll_interval, idle_timeout=idle_timeout)
+				)
+		else:
+			# Already read (and without watermark)
+			yield from self.iter_stream_paragraphs(stream=io.StringIO(self.raw_transcript), drop_watermark=False)
+
+	@staticmethod
+	def _read_lines(
+			stream: TextIO, follow: bool = False, poll_interval: float = 1.0, idle_timeout: float | None = None
+		) -> Iterator[str]:
+		"""
+		Reads the complete lines of a text stream, optionally waiting for new lines at the end of the stream
+		:param stream: Text stream
+		:param follow: Keep waiting for new lines at the end of the stream
+		:param poll_interval: Seconds between reads when there are no new lines
+		:param idle_timeout: Seconds without new lines after which the stream is considered finished
+		"""
+		partial_line: str = ""
+		idle_since: float = time.monotonic()
+		while True:
+			line = stream.readline()
+			if line == "":
+				if not follow or (idle_timeout is not None and time.monotonic() - idle_since > idle_timeout):
+					break
+				time.sleep(poll_interval)
+				continue
+			idle_since = time.monotonic()
+
+			# A line still being written is only read once it is complete
+			partial_line += line
+			if partial_line.endswith("\n"):
+				yield partial_line
+				partial_line = ""
+
+		if partial_line != "":
+			yield partial_line
+
+	@classmethod
+	def _drop_watermark(cls, stream: Iterable[str]) -> Iterator[str]:
+		"""
+		Yields the lines of a stream holding the last one back until the stream ends,
+		so that it can be removed if it is the watermark "Transcribed by https://otter.ai"
+		:param stream: Lines of the transcript
+		"""
+		last_line: str | None = None
+		for line in stream:
+			if last_line is not None:
+				yield last_line
+			last_line = line
+
+		if last_line is not None:
+			if last_line == cls.watermark:
+				return
+			warn(f"Watermark from otter not found, instead found: {last_line}")
+			yield last_line
+
+	@classmethod
+	def iter_stream_paragraphs(cls, stream: Iterable[str], drop_watermark: bool = True) -> Iterator[dict]:
+		"""
+		Parses the paragraphs of a transcript from any stream of lines,
+		equivalent to splitting the whole transcript with INTERVENTION_REGEX (as it never spans lines)
+		:param stream: Lines of the transcript
+		:param drop_watermark: Whether to remove the otter.ai watermark last line
+		"""
+		oid: int = 0
+		# Name, Hour and Intervention text chunks of the intervention being read
+		current: list | None = None
+		for line in (cls._drop_watermark(stream=stream) if drop_watermark else stream):
+			chunks: list[str] = re.split(INTERVENTION_REGEX, line)
+			if current is not None:
+				current[2].append(chunks[0])
+			for name, hour, paragraph in cls._group_interventions(chunks[1:]):
+				# A new header confirms that the previous intervention is complete
+				if current is not None:
+					METRICS.increment("transcript_interventions_total")
+					yield {"oid": oid, "participant": current[0], "hour": current[1], "paragraph": "".join(current[2])}
+					oid += 1
+				current = [name, hour, [paragraph]]
+
+		if current is not None:
+			METRICS.increment("transcript_interventions_total")
+			yield {"oid": oid, "participant": current[0], "hour": current[1], "paragraph": "".join(current[2])}
@@ -0,0 +1,164 @@
+import os
+import tempfile
+from hashlib import blake2b
+from typing import Callable
+
+import numpy as np
+
+from parser import NaiveDecisionParserNodeTable
+from utils.lexical_index import tokenize
+from utils.results_export import get_document_fingerprint
+
+
+# Any local function embedding a batch of texts into the rows of a (texts x dimensions) float matrix,
+# named by a "name" attribute that identifies its embeddings in the vector store (e.g. model and version)
+EmbeddingFunction = Callable[[list[str]], np.ndarray]
+
+
+class HashingEmbedder:
+	"""
+	Deterministic local embedding function: signed feature hashing of the word unigrams and bigrams
+	 of a text (without stopwords), L2 normalized, so that the dot product of two embeddings is their
+	 cosine similarity. It needs no model nor network, which makes it suitable for tests and benchmarks.
+	"""
+
+	def __init__(self, dimensions: int = 512, bigrams: bool = True) -> None:
+		"""
+		:param dimensions: Embedding dimensions (hashed features)
+		:param bigrams: Whether word bigrams are hashed besides the unigrams
+		"""
+		self.dimensions: int = dimensions
+		self.bigrams: bool = bigrams
+		self.name: str = f"hashing-{dimensions}{'-bigrams' if bigrams else ''}-v1"
+
+	def _hash(self, term: str) -> tuple[int, float]:
+		"""Feature index and sign of a term
+
+		:param term: Word unigram or bigram
+		:return: Feature index and sign
+		"""
+		digest = int.from_bytes(blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+		return digest % self.dimensions, 1.0 if digest >> 63 else -1.0
+
+	def __call__(self, texts: list[str]) -> np.ndarray:
+		"""Embeds some texts
+
+		:param texts: Texts
+		:return: L2 normalized embeddings (texts x dimensions)
+		"""
+		embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+		for i, text in enumerate(texts):
+			words = tokenize(text)
+			terms = words + ([f"{first} {second}" for first, second in zip(words, words[1:])] if self.bigrams else [])
+			for term in terms:
+				index, sign = self._hash(term=term)
+				embeddings[i, index] += sign
+		norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+		return embeddings / np.where(norms == 0, 1.0, norms)
+
+
+class DocumentVectorStore:
+	"""
+	Embeddings of every text of a document (one row per node id, in pre-order), computed once per document
+	 version and embedding function, and stored as a .npy file next to the parsed documents cache.
+	The matrix is memory-mapped read-only: worker processes opening (or unpickling) the same store
+	 share its pages through the OS page cache instead of copying it.
+	"""
+
+	def __init__(self, path: str, embed: EmbeddingFunction) -> None:
+		"""
+		:param path: Path of the .npy embeddings matrix
+		:param embed: Embedding function of the matrix, also used to embed the queries
+		"""
+		self.path: str = path
+		self.embed: EmbeddingFunction = embed
+		self.matrix: np.ndarray = np.load(path, mmap_mode="r")
+
+	@staticmethod
+	def get_path(node_table: NaiveDecisionParserNodeTable, embed: EmbeddingFunction, cache_dir: str) -> str:
+		"""Path of the embeddings of a document version
+
+		:param node_table: Node table of the document
+		:param embed: Embedding function
+		:param cache_dir: Folder of the vector stores
+		:return: .npy path, keyed on the document fingerprint and the embedding function name
+		"""
+		fingerprint = get_document_fingerprint(rows=node_table.rows())
+		return os.path.join(cache_dir, f"{fingerprint}.{getattr(embed, 'name', type(embed).__name__)}.npy")
+
+	@classmethod
+	def load_or_build(
+			cls, node_table: NaiveDecisionParserNodeTable, embed: EmbeddingFunction,
+			cache_dir: str = os.path.join(".", "data", "cache", "documents"), batch_size: int = 1024
+		) -> "DocumentVectorStore":
+		"""Opens the embeddings of a document, computing (and storing) them on a miss
+
+		:param node_table: Node table of the document
+		:param embed: Embedding function
+		:param cache_dir: Folder of the vector stores (by default the parsed documents cache)
+		:param batch_size: Texts embedded per call of the embedding function
+		:return: Vector store
+		"""
+		path = cls.get_path(node_table=node_table, embed=embed, cache_dir=cache_dir)
+		if not os.path.isfile(path):
+			os.makedirs(cache_dir, exist_ok=True)
+			texts = [f"{numbering} {text}" for numbering, text in zip(node_table.numberings, node_table.texts)]
+			matrix = np.concatenate([
+				np.asarray(embed(texts[start:start + batch_size]), dtype=np.float32)
+				for start in range(0, len(texts), batch_size)
+			]) if len(texts) != 0 else np.zeros((0, 0), dtype=np.float32)
+			# Written atomically, so concurrent runs never map partial files
+			fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp.npy")
+			with os.fdopen(fd, "wb") as f:
+				np.save(f, matrix)
+			os.replace(tmp_path, path)
+		return cls(path=path, embed=embed)
+
+	def search(self, queries: list[str], top_k: int, chunk_size: int = 1024) -> list[list[int]]:
+		"""Most similar document texts of each query, scoring all the queries with one matrix multiply per chunk
+
+		:param queries: Query texts (e.g. all the interventions of a session)
+		:param top_k: Number of document texts kept per query
+		:param chunk_size: Queries scored per matrix multiply (bounds the memory of the scores)
+		:return: Node ids of the top_k most similar texts of each query, by decreasing similarity
+		"""
+		return [
+			[node_id for node_id, _ in hits] for hits in self.search_with_scores(
+				queries=queries, top_k=top_k, chunk_size=chunk_size
+			)
+		]
+
+	def search_with_scores(self, queries: list[str], top_k: int, chunk_size: int = 1024) -> list[list[tuple[int, float]]]:
+		"""Same as search, with the cosine similarity of each text
+
+		:param queries: Query texts (e.g. all the interventions of a session)
+		:param top_k: Number of document texts kept per query
+		:param chunk_size: Queries scored per matrix multiply (bounds the memory of the scores)
+		:return: Node ids and similarities of the top_k most similar texts of each query, by decreasing similarity
+		"""
+		results: list[list[tuple[int, float]]] = []
+		top_k = min(top_k, len(self.matrix))
+		if top_k == 0:
+			return [[] for _ in queries]
+		for start in range(0, len(queries), chunk_size):
+			embeddings = np.asarray(self.embed(queries[start:start + chunk_size]), dtype=np.float32)
+			scores = embeddings @ self.matrix.T
+			top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+			top_scores = np.take_along_axis(scores, top, axis=1)
+			order = np.argsort(-top_scores, axis=1, kind="stable")
+			results += [
+				list(zip(node_ids, similarities)) for node_ids, similarities in zip(
+					np.take_along_axis(top, order, axis=1).tolist(), np.take_along_axis(top_scores, order, axis=1).tolist()
+				)
+			]
+		return results
+
+	def __len__(self) -> int:
+		return len(self.matrix)
+
+	def __getstate__(self) -> dict:
+		# Pickled by path (e.g. for worker processes), the matrix is mapped again instead of copied
+		return {"path": self.path, "embed": self.embed}
+
+	def __setstate__(self, state: dict) -> None:
+		self.__init__(path=state["path"], embed=state["embed"])